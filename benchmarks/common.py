@@ -0,0 +1,101 @@
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+import millipede
+
+
+def _rss_high_water_mark_mb():
+    # ru_maxrss is reported in kilobytes on linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024.0 ** 2) if sys.platform == "darwin" else maxrss / 1024.0
+
+
+def _run_case(fn, kwargs):
+    baseline_mb = _rss_high_water_mark_mb()
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    metrics = fn(**kwargs)
+    # the high water mark after importing torch is subtracted so that peak memory reflects the benchmark itself
+    metrics['peak_memory_mb'] = max(0.0, _rss_high_water_mark_mb() - baseline_mb)
+    if torch.cuda.is_available():
+        metrics['peak_cuda_memory_mb'] = torch.cuda.max_memory_allocated() / (1024.0 ** 2)
+    return metrics
+
+
+def run_case(fn, kwargs, isolate=True):
+    """
+    Run the benchmark `fn(**kwargs)`, which returns a dictionary of metrics, and add its peak memory usage.
+    If `isolate` is True the benchmark runs in a fresh process so that peak memory usage is not
+    contaminated by previous benchmarks.
+    """
+    if not isolate:
+        return _run_case(fn, kwargs)
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_run_case, (fn, kwargs))
+
+
+def time_per_call(fn, min_time=0.2, min_calls=3):
+    """
+    Return the mean wall-clock time in seconds of calls to `fn` after one warm-up call.
+    """
+    fn()
+    num_calls, start = 0, time.perf_counter()
+    while num_calls < min_calls or time.perf_counter() - start < min_time:
+        fn()
+        num_calls += 1
+    return (time.perf_counter() - start) / num_calls
+
+
+def make_linear_data(N, P, num_causal, dtype=torch.float64, seed=0):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P, dtype=dtype)
+    Y = X[:, :num_causal].sum(-1) + torch.randn(N, dtype=dtype)
+    return X, Y
+
+
+def make_count_data(N, P, num_causal, likelihood, dtype=torch.float64, seed=0):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P, dtype=dtype)
+    logits = 0.5 * X[:, :num_causal].sum(-1) / np.sqrt(num_causal)
+    if likelihood == "binomial":
+        TC = 10 * torch.ones(N, dtype=torch.int64)
+        Y = torch.distributions.Binomial(total_count=TC, logits=logits).sample()
+        return X, Y.to(dtype), TC, None
+    psi0 = torch.zeros(N, dtype=dtype)
+    Y = torch.distributions.Poisson(logits.exp()).sample()
+    return X, Y.to(dtype), None, psi0
+
+
+def case_name(suite, params):
+    return suite + "[" + ",".join("{}={}".format(k, v) for k, v in params.items()) + "]"
+
+
+def get_metadata():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'millipede_version': millipede.__version__,
+            'git_commit': commit,
+            'torch_version': torch.__version__,
+            'numpy_version': np.__version__,
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'torch_num_threads': torch.get_num_threads(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+def write_results(results, path):
+    with open(path, "w") as f:
+        json.dump({'metadata': get_metadata(), 'results': results}, f, indent=2)
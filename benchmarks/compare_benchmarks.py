@@ -0,0 +1,62 @@
+"""
+Compare two JSON files written by `run_benchmarks.py` and report regressions, e.g.::
+
+    python benchmarks/compare_benchmarks.py baseline.json new.json --threshold 0.1
+
+Exits with a non-zero status if any metric regressed by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+# metrics that are compared and whether larger values are better
+METRICS = {'iterations_per_second': True,
+           'seconds_per_call': False,
+           'peak_memory_mb': False,
+           'peak_cuda_memory_mb': False}
+
+
+def compare(baseline, new, threshold, min_memory_mb=10.0):
+    baseline = {result['name']: result['metrics'] for result in baseline['results']}
+    regressions, improvements = [], []
+    for result in new['results']:
+        name, metrics = result['name'], result['metrics']
+        if name not in baseline:
+            continue
+        for metric, larger_is_better in METRICS.items():
+            old_value, new_value = baseline[name].get(metric), metrics.get(metric)
+            if old_value is None or new_value is None or old_value <= 0.0:
+                continue
+            if metric.endswith('memory_mb') and max(old_value, new_value) < min_memory_mb:
+                continue  # small memory footprints are dominated by noise
+            change = new_value / old_value - 1.0
+            if not larger_is_better:
+                change = -change
+            row = (name, metric, old_value, new_value, change)
+            if change < -threshold:
+                regressions.append(row)
+            elif change > threshold:
+                improvements.append(row)
+    return regressions, improvements
+
+
+def main(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    regressions, improvements = compare(baseline, new, args.threshold)
+    for title, rows in [("Regressions", regressions), ("Improvements", improvements)]:
+        print("{} (threshold {:.0%}):".format(title, args.threshold))
+        for name, metric, old_value, new_value, change in rows:
+            print("  {}  {}: {:.4g} -> {:.4g} ({:+.1%})".format(name, metric, old_value, new_value, change))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compare millipede benchmark results")
+    parser.add_argument("baseline", type=str)
+    parser.add_argument("new", type=str)
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change above which a metric is reported")
+    main(parser.parse_args())
@@ -0,0 +1,48 @@
+"""
+Run the millipede benchmark suite and write the results to a JSON file, e.g.::
+
+    python benchmarks/run_benchmarks.py --quick --output bench.json
+    python benchmarks/run_benchmarks.py --suite kernels --filter safe_cholesky
+
+Use `compare_benchmarks.py` to compare the results of two runs.
+"""
+import argparse
+import traceback
+
+from common import run_case, write_results
+from suites import SUITES
+
+
+def main(args):
+    cases = []
+    for suite in args.suite:
+        cases.extend(SUITES[suite](quick=args.quick))
+    if args.filter:
+        cases = [case for case in cases if any(f in case[0] for f in args.filter)]
+
+    results = []
+    for i, (name, fn, kwargs) in enumerate(cases):
+        print("[{}/{}] {}".format(i + 1, len(cases), name), flush=True)
+        try:
+            metrics = run_case(fn, kwargs, isolate=not args.no_isolate)
+        except Exception:
+            traceback.print_exc()
+            metrics = {'error': traceback.format_exc(limit=1)}
+        results.append({'name': name, 'benchmark': fn.__name__, 'params': kwargs, 'metrics': metrics})
+        summary = ["{}={:.4g}".format(k, v) for k, v in metrics.items() if isinstance(v, float)]
+        print("    " + "  ".join(summary), flush=True)
+
+    write_results(results, args.output)
+    print("Wrote {} results to {}".format(len(results), args.output))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="millipede benchmarks")
+    parser.add_argument("--suite", nargs="+", choices=list(SUITES), default=list(SUITES))
+    parser.add_argument("--filter", nargs="+", default=None,
+                        help="only run benchmarks whose name contains one of these substrings")
+    parser.add_argument("--quick", action="store_true", help="run a small subset of the sweeps")
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="run all benchmarks in this process (faster, but peak memory is less accurate)")
+    parser.add_argument("--output", type=str, default="benchmark_results.json")
+    main(parser.parse_args())
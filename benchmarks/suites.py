@@ -0,0 +1,148 @@
+"""
+Benchmark cases for the samplers, the util kernels and end-to-end variable selection. Each suite is a function
+that returns a list of (name, fn, kwargs) tuples, where `fn(**kwargs)` runs the benchmark and returns a dictionary
+of metrics.
+"""
+import gzip
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from common import case_name, make_count_data, make_linear_data, time_per_call
+from polyagamma import random_polyagamma
+
+from millipede import (
+    BernoulliLikelihoodVariableSelector,
+    CountLikelihoodSampler,
+    NormalLikelihoodSampler,
+)
+from millipede.util import get_loo_quadratic_forms, safe_cholesky, tiled_rmatmat
+
+HIGGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks", "data", "higgs.csv.gz")
+
+# sweeps used by default and with --quick
+SAMPLER_GRID = dict(N=[1000, 10000], P=[1000, 10000], num_causal=[2, 10], precision=["single", "double", "mixed"])
+SAMPLER_GRID_QUICK = dict(N=[1000], P=[1000], num_causal=[2], precision=["double", "mixed"])
+KERNEL_SIZES = dict(D=[10, 100, 500], N=[10000, 100000])
+KERNEL_SIZES_QUICK = dict(D=[10, 100], N=[10000])
+
+
+def _sampler_metrics(sampler, T, T_burnin, setup_time, seed):
+    start = time.perf_counter()
+    for _ in sampler.mcmc_chain(T=T, T_burnin=T_burnin, seed=seed):
+        pass
+    elapsed = time.perf_counter() - start
+    profile = sampler.profile
+    return {'setup_seconds': setup_time,
+            'iterations_per_second': (T + T_burnin) / elapsed,
+            'mean_iteration_ms': 1000.0 * elapsed / (T + T_burnin),
+            'mean_active_set_size': profile.mean_active_set_size,
+            'phase_seconds': dict(profile.phase_times),
+            'events': dict(profile.events)}
+
+
+def bench_normal_sampler(N, P, num_causal, prior, precision, precompute_XX, T, T_burnin, seed=0):
+    dtype = torch.float32 if precision == "single" else torch.float64
+    X, Y = make_linear_data(N, P, num_causal, dtype=dtype, seed=seed)
+    start = time.perf_counter()
+    sampler = NormalLikelihoodSampler(X, Y, S=float(num_causal), prior=prior, precompute_XX=precompute_XX,
+                                      mixed_precision=precision == "mixed", verbose_constructor=False)
+    return _sampler_metrics(sampler, T, T_burnin, time.perf_counter() - start, seed)
+
+
+def bench_count_sampler(N, P, num_causal, likelihood, precision, T, T_burnin, seed=0):
+    dtype = torch.float32 if precision == "single" else torch.float64
+    X, Y, TC, psi0 = make_count_data(N, P, num_causal, likelihood, dtype=dtype, seed=seed)
+    start = time.perf_counter()
+    sampler = CountLikelihoodSampler(X, Y, TC=TC, psi0=psi0, S=float(num_causal),
+                                     mixed_precision=precision == "mixed", verbose_constructor=False)
+    return _sampler_metrics(sampler, T, T_burnin, time.perf_counter() - start, seed)
+
+
+def sampler_suite(quick=False, T=None, T_burnin=None):
+    grid = SAMPLER_GRID_QUICK if quick else SAMPLER_GRID
+    T = (200 if quick else 1000) if T is None else T
+    T_burnin = (50 if quick else 200) if T_burnin is None else T_burnin
+    cases = []
+    for N, P, num_causal, precision in itertools.product(*grid.values()):
+        for prior, precompute_XX in itertools.product(["isotropic", "gprior"], [False, True]):
+            if precompute_XX and P > 5000:
+                continue  # X^T X would require too much memory
+            params = dict(N=N, P=P, num_causal=num_causal, prior=prior, precision=precision,
+                          precompute_XX=precompute_XX)
+            cases.append((case_name("normal_sampler", params), bench_normal_sampler,
+                          dict(T=T, T_burnin=T_burnin, **params)))
+        for likelihood in ["binomial", "negative_binomial"]:
+            params = dict(N=N, P=P, num_causal=num_causal, likelihood=likelihood, precision=precision)
+            cases.append((case_name("count_sampler", params), bench_count_sampler,
+                          dict(T=T, T_burnin=T_burnin, **params)))
+    return cases
+
+
+def bench_loo_quadratic_forms(D, seed=0):
+    torch.manual_seed(seed)
+    A = torch.randn(D + 5, D, dtype=torch.float64)
+    F = torch.linalg.inv(A.t() @ A + torch.eye(D, dtype=torch.float64))
+    z = torch.randn(D, dtype=torch.float64)
+    return {'seconds_per_call': time_per_call(lambda: get_loo_quadratic_forms(F, z))}
+
+
+def bench_safe_cholesky(D, singular, seed=0):
+    torch.manual_seed(seed)
+    A = torch.randn(D + 5 if not singular else D // 2, D, dtype=torch.float64)
+    # singular matrices require jitter retries
+    A = A.t() @ A if singular else A.t() @ A + torch.eye(D, dtype=torch.float64)
+    return {'seconds_per_call': time_per_call(lambda: safe_cholesky(A))}
+
+
+def bench_random_polyagamma(N, seed=0):
+    rng = np.random.default_rng(seed)
+    h, z = np.full(N, 10.0), rng.normal(size=N)
+    return {'seconds_per_call': time_per_call(lambda: random_polyagamma(h, z, random_state=rng))}
+
+
+def bench_tiled_rmatmat(N, D, tile_size=256, P=1000, seed=0):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P, dtype=torch.float64)
+    V = torch.randn(N, min(D, 20), dtype=torch.float64)
+    return {'seconds_per_call': time_per_call(lambda: tiled_rmatmat(X, V, tile_size))}
+
+
+def kernel_suite(quick=False):
+    sizes = KERNEL_SIZES_QUICK if quick else KERNEL_SIZES
+    cases = []
+    for D in sizes['D']:
+        cases.append((case_name("get_loo_quadratic_forms", dict(D=D)), bench_loo_quadratic_forms, dict(D=D)))
+        for singular in [False, True]:
+            params = dict(D=D, singular=singular)
+            cases.append((case_name("safe_cholesky", params), bench_safe_cholesky, params))
+    for N in sizes['N']:
+        cases.append((case_name("random_polyagamma", dict(N=N)), bench_random_polyagamma, dict(N=N)))
+        params = dict(N=N, D=sizes['D'][0])
+        cases.append((case_name("tiled_rmatmat", params), bench_tiled_rmatmat, params))
+    return cases
+
+
+def bench_higgs(T, T_burnin, seed=0):
+    dataframe = pd.read_csv(gzip.GzipFile(HIGGS_PATH, "rb"), index_col=0)
+    start = time.perf_counter()
+    selector = BernoulliLikelihoodVariableSelector(dataframe, 'signal_event', S=1.0, precision='double',
+                                                   device='cpu')
+    selector.run(T=T, T_burnin=T_burnin, verbosity=None, seed=seed)
+    elapsed = time.perf_counter() - start
+    # the top covariates serve as a sanity check that performance changes do not change the results
+    top_pip = selector.pip.sort_values(ascending=False)[:3]
+    return {'iterations_per_second': (T + T_burnin) / elapsed,
+            'elapsed_seconds': elapsed,
+            'top_pip': {name: round(float(pip), 3) for name, pip in top_pip.items()}}
+
+
+def end_to_end_suite(quick=False):
+    params = dict(T=1000, T_burnin=200) if quick else dict(T=5000, T_burnin=1000)
+    return [(case_name("higgs_bernoulli", params), bench_higgs, params)]
+
+
+SUITES = {'samplers': sampler_suite, 'kernels': kernel_suite, 'end_to_end': end_to_end_suite}
@@ -1,7 +1,10 @@
 __version__ = "0.1.0"
 
 from millipede.binomial import CountLikelihoodSampler
-from millipede.normal import NormalLikelihoodSampler
+from millipede.normal import (
+    MultiChainNormalLikelihoodSampler,
+    NormalLikelihoodSampler,
+)
 from millipede.selection import (
     BernoulliLikelihoodVariableSelector,
     BinomialLikelihoodVariableSelector,
@@ -13,6 +16,7 @@ __all__ = [
         "BernoulliLikelihoodVariableSelector",
         "BinomialLikelihoodVariableSelector",
         "CountLikelihoodSampler",
+        "MultiChainNormalLikelihoodSampler",
         "NegativeBinomialLikelihoodVariableSelector",
         "NormalLikelihoodSampler",
         "NormalLikelihoodVariableSelector",
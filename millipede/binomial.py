@@ -5,7 +5,7 @@ import numpy as np
 import torch
 from polyagamma import random_polyagamma
 from torch import cholesky_solve as chosolve
-from torch import dot, einsum, matmul, sigmoid
+from torch import dot, einsum, sigmoid
 from torch.distributions import Beta, Categorical, Uniform
 from torch.linalg import norm
 from torch.linalg import solve_triangular as trisolve
@@ -13,10 +13,15 @@ from torch.nn.functional import softplus
 
 from .sampler import MCMCSampler
 from .util import (
-    get_loo_inverses,
-    leave_one_out,
-    leave_one_out_off_diagonal,
+    DesignMatrix,
+    SamplerProfile,
+    as_design_matrix,
+    get_loo_quadratic_forms,
+    map_shards,
     safe_cholesky,
+    tiled_column_norms_sq,
+    tiled_rmatmat,
+    upcast_rmatmat,
 )
 
 
@@ -92,7 +97,11 @@ class CountLikelihoodSampler(MCMCSampler):
     suffice to use one of :class:`BinomialLikelihoodVariableSelector`, :class:`BernoulliLikelihoodVariableSelector`,
     and :class:`NegativeBinomialLikelihoodVariableSelector`.
 
-    :param tensor X: A N x P `torch.Tensor` of covariates. This is a required argument.
+    :param tensor X: A N x P `torch.Tensor` of covariates. This is a required argument. If `X` is a sparse
+        tensor (COO, CSR or CSC layout) it is never densified: memory usage and the cost of all products
+        involving `X` then scale with the number of non-zero elements. If `X` is a (memory-mapped) numpy array or
+        the path to a .npy file it is never loaded into memory in full: all reductions over the rows of `X` are
+        evaluated in chunks. See :class:`~millipede.util.MemmapDesignMatrix`.
     :param tensor Y: A N-dimensional `torch.Tensor` of non-negative count-valued responses. This is a required argument.
     :param tensor X_assumed: A N x P' `torch.Tensor` of covariates that are always assumed to be part of the model.
         Defaults to `None`.
@@ -123,11 +132,25 @@ class CountLikelihoodSampler(MCMCSampler):
         Defaults to 5.0. Only applicable to the Negative Binomial case.
     :param bool verbose_constructor: Whether the class constructor should print some information to
         stdout upon initialization.
+    :param bool mixed_precision: If True, `X` is stored in single precision and all O(N x P) products involving `X`
+        are done in single precision, which halves memory usage and memory bandwidth. All computations that
+        involve the active covariates (e.g. their precision matrix and its Cholesky factorization) as well as
+        the Polya-Gamma updates are done in double precision. Only supported for dense `X`. Defaults to False.
+    :param int tile_size: If `X` is dense, products with :math:`X^{\rm T}` over all covariates are computed
+        over tiles of `tile_size` columns of `X` in place so that no columns of `X` need to be gathered and
+        temporaries are bounded by the size of a tile. Defaults to 1024.
+    :param int num_threads: If larger than 1, the log odds of the inactive covariates are computed in
+        `num_threads` shards on a thread pool and, if `X` is dense, the tiles of products with :math:`X^{\rm T}`
+        are likewise computed concurrently. This is useful for large P (e.g. :math:`P \ge 10^5`). Defaults to 1.
     """
+    _state_attributes = MCMCSampler._state_attributes + ['rng', 'accepted_omega_updates', 'attempted_omega_updates',
+                                                         'acceptance_probs', '_L_active', '_precision']
+
     def __init__(self, X, Y, X_assumed=None, TC=None, psi0=None,
                  S=5.0, tau=0.01, tau_intercept=1.0e-4,
                  explore=5.0, log_nu_rw_scale=0.05, omega_mh=True,
-                 xi_target=0.25, init_nu=5.0, verbose_constructor=True):
+                 xi_target=0.25, init_nu=5.0, verbose_constructor=True,
+                 mixed_precision=False, tile_size=1024, num_threads=1):
         super().__init__()
         if not ((TC is None and psi0 is not None) or (TC is not None and psi0 is None)):
             raise ValueError('CountLikelihoodSampler supports two modes of operation. ' +
@@ -135,27 +158,48 @@ class CountLikelihoodSampler(MCMCSampler):
                              'provide psi0. For a negative binomial likelihood the user must provide psi0 ' +
                              'but ~not~ provide TC.')
 
-        self.dtype = X.dtype
+        X = as_design_matrix(X, device=Y.device)
+        if mixed_precision:
+            if isinstance(X, DesignMatrix):
+                raise ValueError("mixed_precision is only supported for dense covariate matrices X.")
+            X = X.float()
+            X_assumed = None if X_assumed is None else X_assumed.float()
+            psi0 = psi0.double() if isinstance(psi0, torch.Tensor) else psi0
+        self.mixed_precision = mixed_precision
+        if not isinstance(tile_size, int) or tile_size <= 0:
+            raise ValueError("tile_size must be a positive integer.")
+        self.tile_size = tile_size
+        if not isinstance(num_threads, int) or num_threads <= 0:
+            raise ValueError("num_threads must be a positive integer.")
+        self.num_threads = num_threads
+        self.profile = SamplerProfile()
+        self.dtype = torch.float64 if mixed_precision else X.dtype
         self.device = X.device
         self.Xb = X
         self.N, self.P = X.shape
+        self.X_lazy = isinstance(X, DesignMatrix)
 
         if X_assumed is not None:
-            assert self.dtype == X_assumed.dtype
+            assert X.dtype == X_assumed.dtype
             assert self.device == X_assumed.device
             if X.size(0) != X_assumed.size(0):
                 raise ValueError("X and X_assumed must have the same number of rows.")
             assert X_assumed.size(-1) > 0
-            self.Xb = torch.cat([self.Xb, X_assumed], dim=-1)
 
-        self.Xb = torch.cat([self.Xb, X.new_ones(X.size(0), 1)], dim=-1)
+        if self.X_lazy:
+            self.Xb = X.with_assumed_covariates(X_assumed=X_assumed, include_intercept=True)
+        else:
+            if X_assumed is not None:
+                self.Xb = torch.cat([self.Xb, X_assumed], dim=-1)
+            self.Xb = torch.cat([self.Xb, X.new_ones(X.size(0), 1)], dim=-1)
+
         self.Y = Y
-        self.Y_float = self.Y.type_as(X)
+        self.Y_float = self.Y.to(dtype=self.dtype)
         self.tau = tau
 
         self.negbin = psi0 is not None
         if self.negbin:
-            psi0 = X.new_tensor(psi0) if isinstance(psi0, float) else psi0
+            psi0 = self.Y_float.new_tensor(psi0) if isinstance(psi0, float) else psi0
             if not (psi0.shape == Y.shape or psi0.shape == ()):
                 raise ValueError("psi0 should either be a scalar or a one-dimensional array with " +
                                  "the same number of elements as Y.")
@@ -169,7 +213,7 @@ class CountLikelihoodSampler(MCMCSampler):
                 raise ValueError("Y and TC should both be one-dimensional arrays.")
             self.TC = TC
             self.TC_np = TC.data.cpu().numpy().copy()
-            self.TC_float = self.TC.type_as(X)
+            self.TC_float = self.TC.to(dtype=self.dtype)
 
         if self.N != Y.size(-1):
             raise ValueError("X and Y should be of shape (N, P) and (N,), respectively.")
@@ -221,12 +265,12 @@ class CountLikelihoodSampler(MCMCSampler):
         self.half_log_tau = 0.5 * math.log(tau)
         self.tau_intercept = tau_intercept
 
-        self.epsilon = 1.0e3 * torch.finfo(X.dtype).tiny
+        self.epsilon = 1.0e3 * torch.finfo(self.dtype).tiny
         self.xi = torch.tensor([5.0], device=X.device)
         self.xi_target = xi_target
 
         self.omega_mh = omega_mh
-        self.uniform_dist = Uniform(0.0, X.new_ones(1)[0])
+        self.uniform_dist = Uniform(0.0, self.Y_float.new_ones(1)[0])
 
         if verbose_constructor:
             s1 = "Initialized CountLikelihoodSampler with {} likelihood and (N, P, S, epsilon) = "
@@ -241,28 +285,30 @@ class CountLikelihoodSampler(MCMCSampler):
         self.accepted_omega_updates = 0
         self.attempted_omega_updates = 0
         self.acceptance_probs = []
+        self.profile = SamplerProfile()
 
         self.rng = np.random.default_rng(seed)
         if seed is not None:
             torch.manual_seed(seed)
 
-        if not self.negbin:
-            log_nu = None
-            _omega = torch.from_numpy(random_polyagamma(self.TC_np, random_state=self.rng)).type_as(self.Xb)
-        else:
-            log_nu = torch.tensor(math.log(self.init_nu))
-            _omega = torch.from_numpy(random_polyagamma(self.Y.data.cpu().numpy() + self.init_nu,
-                                                        random_state=self.rng)).type_as(self.Xb)
+        with self.profile.phase('polya_gamma'):
+            if not self.negbin:
+                log_nu = None
+                _omega = random_polyagamma(self.TC_np, random_state=self.rng)
+            else:
+                log_nu = torch.tensor(math.log(self.init_nu))
+                _omega = random_polyagamma(self.Y.data.cpu().numpy() + self.init_nu, random_state=self.rng)
+        _omega = torch.from_numpy(_omega).type_as(self.Y_float)
 
         _psi0 = self.psi0 - log_nu if self.negbin else 0.0
         _kappa = 0.5 * (self.Y - log_nu.exp()) if self.negbin else self.Y - 0.5 * self.TC
         _kappa_omega = _kappa - _omega * _psi0
-        _Z = einsum("np,n->p", self.Xb, _kappa_omega)
+        _Z = self._compute_Z(_kappa_omega)
 
-        sample = SimpleNamespace(gamma=self.Xb.new_zeros(self.P).bool(),
+        sample = SimpleNamespace(gamma=_Z.new_zeros(self.P).bool(),
                                  _omega=_omega,
-                                 beta=self.Xb.new_zeros(self.P + self.Pa),
-                                 beta_mean=self.Xb.new_zeros(self.P + self.Pa),
+                                 beta=_Z.new_zeros(self.P + self.Pa),
+                                 beta_mean=_Z.new_zeros(self.P + self.Pa),
                                  _psi0=_psi0,
                                  _idx=0,
                                  weight=0,
@@ -290,43 +336,56 @@ class CountLikelihoodSampler(MCMCSampler):
             "all covariates have been selected. Are you sure you have chosen a reasonable prior? " +\
             "Are you sure there is signal in your data?"
 
-        X_omega = self.Xb * sample._omega.sqrt().unsqueeze(-1)
-        X_omega_k = X_omega[:, inactive]
+        omega_sqrt = sample._omega.sqrt().unsqueeze(-1)
+        X_omega_active = self._get_Xb_columns(activeb) * omega_sqrt
+        # omega only changes during Polya-Gamma updates so we cache the weighted column norms
+        if getattr(sample, '_XX_omega', None) is None:
+            if self.X_lazy:
+                sample._XX_omega = self.Xb.column_norms_sq(sample._omega)
+            else:
+                sample._XX_omega = tiled_column_norms_sq(self.Xb, sample._omega, self.tile_size, self.dtype,
+                                                         self.num_threads)
 
-        Z_k = sample._Z[inactive]
-        X_omega_active = X_omega[:, activeb]
         Z_active = sample._Z[activeb]
 
         Zt_active = trisolve(self._L_active, Z_active.unsqueeze(-1), upper=False).squeeze(-1)
         Xt_active = trisolve(self._L_active, X_omega_active.t(), upper=False).t()
         XtZt_active = einsum("np,p->n", Xt_active, Zt_active)
 
-        XX_k = norm(X_omega_k, dim=0).pow(2.0)
-        G_k_inv = XX_k + self.tau - norm(einsum("ni,nk->ik", Xt_active, X_omega_k), dim=0).pow(2.0)
-        W_k_sq = (einsum("np,n->p", X_omega_k, XtZt_active) - Z_k).pow(2.0) / (G_k_inv + self.epsilon)
-        log_det_ratio_inactive = -0.5 * G_k_inv.log() + self.half_log_tau
-
-        if num_active > 1:
-            active_loo = leave_one_out(active)  # I I-1
-            active_loob = torch.cat([active_loo, self.assumed_covariates.expand(num_active, -1)], dim=-1)
-
-            Z_active_loo = sample._Z[active_loob]
+        # X_omega^T V = X^T (omega^{1/2} V) so that X_omega = Omega^{1/2} X is never formed and all products
+        # with X^T are batched into a single pass over X. with mixed precision we use the residual
+        # X_k^T (omega * X_I beta_I - kappa_omega) = W_k, which avoids the cancellation in
+        # X_k^T Omega X_I beta_I - Z_k that single precision arithmetic would otherwise amplify
+        if self.mixed_precision:
+            residual = omega_sqrt.squeeze(-1) * XtZt_active - sample._kappa_omega
+            V = torch.cat([omega_sqrt * Xt_active, residual.unsqueeze(-1)], dim=-1)
+        else:
+            V = omega_sqrt * torch.cat([Xt_active, XtZt_active.unsqueeze(-1)], dim=-1)
+        if self.X_lazy:
+            XtV = self.Xb.rmatmat(V)
+        else:
+            XtV = tiled_rmatmat(self.Xb, V, self.tile_size, self.dtype, self.num_threads)
 
-            F = torch.cholesky_inverse(self._L_active, upper=False)
-            F_loo = get_loo_inverses(F)[:-self.Pa]
+        # the log odds of the inactive covariates do not depend on each other, so with num_threads > 1
+        # contiguous shards of the inactive covariates are computed concurrently into a shared buffer
+        log_odds = sample._Z.new_zeros(self.P)
 
-            Zt_active_loo = matmul(F_loo, Z_active_loo.unsqueeze(-1)).squeeze(-1)
-            Zt_active_loo_sq = einsum("ij,ij->i", Zt_active_loo, Z_active_loo)
+        def compute_shard(inactive_shard):
+            log_odds[inactive_shard] = self._compute_log_odds_inactive(sample, inactive_shard, XtV)
 
-            X_I_X_k = leave_one_out_off_diagonal(self._precision).unsqueeze(-1)[:-self.Pa]
-            F_X_I_X_k = matmul(F_loo, X_I_X_k).squeeze(-1)
+        shards = inactive.tensor_split(self.num_threads) if self.num_threads > 1 else [inactive]
+        map_shards(compute_shard, shards, self.num_threads)
 
-            XXFXX = einsum("ij,ij->i", X_I_X_k.squeeze(-1), F_X_I_X_k)
-            G_k_inv = norm(X_omega[:, active], dim=0).pow(2.0) + self.tau - XXFXX
-            log_det_ratio_active = -0.5 * G_k_inv.log() + self.half_log_tau
+        if num_active > 1:
+            # leave-one-out quantities for each active covariate in O(k^2) given F = (X^T Omega X + Lambda)^{-1}
+            F = torch.cholesky_inverse(self._L_active, upper=False)
+            Zt_active_loo_sq, F_diag = get_loo_quadratic_forms(F, Z_active)
+            Zt_active_loo_sq = Zt_active_loo_sq[:-self.Pa]
+            # the schur complement G_k_inv = X_k^T X_k + tau - X_k^T X_I F_I X_I^T X_k equals 1 / F_kk
+            log_det_ratio_active = 0.5 * F_diag[:-self.Pa].log() + self.half_log_tau
         elif num_active == 1:
             XX_assumed = self._precision[-self.Pa:][:, -self.Pa:]
-            L_assumed = safe_cholesky(XX_assumed)
+            L_assumed = safe_cholesky(XX_assumed, profile=self.profile)
             Zt_active_loo = trisolve(L_assumed, sample._Z[self.assumed_covariates].unsqueeze(-1),
                                      upper=False).squeeze(-1)
             Zt_active_loo_sq = norm(Zt_active_loo, dim=0).pow(2.0)
@@ -338,21 +397,37 @@ class CountLikelihoodSampler(MCMCSampler):
             log_det_ratio_active = torch.tensor(0.0)
 
         log_h_ratio_active = sample._log_h_ratio[active] if isinstance(self.h, torch.Tensor) else sample._log_h_ratio
+        log_odds[active] = 0.5 * (Zt_active.pow(2.0).sum() - Zt_active_loo_sq) + \
+            log_det_ratio_active + log_h_ratio_active
+
+        return log_odds
+
+    def _compute_log_odds_inactive(self, sample, inactive, XtV):
+        # computes the log odds for (a subset of) the inactive covariates given XtV = X_omega^T V
+        G_k_inv = sample._XX_omega[inactive] + self.tau - XtV[inactive, :-1].pow(2.0).sum(-1)
+        W_k = XtV[inactive, -1] if self.mixed_precision else XtV[inactive, -1] - sample._Z[inactive]
+        W_k_sq = W_k.pow(2.0) / (G_k_inv + self.epsilon)
+        log_det_ratio_inactive = -0.5 * G_k_inv.log() + self.half_log_tau
+
         log_h_ratio_inactive = sample._log_h_ratio[inactive] if isinstance(self.h, torch.Tensor) \
             else sample._log_h_ratio
 
-        log_odds_inactive = 0.5 * W_k_sq + log_det_ratio_inactive + log_h_ratio_inactive
-        log_odds_active = 0.5 * (Zt_active.pow(2.0).sum() - Zt_active_loo_sq) + \
-            log_det_ratio_active + log_h_ratio_active
+        return 0.5 * W_k_sq + log_det_ratio_inactive + log_h_ratio_inactive
 
-        log_odds = self.Xb.new_zeros(self.P)
-        log_odds[inactive] = log_odds_inactive
-        log_odds[active] = log_odds_active
+    def _compute_Z(self, kappa_omega):
+        if self.X_lazy:
+            return self.Xb.rmatvec(kappa_omega)
+        elif self.mixed_precision:
+            return upcast_rmatmat(self.Xb, kappa_omega, self.dtype)
+        return einsum("np,n->p", self.Xb, kappa_omega)
 
-        return log_odds
+    def _get_Xb_columns(self, indices):
+        # with mixed precision the columns of active covariates are upcast
+        return self.Xb[:, indices].to(self.dtype)
 
     def _compute_probs(self, sample):
-        sample.add_prob = sigmoid(self._compute_add_prob(sample))
+        with self.profile.phase('compute_add_prob'):
+            sample.add_prob = sigmoid(self._compute_add_prob(sample))
 
         gamma = sample.gamma.double()
         prob_gamma_i = gamma * sample.add_prob + (1.0 - gamma) * (1.0 - sample.add_prob)
@@ -374,24 +449,28 @@ class CountLikelihoodSampler(MCMCSampler):
             sample.gamma[sample._idx] = ~sample.gamma[sample._idx]
             sample._active = torch.nonzero(sample.gamma).squeeze(-1)
             sample._activeb = torch.cat([sample._active, self.assumed_covariates], dim=-1)
-            sample = self.sample_beta(sample)
+            with self.profile.phase('sample_beta'):
+                sample = self.sample_beta(sample)
         else:
             if hasattr(self, 'h_alpha'):
-                sample = self.sample_alpha_beta(sample)
-            sample = self.sample_omega_nb(sample) if self.negbin else self.sample_omega_binomial(sample)
+                with self.profile.phase('sample_h'):
+                    sample = self.sample_alpha_beta(sample)
+            with self.profile.phase('sample_omega'):
+                sample = self.sample_omega_nb(sample) if self.negbin else self.sample_omega_binomial(sample)
 
         sample = self._compute_probs(sample)
         sample.weight = sample._i_prob.mean().reciprocal()
+        self.profile.active_set_size(sample._active.size(-1))
 
         return sample
 
     def sample_beta(self, sample):
         activeb = sample._activeb
-        Xb_active = self.Xb[:, activeb]
+        Xb_active = self._get_Xb_columns(activeb)
         precision = Xb_active.t() @ (sample._omega.unsqueeze(-1) * Xb_active)
         precision.diagonal(dim1=-2, dim2=-1).add_(self.tau)
         precision[-1, -1].add_(self.tau_intercept - self.tau)
-        self._L_active = safe_cholesky(precision)
+        self._L_active = safe_cholesky(precision, profile=self.profile)
         self._precision = precision
 
         sample.beta.zero_()
@@ -408,11 +487,12 @@ class CountLikelihoodSampler(MCMCSampler):
         return sample
 
     def sample_omega_binomial(self, sample, _save_intermediates=None):
-        omega_prop = random_polyagamma(self.TC_np, sample._psi.data.cpu().numpy(), random_state=self.rng)
-        omega_prop = torch.from_numpy(omega_prop).type_as(self.Xb)
+        with self.profile.phase('polya_gamma'):
+            omega_prop = random_polyagamma(self.TC_np, sample._psi.data.cpu().numpy(), random_state=self.rng)
+        omega_prop = torch.from_numpy(omega_prop).type_as(self.Y_float)
 
         activeb = sample._activeb
-        Xb_active = self.Xb[:, activeb]
+        Xb_active = self._get_Xb_columns(activeb)
 
         # some of these computations could be reused/saved but they are cheap
         # so we do them from scratch to avoid unnecessary complexity
@@ -421,7 +501,7 @@ class CountLikelihoodSampler(MCMCSampler):
             precision.diagonal(dim1=-2, dim2=-1).add_(self.tau)
             precision[-1, -1].add_(self.tau_intercept - self.tau)
 
-            L = safe_cholesky(precision)
+            L = safe_cholesky(precision, profile=self.profile)
             LZ = trisolve(L, sample._Z[activeb].unsqueeze(-1), upper=False).squeeze(-1)
             logdet = L.diag().log().sum() - L.size(-1) * self.half_log_tau
 
@@ -455,6 +535,9 @@ class CountLikelihoodSampler(MCMCSampler):
             if self.t >= self.T_burnin:
                 self.acceptance_probs.append(accept)
             accept = self.uniform_dist.sample().item() < accept
+            # early in burn-in the proposal is applied even if it is rejected
+            if not accept and self.t >= self.T_burnin // 2:
+                self.profile.event('Polya-Gamma MH rejections')
 
             if self.t >= self.T_burnin:
                 self.attempted_omega_updates += 1
@@ -466,6 +549,7 @@ class CountLikelihoodSampler(MCMCSampler):
 
         if not self.omega_mh or accept or (self.t < self.T_burnin // 2):
             sample._omega = omega_prop
+            sample._XX_omega = None
             sample._psi = psi_prop
             sample.beta_mean.zero_()
             sample.beta_mean[activeb] = beta_mean_prop
@@ -478,7 +562,7 @@ class CountLikelihoodSampler(MCMCSampler):
 
     def sample_omega_nb(self, sample, _save_intermediates=None):
         activeb = sample._activeb
-        Xb_active = self.Xb[:, activeb]
+        Xb_active = self._get_Xb_columns(activeb)
 
         log_nu_prop = sample.log_nu + self.log_nu_rw_scale * torch.randn(1).item()
         nu_curr, nu_prop = sample.log_nu.exp(), log_nu_prop.exp()
@@ -486,20 +570,21 @@ class CountLikelihoodSampler(MCMCSampler):
 
         psi0_prop = self.psi0 - log_nu_prop
         psi_mixed = sample._psi + psi0_prop
-        omega_prop = random_polyagamma(T_prop.data.cpu().numpy(), psi_mixed.data.cpu().numpy(),
-                                       random_state=self.rng)
-        omega_prop = torch.from_numpy(omega_prop).type_as(self.Xb)
+        with self.profile.phase('polya_gamma'):
+            omega_prop = random_polyagamma(T_prop.data.cpu().numpy(), psi_mixed.data.cpu().numpy(),
+                                           random_state=self.rng)
+        omega_prop = torch.from_numpy(omega_prop).type_as(self.Y_float)
 
         kappa_prop = 0.5 * (self.Y - nu_prop)
         kappa_omega_prop = kappa_prop - omega_prop * psi0_prop
-        Z_prop = einsum("np,n->p", self.Xb, kappa_omega_prop)
+        Z_prop = self._compute_Z(kappa_omega_prop)
 
         def compute_log_target(omega, Z):
             precision = Xb_active.t() @ (omega.unsqueeze(-1) * Xb_active)
             precision.diagonal(dim1=-2, dim2=-1).add_(self.tau)
             precision[-1, -1].add_(self.tau_intercept - self.tau)
 
-            L = safe_cholesky(precision)
+            L = safe_cholesky(precision, profile=self.profile)
             LZ = trisolve(L, Z[activeb].unsqueeze(-1), upper=False).squeeze(-1)
             logdet = L.diag().log().sum() - L.size(-1) * self.half_log_tau
 
@@ -543,6 +628,9 @@ class CountLikelihoodSampler(MCMCSampler):
         if self.t >= self.T_burnin:
             self.acceptance_probs.append(accept)
         accept = self.uniform_dist.sample().item() < accept
+        # early in burn-in the proposal is applied even if it is rejected
+        if not accept and self.t >= min(50, self.T_burnin // 4):
+            self.profile.event('Polya-Gamma MH rejections')
 
         if self.t >= self.T_burnin:
             self.attempted_omega_updates += 1
@@ -551,6 +639,7 @@ class CountLikelihoodSampler(MCMCSampler):
         if accept or self.t < min(50, self.T_burnin // 4):
             sample.log_nu = log_nu_prop
             sample._omega = omega_prop
+            sample._XX_omega = None
             sample._psi = psi_prop
             self._L_active = L_prop
             self._precision = precision_prop
@@ -568,8 +657,8 @@ class CountLikelihoodSampler(MCMCSampler):
     def sample_alpha_beta(self, sample):
         num_active = sample._active.size(-1)
         num_inactive = self.P - num_active
-        sample.h_alpha = torch.tensor(self.h_alpha + num_active, device=self.Xb.device)
-        sample.h_beta = torch.tensor(self.h_beta + num_inactive, device=self.Xb.device)
+        sample.h_alpha = torch.tensor(self.h_alpha + num_active, device=self.device)
+        sample.h_beta = torch.tensor(self.h_beta + num_inactive, device=self.device)
         h = Beta(sample.h_alpha, sample.h_beta).sample().item()
         sample._log_h_ratio = math.log(h) - math.log(1.0 - h)
         return sample
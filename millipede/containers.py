@@ -1,27 +1,287 @@
+import os
+import queue
+import threading
 from functools import cached_property
+from types import SimpleNamespace
 
 import numpy as np
+import torch
+from scipy.sparse import coo_matrix, csr_matrix
 
-from .util import stack_namespaces
 
+class DeltaEncodedGamma(object):
+    r"""
+    Delta-encoded trajectory of the inclusion indicators :math:`\gamma` of T MCMC samples, which requires
+    O(T + P) memory instead of the O(T x P) memory of a dense T x P array. The trajectory consists of the first
+    :math:`\gamma` and the indices of the covariates that change from one sample to the next, which in the
+    case of a single MCMC chain is at most one covariate per sample.
 
-class SimpleSampleContainer(object):
+    Indexing with an integer `t` reconstructs :math:`\gamma` of the t-th sample and `np.asarray` reconstructs
+    the dense T x P array.
+
+    :param np.ndarray gamma_init: :math:`\gamma` of the first sample.
+    :param np.ndarray flips: The concatenated indices of the covariates that change in each sample.
+    :param np.ndarray offsets: Array of length T + 1 such that `flips[offsets[t]:offsets[t + 1]]` are the
+        covariates that change between samples t - 1 and t.
+    """
+    def __init__(self, gamma_init, flips, offsets):
+        self.gamma_init = gamma_init
+        self.flips = flips
+        self.offsets = offsets
+
+    @property
+    def shape(self):
+        return (self.offsets.shape[0] - 1, self.gamma_init.shape[0])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, t):
+        T, P = self.shape
+        if t < 0:
+            t += T
+        if not 0 <= t < T:
+            raise IndexError("sample index out of range")
+        # a covariate differs from gamma_init iff it changed an odd number of times
+        toggled = np.bincount(self.flips[:self.offsets[t + 1]], minlength=P) % 2
+        return self.gamma_init ^ toggled.astype(bool)
+
+    def __array__(self, dtype=None, copy=None):
+        gamma = np.empty(self.shape, dtype=bool)
+        current = self.gamma_init.copy()
+        for t in range(self.shape[0]):
+            current[self.flips[self.offsets[t]:self.offsets[t + 1]]] ^= True
+            gamma[t] = current
+        return gamma if dtype is None else gamma.astype(dtype)
+
+    def weighted_sum(self, weights):
+        r"""
+        Compute :math:`\sum_t w_t \gamma_t` directly from the delta encoding in O(T + P) time.
+        """
+        T, P = self.shape
+        cum_weights = np.concatenate([[0.0], np.cumsum(weights)])
+        # the sample in which each change occurs
+        times = np.repeat(np.arange(T), np.diff(self.offsets))
+        # within the changes of each covariate (ordered in time) the covariate is alternately switched on/off
+        order = np.lexsort((times, self.flips))
+        flips, times = self.flips[order], times[order]
+        rank = np.arange(flips.shape[0]) - np.searchsorted(flips, flips)
+        switched_off = self.gamma_init[flips] ^ (rank % 2).astype(bool)
+
+        # covariates that are included contribute the weights from when they are switched on until they are
+        # switched off (or until the end of the trajectory)
+        result = np.zeros(P)
+        np.add.at(result, flips, np.where(switched_off, 1.0, -1.0) * cum_weights[times])
+        gamma_final = self.gamma_init ^ (np.bincount(flips, minlength=P) % 2).astype(bool)
+        return result + gamma_final * cum_weights[-1]
+
+
+class PackedGamma(object):
+    r"""
+    Bit-packed inclusion indicators :math:`\gamma` of T MCMC samples, i.e. a T x ceil(P / 8) array of bytes
+    (usually memory-mapped) that requires one bit instead of one byte per indicator. Rows are unpacked on demand.
+
+    Indexing with an integer `t` unpacks :math:`\gamma` of the t-th sample and `np.asarray` unpacks the dense
+    T x P array.
+
+    :param np.ndarray packed: The T x ceil(P / 8) array of packed indicators, see `np.packbits`.
+    :param int num_covariates: The number of covariates P.
     """
+    # the number of rows that are unpacked at once by __array__ and weighted_sum
+    block_size = 1024
+
+    def __init__(self, packed, num_covariates):
+        self.packed = packed
+        self.num_covariates = num_covariates
+
+    @property
+    def shape(self):
+        return (self.packed.shape[0], self.num_covariates)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, t):
+        return np.unpackbits(self.packed[t], count=self.num_covariates, axis=-1).astype(bool)
+
+    def _blocks(self):
+        for start in range(0, self.shape[0], self.block_size):
+            yield start, self[start:start + self.block_size]
+
+    def __array__(self, dtype=None, copy=None):
+        gamma = np.empty(self.shape, dtype=bool if dtype is None else dtype)
+        for start, block in self._blocks():
+            gamma[start:start + block.shape[0]] = block
+        return gamma
+
+    def weighted_sum(self, weights):
+        r"""
+        Compute :math:`\sum_t w_t \gamma_t` while unpacking at most `block_size` samples at a time.
+        """
+        result = np.zeros(self.num_covariates)
+        for start, block in self._blocks():
+            result += weights[start:start + block.shape[0]] @ block
+        return result
+
+
+class SimpleSampleContainer(object):
+    r"""
     Class used to store MCMC samples and compute summary statistics.
     All samples are kept in memory.
+
+    Each sample site (e.g. `add_prob`) is stored in a contiguous array with one row per sample, which is
+    preallocated if the number of samples `T` is known in advance and grown geometrically otherwise,
+    so that `samples` does not require any copies. Optionally these arrays are memory-mapped `.npy` files.
+
+    Since only the coefficients of the active covariates (and of the assumed covariates) are nonzero, the
+    coefficients are stored in CSR form, i.e. as the indices and values of the nonzero coefficients of each
+    sample, and `samples.beta` is a T x (P + P_assumed) `scipy.sparse.csr_matrix`.
+
+    :param bool delta_gamma: If True, the inclusion indicators :math:`\gamma` are stored as a
+        :class:`DeltaEncodedGamma` trajectory, which requires O(T + P) instead of O(T x P) memory.
+        In this case `samples.gamma` is a :class:`DeltaEncodedGamma`. Defaults to False.
+    :param int T: The expected number of samples, which is used to preallocate the sample arrays.
+        Defaults to None.
+    :param str memmap_dir: If not None, the sample arrays are memory-mapped files `<site>.npy` in this
+        directory, which can later be loaded with `np.load(path, mmap_mode='r')`. Defaults to None.
     """
-    def __init__(self):
-        self._samples = []
+    min_capacity = 64
+
+    def __init__(self, delta_gamma=False, T=None, memmap_dir=None):
+        self.delta_gamma = delta_gamma
+        self.memmap_dir = memmap_dir
+        self._num_samples = 0
+        self._capacity = 0 if T is None else T
+        self._columns = {}
+        self._beta_size = None
+        self._beta_nnz = 0
+        self._beta_data = np.empty(0)
+        self._beta_indices = np.empty(0, dtype=np.int32)
+        self._beta_indptr = [0]
+        if delta_gamma:
+            self._gamma_init = None
+            self._gamma_last = None
+            self._flips = []
+            self._offsets = [0]
 
     def __call__(self, sample):
-        self._samples.append(sample)
+        values = dict(sample.__dict__)
+        if self.delta_gamma:
+            self._append_gamma(values.pop('gamma').astype(bool))
+        if 'beta' in values:
+            self._append_beta(values.pop('beta'))
+        values = {site: np.asarray(value) for site, value in values.items() if value is not None}
+
+        if not self._columns:
+            self._allocate_columns({site: (value.shape, value.dtype) for site, value in values.items()})
+        self._reserve(self._num_samples + 1)
+        for site, value in values.items():
+            self._columns[site][self._num_samples] = value
+        self._num_samples += 1
+
+    def _new_column(self, site, shape, dtype, capacity, suffix=""):
+        if self.memmap_dir is None:
+            return np.empty((capacity,) + shape, dtype=dtype)
+        path = os.path.join(self.memmap_dir, site + ".npy" + suffix)
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(capacity,) + shape)
+
+    def _allocate_columns(self, sites):
+        if self.memmap_dir is not None:
+            os.makedirs(self.memmap_dir, exist_ok=True)
+        capacity = max(self._capacity, 1)
+        self._columns = {site: self._new_column(site, shape, dtype, capacity) for site, (shape, dtype) in sites.items()}
+        self._capacity = capacity
+
+    def _reserve(self, num_samples):
+        if num_samples <= self._capacity:
+            return
+        capacity = max(num_samples, 2 * self._capacity, self.min_capacity)
+        for site, column in self._columns.items():
+            new_column = self._new_column(site, column.shape[1:], column.dtype, capacity, suffix=".tmp")
+            new_column[:self._num_samples] = column[:self._num_samples]
+            if self.memmap_dir is not None:
+                os.replace(new_column.filename, os.path.join(self.memmap_dir, site + ".npy"))
+            self._columns[site] = new_column
+        self._capacity = capacity
+
+    def _append_beta(self, beta):
+        indices = np.flatnonzero(beta)
+        self._beta_size = beta.shape[0]
+        self._extend_beta(beta[indices], indices)
+
+    def _extend_beta(self, data, indices):
+        nnz = self._beta_nnz + data.shape[0]
+        if nnz > self._beta_data.shape[0]:
+            capacity = max(nnz, 2 * self._beta_data.shape[0], self.min_capacity)
+            self._beta_data = np.resize(self._beta_data, capacity)
+            self._beta_indices = np.resize(self._beta_indices, capacity)
+        self._beta_data[self._beta_nnz:nnz] = data
+        self._beta_indices[self._beta_nnz:nnz] = indices
+        self._beta_nnz = nnz
+        self._beta_indptr.append(nnz)
+
+    def _append_gamma(self, gamma):
+        if self._gamma_init is None:
+            self._gamma_init = gamma
+        else:
+            self._flips.extend(np.flatnonzero(gamma != self._gamma_last).tolist())
+        self._offsets.append(len(self._flips))
+        self._gamma_last = gamma
+
+    def merge(self, other):
+        """
+        Merge the samples of another container (e.g. from an independent MCMC chain) into this container.
+        """
+        if self.delta_gamma != other.delta_gamma:
+            raise ValueError("Cannot merge containers that store gamma differently.")
+        num_samples = other._num_samples
+        if num_samples == 0:
+            return
+        if not self._columns:
+            self._allocate_columns({site: (column.shape[1:], column.dtype) for site, column in other._columns.items()})
+        self._reserve(self._num_samples + num_samples)
+        for site, column in self._columns.items():
+            column[self._num_samples:self._num_samples + num_samples] = other._columns[site][:num_samples]
+        self._num_samples += num_samples
+
+        if other._beta_size is not None:
+            self._beta_size = other._beta_size
+            for i in range(num_samples):
+                begin, end = other._beta_indptr[i], other._beta_indptr[i + 1]
+                self._extend_beta(other._beta_data[begin:end], other._beta_indices[begin:end])
+
+        if not self.delta_gamma:
+            return
+        if self._gamma_init is None:
+            self._gamma_init, self._gamma_last = other._gamma_init, other._gamma_last
+            self._flips, self._offsets = list(other._flips), list(other._offsets)
+            return
+        # the first sample of the other chain is encoded relative to the last sample of this chain
+        num_flips = len(self._flips)
+        first_flips = np.flatnonzero(other._gamma_init != self._gamma_last).tolist()
+        self._flips.extend(first_flips)
+        self._flips.extend(other._flips)
+        self._offsets.extend(num_flips + len(first_flips) + offset for offset in other._offsets[1:])
+        self._gamma_last = other._gamma_last
 
     @cached_property
     def samples(self):
-        samples = stack_namespaces(self._samples)
-        del self._samples
+        samples = SimpleNamespace(**{site: np.asarray(column[:self._num_samples])
+                                     for site, column in self._columns.items()})
+        if self.delta_gamma:
+            samples.gamma = DeltaEncodedGamma(self._gamma_init, np.array(self._flips, dtype=np.int64),
+                                              np.array(self._offsets, dtype=np.int64))
+        if self._beta_size is not None:
+            samples.beta = csr_matrix((self._beta_data[:self._beta_nnz], self._beta_indices[:self._beta_nnz],
+                                       np.array(self._beta_indptr)), shape=(self._num_samples, self._beta_size))
         return samples
 
+    @cached_property
+    def _weighted_gamma(self):
+        if self.delta_gamma:
+            return self.samples.gamma.weighted_sum(self.weights)
+        return np.dot(self.samples.gamma.T, self.weights)
+
     @cached_property
     def weights(self):
         weights = self.samples.weight
@@ -33,11 +293,15 @@ class SimpleSampleContainer(object):
 
     @cached_property
     def beta(self):
-        return np.dot(self.samples.beta.T, self.weights)
+        return self.samples.beta.T.dot(self.weights)
+
+    @cached_property
+    def _beta_sq(self):
+        return self.samples.beta.power(2).T.dot(self.weights)
 
     @cached_property
     def beta_std(self):
-        return np.sqrt(np.dot(np.square(self.samples.beta.T), self.weights) - np.square(self.beta))
+        return np.sqrt(self._beta_sq - np.square(self.beta))
 
     @cached_property
     def log_nu(self):
@@ -69,121 +333,838 @@ class SimpleSampleContainer(object):
 
     @cached_property
     def conditional_beta(self):
-        divisor = np.dot(self.samples.gamma.T, self.weights)
+        divisor = self._weighted_gamma
         delta = self.beta.shape[0] - divisor.shape[0]
         divisor = np.concatenate([divisor, delta * [1.0]]) if delta > 0 else divisor
         return np.true_divide(self.beta, divisor, where=divisor != 0, out=np.zeros(self.beta.shape))
 
     @cached_property
     def conditional_beta_std(self):
-        divisor = np.dot(self.samples.gamma.T, self.weights)
+        divisor = self._weighted_gamma
         delta = self.beta.shape[0] - divisor.shape[0]
         divisor = np.concatenate([divisor, delta * [1.0]]) if delta > 0 else divisor
-        beta_sq = np.dot(np.square(self.samples.beta.T), self.weights)
-        beta_sq = np.true_divide(beta_sq, divisor, where=divisor != 0, out=np.zeros(self.beta.shape))
+        beta_sq = np.true_divide(self._beta_sq, divisor, where=divisor != 0, out=np.zeros(self.beta.shape))
         return np.sqrt(np.clip(beta_sq - np.square(self.conditional_beta), a_min=0.0, a_max=None))
 
 
+def _write_chunks(chunks, errors):
+    # runs in the background thread of a ChunkedSampleContainer until it receives None
+    while True:
+        item = chunks.get()
+        try:
+            if item is None:
+                return
+            path, arrays, compress = item
+            with open(path + ".tmp", "wb") as f:
+                (np.savez_compressed if compress else np.savez)(f, **arrays)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunks.task_done()
+
+
+class ChunkedSampleContainer(SimpleSampleContainer):
+    r"""
+    Class used to store MCMC samples on disk so that long MCMC runs can be stored in full even if they do not
+    fit in memory. Samples are buffered in chunks of `chunk_size` samples and each chunk is written to a
+    (compressed) `.npz` file `chunk-<index>.npz` in `directory` by a background thread, so that writing does not
+    block the MCMC chain. Within each chunk the inclusion indicators :math:`\gamma` are bit-packed and the
+    coefficients are stored in CSR form.
+
+    When `samples` is accessed the chunks are concatenated (one chunk at a time) into `.npy` files in `directory`,
+    which are memory-mapped. In this case `samples.gamma` is a :class:`PackedGamma` and `samples.beta` is a
+    `scipy.sparse.csr_matrix` whose arrays are memory-mapped.
+
+    :param str directory: The directory in which the samples are stored. It is created if it does not exist.
+    :param int chunk_size: The number of samples in each chunk. Defaults to 1000.
+    :param bool compress: Whether chunks are compressed with `np.savez_compressed`. Defaults to True.
+    """
+    # the maximum number of chunks that wait to be written; if writing is slower than sampling the chain waits
+    max_pending_chunks = 2
+
+    def __init__(self, directory, chunk_size=1000, compress=True):
+        super().__init__()
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer.")
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+
+        self._gamma_size = None
+        self._site_shapes = {}
+        self._chunk_sizes = []
+        self._chunk_nnz = []
+        self._buffer = []
+        self._writer = None
+        self._chunks = None
+        self._errors = []
+
+    def __call__(self, sample):
+        values = dict(sample.__dict__)
+        gamma = np.asarray(values.pop('gamma')).astype(bool)
+        self._gamma_size = gamma.shape[0]
+        values['gamma'] = np.packbits(gamma)
+        if 'beta' in values:
+            beta = np.asarray(values.pop('beta'))
+            self._beta_size = beta.shape[0]
+            values['beta_indices'] = np.flatnonzero(beta).astype(np.int32)
+            values['beta_data'] = beta[values['beta_indices']]
+        values = {site: np.asarray(value) for site, value in values.items() if value is not None}
+        if not self._site_shapes:
+            self._site_shapes = {site: (value.shape, value.dtype) for site, value in values.items()
+                                 if not site.startswith('beta_')}
+
+        self._buffer.append(values)
+        self._num_samples += 1
+        if len(self._buffer) == self.chunk_size:
+            self._write_chunk()
+
+    def _chunk_path(self, index):
+        return os.path.join(self.directory, "chunk-{:05d}.npz".format(index))
+
+    def _write_chunk(self):
+        if not self._buffer:
+            return
+        arrays = {site: np.stack([values[site] for values in self._buffer]) for site in self._site_shapes}
+        if self._beta_size is not None:
+            arrays['beta_data'] = np.concatenate([values['beta_data'] for values in self._buffer])
+            arrays['beta_indices'] = np.concatenate([values['beta_indices'] for values in self._buffer])
+            arrays['beta_indptr'] = np.cumsum([0] + [values['beta_data'].shape[0] for values in self._buffer])
+        self._buffer = []
+        self._enqueue(arrays)
+
+    def _enqueue(self, arrays):
+        self._raise_errors()
+        if self._writer is None:
+            self._chunks = queue.Queue(maxsize=self.max_pending_chunks)
+            self._writer = threading.Thread(target=_write_chunks, args=(self._chunks, self._errors), daemon=True)
+            self._writer.start()
+        self._chunks.put((self._chunk_path(len(self._chunk_sizes)), arrays, self.compress))
+        self._chunk_sizes.append(arrays['gamma'].shape[0])
+        self._chunk_nnz.append(arrays['beta_data'].shape[0] if 'beta_data' in arrays else 0)
+
+    def _raise_errors(self):
+        if self._errors:
+            error = self._errors[0]
+            self._errors.clear()
+            raise RuntimeError("Failed to write MCMC samples to {}.".format(self.directory)) from error
+
+    def flush(self):
+        """
+        Write all buffered samples to disk and wait until the background thread has finished writing.
+        """
+        self._write_chunk()
+        self._stop_writer()
+
+    def _stop_writer(self):
+        if self._writer is not None:
+            self._chunks.put(None)
+            self._writer.join()
+            self._writer, self._chunks = None, None
+        self._raise_errors()
+
+    def __getstate__(self):
+        # the background thread cannot be pickled, e.g. for a checkpoint, and memory-mapped samples are not copied
+        self._stop_writer()
+        return {name: value for name, value in self.__dict__.items()
+                if not isinstance(getattr(type(self), name, None), cached_property)}
+
+    def merge(self, other):
+        """
+        Merge the samples of another container (e.g. from an independent MCMC chain) into this container.
+        The chunks of `other` are copied into the directory of this container.
+        """
+        self._write_chunk()
+        other.flush()
+        for index in range(len(other._chunk_sizes)):
+            with np.load(other._chunk_path(index)) as chunk:
+                self._enqueue(dict(chunk))
+        self._num_samples += other._num_samples
+        self._site_shapes = self._site_shapes or other._site_shapes
+        self._gamma_size = other._gamma_size if self._gamma_size is None else self._gamma_size
+        self._beta_size = other._beta_size if self._beta_size is None else self._beta_size
+
+    def _open_column(self, site, shape, dtype):
+        path = os.path.join(self.directory, site + ".npy")
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    @cached_property
+    def samples(self):
+        self.flush()
+        T, nnz = sum(self._chunk_sizes), sum(self._chunk_nnz)
+        columns = {site: self._open_column(site, (T,) + shape, dtype) for site, (shape, dtype) in
+                   self._site_shapes.items()}
+        if self._beta_size is not None:
+            columns['beta_data'] = self._open_column('beta_data', (nnz,), np.float64)
+            columns['beta_indices'] = self._open_column('beta_indices', (nnz,), np.int32)
+            columns['beta_indptr'] = self._open_column('beta_indptr', (T + 1,), np.int64)
+            columns['beta_indptr'][0] = 0
+
+        # concatenate the chunks one at a time so that memory usage is bounded by the size of a chunk
+        start, start_nnz = 0, 0
+        for index, (size, chunk_nnz) in enumerate(zip(self._chunk_sizes, self._chunk_nnz)):
+            with np.load(self._chunk_path(index)) as chunk:
+                for site in self._site_shapes:
+                    columns[site][start:start + size] = chunk[site]
+                if self._beta_size is not None:
+                    columns['beta_data'][start_nnz:start_nnz + chunk_nnz] = chunk['beta_data']
+                    columns['beta_indices'][start_nnz:start_nnz + chunk_nnz] = chunk['beta_indices']
+                    columns['beta_indptr'][start + 1:start + size + 1] = start_nnz + chunk['beta_indptr'][1:]
+            start, start_nnz = start + size, start_nnz + chunk_nnz
+        for column in columns.values():
+            column.flush()
+        del columns
+
+        columns = {site: np.load(os.path.join(self.directory, site + ".npy"), mmap_mode='r')
+                   for site in self._site_shapes}
+        samples = SimpleNamespace(**columns)
+        if self._gamma_size is not None:
+            samples.gamma = PackedGamma(columns['gamma'], self._gamma_size)
+        if self._beta_size is not None:
+            beta = [np.load(os.path.join(self.directory, name + ".npy"), mmap_mode='r')
+                    for name in ['beta_data', 'beta_indices', 'beta_indptr']]
+            samples.beta = csr_matrix(tuple(beta), shape=(T, self._beta_size))
+        return samples
+
+    @cached_property
+    def _weighted_gamma(self):
+        return self.samples.gamma.weighted_sum(self.weights)
+
+
+def _kahan_add(total, compensation, value):
+    """
+    Add `value` to `total` with Kahan compensated summation and return the new total and compensation.
+    """
+    value = value - compensation
+    new_total = total + value
+    return new_total, (new_total - total) - value
+
+
+class CoinclusionAccumulator(object):
+    r"""
+    Sparse streaming accumulator of the weighted pairwise co-inclusion counts
+    :math:`\sum_t w_t \gamma_{ti} \gamma_{tj}` for :math:`i \le j`. Each update enumerates the pairs of
+    covariates in the active set of a sample, i.e. it requires O(k^2) time for k active covariates.
+    Pairs are buffered and periodically reduced into a sorted array of pair keys and weighted counts.
+    The buffer holds at most as many pairs as are stored (or `buffer_size` pairs).
+
+    If `max_pairs` is not None, only (roughly) the `max_pairs` pairs with the largest weighted counts are kept,
+    so that memory usage is bounded independently of P: whenever more than `2 * max_pairs` pairs are stored
+    the pairs with the smallest counts are discarded. The counts accumulated for a pair before it is
+    discarded are lost, i.e. the counts of the retained pairs are lower bounds.
+    The total weighted count that was discarded is reported in `pruned_weight`.
+
+    :param int num_covariates: The number of covariates P.
+    :param int max_pairs: The maximum number of pairs (including the pairs (i, i)) in the result. Defaults to
+        None, in which case all pairs are kept.
+    """
+    # the number of buffered pairs that triggers a reduction
+    buffer_size = 2 ** 16
+
+    def __init__(self, num_covariates, max_pairs=None):
+        if max_pairs is not None and (not isinstance(max_pairs, int) or max_pairs < 1):
+            raise ValueError("max_pairs must be a positive integer or None.")
+        self.num_covariates = num_covariates
+        self.max_pairs = max_pairs
+        self.pruned_weight = 0.0
+        self._keys = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0)
+        self._new_keys = []
+        self._new_weights = []
+        self._num_new = 0
+
+    def update(self, active, weight):
+        """
+        Add the pairs of the covariates in `active` (the indices of the included covariates of a sample)
+        with the given weight.
+        """
+        rows, cols = np.triu_indices(active.shape[0])
+        keys = active[rows].astype(np.int64) * self.num_covariates + active[cols]
+        self._new_keys.append(keys)
+        self._new_weights.append(np.full(keys.shape[0], weight, dtype=np.float64))
+        self._num_new += keys.shape[0]
+        # reducing requires O(number of stored pairs) time, so the buffer grows with the number of stored pairs
+        if self._num_new >= max(self.buffer_size, self._keys.shape[0]):
+            self._reduce()
+
+    def _reduce(self):
+        if not self._new_keys:
+            return
+        keys, inverse = np.unique(np.concatenate([self._keys] + self._new_keys), return_inverse=True)
+        self._keys = keys
+        self._counts = np.bincount(inverse.ravel(), weights=np.concatenate([self._counts] + self._new_weights))
+        self._new_keys, self._new_weights, self._num_new = [], [], 0
+        if self.max_pairs is not None and self._keys.shape[0] > 2 * self.max_pairs:
+            self.pruned_weight += self._prune()
+
+    def _top_pairs(self):
+        if self.max_pairs is None or self._keys.shape[0] <= self.max_pairs:
+            return self._keys, self._counts
+        keep = np.sort(np.argpartition(-self._counts, self.max_pairs - 1)[:self.max_pairs])
+        return self._keys[keep], self._counts[keep]
+
+    def _prune(self):
+        total = self._counts.sum()
+        self._keys, self._counts = self._top_pairs()
+        return total - self._counts.sum()
+
+    def merge(self, other):
+        """
+        Add the counts of another accumulator (e.g. from an independent MCMC chain) to this accumulator.
+        """
+        other._reduce()
+        self._new_keys.append(other._keys)
+        self._new_weights.append(other._counts)
+        self.pruned_weight += other.pruned_weight
+        self._reduce()
+
+    def matrix(self, total_weight):
+        """
+        Return the symmetric P x P `scipy.sparse.csr_matrix` of co-inclusion probabilities, i.e. the weighted
+        counts divided by `total_weight`. The diagonal holds the inclusion probabilities. If `max_pairs` is not
+        None the matrix contains at most `max_pairs` distinct pairs.
+        """
+        self._reduce()
+        keys, counts = self._top_pairs()
+        rows, cols = keys // self.num_covariates, keys % self.num_covariates
+        off_diagonal = rows != cols
+        rows, cols = np.concatenate([rows, cols[off_diagonal]]), np.concatenate([cols, rows[off_diagonal]])
+        values = np.concatenate([counts, counts[off_diagonal]]) / total_weight
+        P = self.num_covariates
+        return coo_matrix((values, (rows, cols)), shape=(P, P)).tocsr()
+
+
 class StreamingSampleContainer(object):
     """
     Class used to process MCMC samples and compute summary statistics.
     Instead of storing all MCMC samples in memory, summary statistics are computed online.
+
+    Samples are buffered in a fixed block of at most `max_block_size` samples. Once the block is full, each
+    weighted sum is updated with a single matrix-vector product with the weights of the block, and the sums are
+    accumulated in double precision with Kahan compensated summation so that the estimates do not drift
+    over long runs. The weights are summarized by their exact moments and a uniform reservoir sample of at most
+    `reservoir_size` weights, see `weight_moments` and `weight_reservoir`.
+
+    If `num_batches` is not None, the Monte Carlo standard errors (MCSE) of the PIP and coefficient estimates
+    are estimated with batch means, see `pip_mcse` and `beta_mcse`. Samples are grouped into consecutive batches
+    of `batch_size` samples. Whenever `2 * num_batches` batches are complete, adjacent batches are combined and
+    the batch size is doubled, so that memory usage is bounded and the batch size grows with the number of samples.
+
+    If `coinclusion` is True, the pairwise co-inclusion probabilities of the covariates are accumulated with a
+    :class:`CoinclusionAccumulator` from the active set of each sample, see `coinclusion`.
+
+    :param int num_batches: The minimum number of batches used to estimate MCSEs. Defaults to None, in which
+        case MCSEs are not estimated.
+    :param int batch_size: The initial number of samples in each batch. Defaults to 10.
+    :param bool coinclusion: Whether to accumulate pairwise co-inclusion probabilities. Defaults to False.
+    :param int max_pairs: If not None, at most (roughly) this many pairs of covariates with the largest
+        co-inclusion probabilities are kept, see :class:`CoinclusionAccumulator`. Defaults to None.
     """
-    def __init__(self):
-        self._num_samples = 0.0
-        self._weight_sum = 0.0
-        self._weights = []
+    max_block_size = 64
+    # the block size is reduced for large P so that each block holds at most this many elements per site
+    max_block_elements = 2 ** 20
+    reservoir_size = 10000
+
+    def __init__(self, num_batches=None, batch_size=10, coinclusion=False, max_pairs=None):
+        if max_pairs is not None and (not isinstance(max_pairs, int) or max_pairs < 1):
+            raise ValueError("max_pairs must be a positive integer or None.")
+        self._num_samples = 0
+        self._sums = {}
+        self._compensations = {}
+        self._block = None
+        self._block_weights = None
+        self._block_count = 0
+
+        self._weight_sum_sq = 0.0
+        self._weight_min = np.inf
+        self._weight_max = -np.inf
+        self._reservoir = np.empty(self.reservoir_size)
+        self._rng = np.random.default_rng(0)
+        self._track_coinclusion = coinclusion
+        self._max_pairs = max_pairs
+        self._coinclusion = None
+
+        self._num_batches = num_batches
+        if num_batches is not None:
+            if num_batches < 2:
+                raise ValueError("num_batches must be at least 2.")
+            self._batch_size = batch_size
+            self._batches = []
+            self._current_batch = None
 
     def __call__(self, sample):
-        self._weight_sum += sample.weight
-        self._num_samples += 1.0
-        self._weights.append(sample.weight)
-
-        if self._num_samples == 1.0:
-            self._pip = sample.add_prob * sample.weight
-            self._beta = sample.beta * sample.weight
-            self._beta_sq = np.square(sample.beta) * sample.weight
-            self._gamma = sample.gamma * sample.weight
-            if hasattr(sample, 'log_nu'):
-                self._log_nu = sample.log_nu * sample.weight
-                self._log_nu_sq = np.square(sample.log_nu) * sample.weight
-                self._nu = np.exp(sample.log_nu) * sample.weight
-                self._nu_sq = np.exp(2.0 * sample.log_nu) * sample.weight
-            if hasattr(sample, 'h_alpha'):
-                self._h_alpha = sample.h_alpha * sample.weight
-                self._h_beta = sample.h_beta * sample.weight
-                self._h = (sample.h_alpha / (sample.h_alpha + sample.h_beta)) * sample.weight
+        if self._block is None:
+            self._allocate_block(sample)
+        i = self._block_count
+        self._block_weights[i] = sample.weight
+        for site, block in self._block.items():
+            block[i] = getattr(sample, site)
+        self._block_count += 1
+        if self._block_count == self._block_weights.shape[0]:
+            self._flush()
+
+    def _allocate_block(self, sample):
+        sites = ['add_prob', 'beta', 'gamma', 'log_nu', 'h_alpha', 'h_beta']
+        shapes = {site: np.shape(getattr(sample, site)) for site in sites if getattr(sample, site, None) is not None}
+        block_size = max(1, min(self.max_block_size, self.max_block_elements // max(shapes['beta'] + (1,))))
+        self._block = {site: np.zeros((block_size,) + shape) for site, shape in shapes.items()}
+        self._block_weights = np.zeros(block_size)
+        self._allocate_coinclusion(shapes['gamma'][0])
+
+    def _allocate_coinclusion(self, num_covariates):
+        if self._track_coinclusion and self._coinclusion is None:
+            self._coinclusion = CoinclusionAccumulator(num_covariates, max_pairs=self._max_pairs)
+
+    def _accumulate(self, name, value):
+        if name not in self._sums:
+            self._sums[name], self._compensations[name] = value, np.zeros_like(value)
+        else:
+            self._sums[name], self._compensations[name] = _kahan_add(self._sums[name], self._compensations[name],
+                                                                     value)
+
+    def _flush(self):
+        """
+        Fold the buffered samples into the weighted sums.
+        """
+        n = self._block_count
+        if n == 0:
+            return
+        weights = self._block_weights[:n]
+        block = {site: values[:n] for site, values in self._block.items()}
+        self._accumulate('weight', weights.sum())
+        self._accumulate('add_prob', weights @ block['add_prob'])
+        self._accumulate('beta', weights @ block['beta'])
+        self._accumulate('beta_sq', weights @ np.square(block['beta']))
+        self._accumulate('gamma', weights @ block['gamma'])
+        if 'log_nu' in block:
+            self._accumulate('log_nu', weights @ block['log_nu'])
+            self._accumulate('log_nu_sq', weights @ np.square(block['log_nu']))
+            self._accumulate('nu', weights @ np.exp(block['log_nu']))
+            self._accumulate('nu_sq', weights @ np.exp(2.0 * block['log_nu']))
+        if 'h_alpha' in block:
+            self._accumulate('h_alpha', weights @ block['h_alpha'])
+            self._accumulate('h_beta', weights @ block['h_beta'])
+            self._accumulate('h', weights @ (block['h_alpha'] / (block['h_alpha'] + block['h_beta'])))
+        if self._num_batches is not None:
+            self._update_batches(weights, block['add_prob'], block['beta'])
+        if self._coinclusion is not None:
+            for weight, gamma in zip(weights, block['gamma']):
+                self._coinclusion.update(np.flatnonzero(gamma), weight)
+        self._update_weight_stats(weights)
+        self._num_samples += n
+        self._block_count = 0
+
+    def _update_weight_stats(self, weights):
+        self._weight_sum_sq += np.square(weights).sum()
+        self._weight_min = min(self._weight_min, weights.min())
+        self._weight_max = max(self._weight_max, weights.max())
+        # reservoir sampling (algorithm R)
+        for i, weight in enumerate(weights):
+            t = self._num_samples + i
+            if t < self.reservoir_size:
+                self._reservoir[t] = weight
+            else:
+                j = self._rng.integers(0, t + 1)
+                if j < self.reservoir_size:
+                    self._reservoir[j] = weight
+
+    def merge(self, other):
+        """
+        Merge the running statistics of another container (e.g. from an independent MCMC chain) into this
+        container. The result is identical (up to floating point error) to streaming the samples of both
+        containers into a single container, except that the weight reservoir is only statistically equivalent.
+        """
+        self._flush()
+        other._flush()
+        if other._num_samples == 0:
+            return
+        num_samples = self._num_samples + other._num_samples
+        for name, value in other._sums.items():
+            self._accumulate(name, value)
+            self._compensations[name] = self._compensations[name] + other._compensations[name]
+
+        # merge the reservoirs such that the result remains a uniform sample of all weights
+        reservoir, other_reservoir = self.weight_reservoir, other.weight_reservoir
+        if num_samples <= self.reservoir_size:
+            self._reservoir[self._num_samples:num_samples] = other_reservoir
         else:
-            factor = 1.0 - 1.0 / self._num_samples
-            self._pip = factor * self._pip + (sample.add_prob * sample.weight) / self._num_samples
-            self._beta = factor * self._beta + (sample.beta * sample.weight) / self._num_samples
-            self._beta_sq = factor * self._beta_sq + (np.square(sample.beta) * sample.weight) / self._num_samples
-            self._gamma = factor * self._gamma + (sample.gamma * sample.weight) / self._num_samples
-            if hasattr(sample, 'log_nu'):
-                self._log_nu = factor * self._log_nu + (sample.log_nu * sample.weight) / self._num_samples
-                self._log_nu_sq = factor * self._log_nu_sq +\
-                    (np.square(sample.log_nu) * sample.weight) / self._num_samples
-                self._nu = factor * self._nu + (np.exp(sample.log_nu) * sample.weight) / self._num_samples
-                self._nu_sq = factor * self._nu_sq + (np.exp(2.0 * sample.log_nu) * sample.weight) / self._num_samples
-            if hasattr(sample, 'h_alpha'):
-                self._h_alpha = factor * self._h_alpha + (sample.h_alpha * sample.weight) / self._num_samples
-                self._h_beta = factor * self._h_beta + (sample.h_beta * sample.weight) / self._num_samples
-                h_alpha_beta = sample.h_alpha / (sample.h_alpha + sample.h_beta)
-                self._h = factor * self._h + h_alpha_beta * sample.weight / self._num_samples
-
-    @cached_property
-    def _normalizer(self):
-        return self._num_samples / self._weight_sum
+            num_self = self._rng.hypergeometric(self._num_samples, other._num_samples, self.reservoir_size)
+            num_self = min(num_self, reservoir.shape[0])
+            num_other = min(self.reservoir_size - num_self, other_reservoir.shape[0])
+            self._reservoir[:num_self + num_other] = np.concatenate(
+                [self._rng.choice(reservoir, num_self, replace=False),
+                 self._rng.choice(other_reservoir, num_other, replace=False)])
+
+        self._num_samples = num_samples
+        self._weight_sum_sq += other._weight_sum_sq
+        self._weight_min = min(self._weight_min, other._weight_min)
+        self._weight_max = max(self._weight_max, other._weight_max)
+        if self._num_batches is not None and other._num_batches is not None:
+            # batches of independent chains are independent, so they can be pooled even if their sizes differ
+            self._batches.extend(other._batches)
+        self._merge_coinclusion(other)
+
+    def _merge_coinclusion(self, other):
+        if other._coinclusion is not None:
+            self._allocate_coinclusion(other._coinclusion.num_covariates)
+        if self._coinclusion is not None and other._coinclusion is not None:
+            self._coinclusion.merge(other._coinclusion)
+
+    def _update_batches(self, weights, add_prob, beta):
+        # each batch consists of the number of samples and the weighted sums of the weights, PIPs and coefficients
+        start = 0
+        while start < weights.shape[0]:
+            if self._current_batch is None:
+                self._current_batch = [0, 0.0, 0.0, 0.0]
+            batch = self._current_batch
+            stop = min(weights.shape[0], start + self._batch_size - batch[0])
+            batch_weights = weights[start:stop]
+            batch[0] += stop - start
+            batch[1] = batch[1] + batch_weights.sum()
+            batch[2] = batch[2] + batch_weights @ add_prob[start:stop]
+            batch[3] = batch[3] + batch_weights @ beta[start:stop]
+            start = stop
+            if batch[0] < self._batch_size:
+                continue
+            self._batches.append(tuple(batch[1:]))
+            self._current_batch = None
+            if len(self._batches) == 2 * self._num_batches:
+                self._batches = [tuple(x + y for x, y in zip(b1, b2))
+                                 for b1, b2 in zip(self._batches[::2], self._batches[1::2])]
+                self._batch_size *= 2
+
+    def _batch_means_mcse(self, index):
+        # the estimates are ratios of weighted sums, so we use the batch means variance estimator of a ratio
+        # estimator: the MCSE of R = sum_k A_k / sum_k W_k is estimated from the residuals A_k - R W_k
+        if self._num_batches is None:
+            return None
+        self._flush()
+        num_batches = len(self._batches)
+        if num_batches < self._num_batches:
+            return np.full(self._sums['add_prob' if index == 1 else 'beta'].shape, np.inf)
+        weights = np.array([batch[0] for batch in self._batches])
+        sums = np.stack([batch[index] for batch in self._batches])
+        ratio = sums.sum(0) / weights.sum()
+        residuals = sums - weights[:, None] * ratio
+        variance = np.square(residuals).sum(0) / (num_batches * (num_batches - 1))
+        return np.sqrt(variance) / weights.mean()
+
+    @property
+    def pip_mcse(self):
+        """
+        The batch means estimate of the Monte Carlo standard error of each PIP. Before `num_batches`
+        batches are complete this is infinite. None if the container was created with `num_batches=None`.
+        """
+        return self._batch_means_mcse(1)
+
+    @property
+    def beta_mcse(self):
+        """
+        The batch means estimate of the Monte Carlo standard error of each coefficient.
+        See `pip_mcse`.
+        """
+        return self._batch_means_mcse(2)
+
+    @property
+    def weight_reservoir(self):
+        """
+        A uniform sample of (at most `reservoir_size`) weights of the samples.
+        """
+        self._flush()
+        return self._reservoir[:min(self._num_samples, self.reservoir_size)]
+
+    @property
+    def weight_moments(self):
+        """
+        The exact mean, standard deviation, minimum and maximum of the weights of the samples.
+        """
+        self._flush()
+        mean = self._sums['weight'] / self._num_samples
+        std = np.sqrt(max(self._weight_sum_sq / self._num_samples - mean ** 2, 0.0))
+        return mean, std, self._weight_min, self._weight_max
+
+    @property
+    def coinclusion(self):
+        r"""
+        The symmetric P x P `scipy.sparse.csr_matrix` of the co-inclusion probabilities
+        :math:`p(\gamma_i = 1, \gamma_j = 1)`, whose diagonal holds the inclusion probabilities estimated
+        from :math:`\gamma` (rather than the Rao-Blackwellized `pip`). None if the container was created with
+        `coinclusion=False`.
+        """
+        self._flush()
+        if self._coinclusion is None:
+            return None
+        return self._coinclusion.matrix(self._sums['weight'].item())
+
+    def _mean(self, name):
+        self._flush()
+        if name not in self._sums:
+            # e.g. samples without log_nu, so that hasattr(container, 'nu') is False
+            raise AttributeError(name)
+        return self._sums[name] / self._sums['weight']
 
     @cached_property
     def pip(self):
-        return self._normalizer * self._pip
+        return self._mean('add_prob')
 
     @cached_property
     def beta(self):
-        return self._normalizer * self._beta
+        return self._mean('beta')
 
     @cached_property
     def beta_std(self):
-        return np.sqrt(self._normalizer * self._beta_sq - np.square(self.beta))
+        return np.sqrt(self._mean('beta_sq') - np.square(self.beta))
 
     @cached_property
     def log_nu(self):
-        return self._normalizer * self._log_nu
+        return self._mean('log_nu').item()
 
     @cached_property
     def log_nu_std(self):
-        return np.sqrt(self._normalizer * self._log_nu_sq - self.log_nu ** 2).item()
+        return np.sqrt(self._mean('log_nu_sq') - self.log_nu ** 2).item()
 
     @cached_property
     def nu(self):
-        return (self._normalizer * self._nu).item()
+        return self._mean('nu').item()
 
     @cached_property
     def nu_std(self):
-        return np.sqrt(self._normalizer * self._nu_sq - self.nu ** 2).item()
+        return np.sqrt(self._mean('nu_sq') - self.nu ** 2).item()
 
     @cached_property
     def h_alpha(self):
-        return self._normalizer * self._h_alpha
+        return self._mean('h_alpha').item()
 
     @cached_property
     def h_beta(self):
-        return self._normalizer * self._h_beta
+        return self._mean('h_beta').item()
 
     @cached_property
     def h(self):
-        return self._normalizer * self._h
+        return self._mean('h').item()
+
+    @cached_property
+    def _conditional_divisor(self):
+        # assumed covariates are always included
+        self._flush()
+        delta = self._sums['beta'].shape[0] - self._sums['gamma'].shape[0]
+        gamma = self._sums['gamma']
+        return np.concatenate([gamma, delta * [self._sums['weight']]]) if delta > 0 else gamma
 
     @cached_property
     def conditional_beta(self):
-        delta = self._beta.shape[0] - self._gamma.shape[0]
-        gamma = np.concatenate([self._gamma, delta * [1.0 / self._normalizer]]) if delta > 0 else self._gamma
-        return np.true_divide(self._beta, gamma, where=gamma != 0, out=np.zeros(self._beta.shape))
+        divisor = self._conditional_divisor
+        return np.true_divide(self._sums['beta'], divisor, where=divisor != 0, out=np.zeros(divisor.shape))
 
     @cached_property
     def conditional_beta_std(self):
-        delta = self._beta.shape[0] - self._gamma.shape[0]
-        gamma = np.concatenate([self._gamma, delta * [1.0 / self._normalizer]]) if delta > 0 else self._gamma
-        beta_sq = np.true_divide(self._beta_sq, gamma, where=gamma != 0, out=np.zeros(self._beta.shape))
+        divisor = self._conditional_divisor
+        beta_sq = np.true_divide(self._sums['beta_sq'], divisor, where=divisor != 0, out=np.zeros(divisor.shape))
         return np.sqrt(np.clip(beta_sq - np.square(self.conditional_beta), a_min=0.0, a_max=None))
+
+
+class TorchStreamingSampleContainer(StreamingSampleContainer):
+    """
+    Variant of :class:`StreamingSampleContainer` that accepts the samples of an MCMC sampler as is, i.e. as
+    torch tensors, and whose accumulators are double precision torch tensors on the device of the samples.
+
+    The weighted sums of a block of at most `max_block_size` samples are updated in place with fused operations
+    (e.g. `addcmul_`) and folded into the running sums with Kahan compensated summation once the block is full.
+    The moments of the weights and a uniform reservoir sample of at most `reservoir_size` weights are also kept on
+    the device, so that processing a sample requires neither a device synchronization nor a copy to the host.
+    The accumulators are copied to numpy only when the summary statistics are accessed, e.g. once at the end of
+    an MCMC run. If `coinclusion` is True, the inclusion indicators of each block are buffered on the device
+    and the active sets are copied to the host once per block.
+
+    :param int num_batches: See :class:`StreamingSampleContainer`.
+    :param int batch_size: See :class:`StreamingSampleContainer`.
+    :param bool coinclusion: See :class:`StreamingSampleContainer`. Defaults to False.
+    :param int max_pairs: See :class:`StreamingSampleContainer`. Defaults to None.
+    """
+    def __init__(self, num_batches=None, batch_size=10, coinclusion=False, max_pairs=None):
+        super().__init__(num_batches=num_batches, batch_size=batch_size, coinclusion=coinclusion,
+                         max_pairs=max_pairs)
+        self._device_sums = {}
+        self._device_compensations = {}
+        self._device_block = None
+        self._device_block_count = 0
+        self._device_batches = []
+        self._device_batch = None
+        self._stale = False
+
+    def __call__(self, sample):
+        if not self._device_sums:
+            self._allocate(self._sample_shapes(sample), sample.weight.device)
+        weight = sample.weight.to(torch.float64)
+        i = self._device_block_count
+        block = self._device_block
+        block['weight'].add_(weight)
+        block['add_prob'].addcmul_(sample.add_prob, weight)
+        block['beta'].addcmul_(sample.beta, weight)
+        block['beta_sq'].addcmul_(sample.beta.square(), weight)
+        block['gamma'].addcmul_(sample.gamma, weight)
+        if 'log_nu' in block:
+            block['log_nu'].addcmul_(sample.log_nu, weight)
+            block['log_nu_sq'].addcmul_(sample.log_nu.square(), weight)
+            block['nu'].addcmul_(sample.log_nu.exp(), weight)
+            block['nu_sq'].addcmul_((2.0 * sample.log_nu).exp(), weight)
+        if 'h_alpha' in block:
+            block['h_alpha'].addcmul_(sample.h_alpha, weight)
+            block['h_beta'].addcmul_(sample.h_beta, weight)
+            block['h'].addcmul_(sample.h_alpha / (sample.h_alpha + sample.h_beta), weight)
+        if self._num_batches is not None:
+            self._update_device_batches(sample, weight)
+        self._device_block_weights[i] = weight
+        if self._coinclusion is not None:
+            self._device_block_gamma[i] = sample.gamma
+        self._device_block_count += 1
+        self._stale = True
+        if self._device_block_count == self.max_block_size:
+            self._fold_block()
+
+    @staticmethod
+    def _sample_shapes(sample):
+        shapes = {'weight': sample.weight.shape, 'add_prob': sample.add_prob.shape, 'beta': sample.beta.shape,
+                  'beta_sq': sample.beta.shape, 'gamma': sample.gamma.shape}
+        if getattr(sample, 'log_nu', None) is not None:
+            shapes.update({name: sample.log_nu.shape for name in ['log_nu', 'log_nu_sq', 'nu', 'nu_sq']})
+        if getattr(sample, 'h_alpha', None) is not None:
+            shapes.update({name: sample.h_alpha.shape for name in ['h_alpha', 'h_beta', 'h']})
+        return shapes
+
+    def _allocate(self, shapes, device):
+        def zeros(shape=()):
+            return torch.zeros(shape, dtype=torch.float64, device=device)
+
+        self._device_sums = {name: zeros(shape) for name, shape in shapes.items()}
+        self._device_compensations = {name: zeros(shape) for name, shape in shapes.items()}
+        self._device_block = {name: zeros(shape) for name, shape in shapes.items()}
+        self._device_block_weights = zeros(self.max_block_size)
+        self._device_weight_sum_sq = zeros()
+        self._device_weight_min = torch.full((), np.inf, dtype=torch.float64, device=device)
+        self._device_weight_max = torch.full((), -np.inf, dtype=torch.float64, device=device)
+        self._device_reservoir = zeros(self.reservoir_size)
+        # the winning position within a block of each reservoir slot, see _update_device_reservoir
+        self._device_reservoir_winners = torch.full((self.reservoir_size,), -1, dtype=torch.int64, device=device)
+        # a separate generator so that the random number stream of the MCMC chain is not affected
+        self._generator = torch.Generator(device=device)
+        self._generator.manual_seed(0)
+        self._allocate_coinclusion(shapes['gamma'][0])
+        if self._coinclusion is not None:
+            self._device_block_gamma = torch.zeros((self.max_block_size,) + shapes['gamma'], dtype=torch.bool,
+                                                   device=device)
+
+    def _update_device_batches(self, sample, weight):
+        if self._device_batch is None:
+            self._device_batch = [0, torch.zeros_like(self._device_sums['weight']),
+                                  torch.zeros_like(self._device_sums['add_prob']),
+                                  torch.zeros_like(self._device_sums['beta'])]
+        batch = self._device_batch
+        batch[0] += 1
+        batch[1].add_(weight)
+        batch[2].addcmul_(sample.add_prob, weight)
+        batch[3].addcmul_(sample.beta, weight)
+        if batch[0] < self._batch_size:
+            return
+        self._device_batches.append(tuple(batch[1:]))
+        self._device_batch = None
+        if len(self._device_batches) == 2 * self._num_batches:
+            self._device_batches = [tuple(x + y for x, y in zip(b1, b2))
+                                    for b1, b2 in zip(self._device_batches[::2], self._device_batches[1::2])]
+            self._batch_size *= 2
+
+    def _fold_block(self):
+        """
+        Fold the weighted sums and the weights of the current block into the running statistics.
+        """
+        n = self._device_block_count
+        if n == 0:
+            return
+        for name, value in self._device_block.items():
+            self._device_sums[name], self._device_compensations[name] = _kahan_add(
+                self._device_sums[name], self._device_compensations[name], value)
+            value.zero_()
+
+        weights = self._device_block_weights[:n]
+        self._device_weight_sum_sq += weights.square().sum()
+        self._device_weight_min = torch.minimum(self._device_weight_min, weights.min())
+        self._device_weight_max = torch.maximum(self._device_weight_max, weights.max())
+        self._update_device_reservoir(weights)
+        if self._coinclusion is not None:
+            # a single copy of the active sets and weights of all samples in the block
+            rows, cols = (x.cpu().numpy() for x in torch.nonzero(self._device_block_gamma[:n], as_tuple=True))
+            splits = np.searchsorted(rows, np.arange(1, n))
+            for weight, active in zip(weights.cpu().numpy(), np.split(cols, splits)):
+                self._coinclusion.update(active, weight)
+        self._num_samples += n
+        self._device_block_count = 0
+
+    def _update_device_reservoir(self, weights):
+        # reservoir sampling (algorithm R) for a block of weights: the t-th weight replaces the j-th weight of
+        # the reservoir if j < reservoir_size, where j is uniform on {0, ..., t}
+        n, size = weights.shape[0], self.reservoir_size
+        t = torch.arange(self._num_samples, self._num_samples + n, device=weights.device)
+        u = torch.rand(n, dtype=torch.float64, device=weights.device, generator=self._generator)
+        j = torch.where(t < size, t, (u * (t + 1)).long())
+        j, i = j[j < size], torch.arange(n, device=weights.device)[j < size]
+        # if several weights of the block replace the same slot, the last one wins as in sequential sampling
+        self._device_reservoir_winners.scatter_reduce_(0, j, i, reduce='amax')
+        self._device_reservoir[j] = weights[self._device_reservoir_winners[j]]
+        self._device_reservoir_winners[j] = -1
+
+    def _flush(self):
+        """
+        Copy the accumulators to numpy so that the summary statistics of :class:`StreamingSampleContainer`
+        can be computed.
+        """
+        if not self._stale:
+            return
+        self._fold_block()
+        self._sums = {name: value.cpu().numpy() for name, value in self._device_sums.items()}
+        self._compensations = {name: value.cpu().numpy() for name, value in self._device_compensations.items()}
+        self._batches = [tuple(x.cpu().numpy() for x in batch) for batch in self._device_batches]
+        self._weight_sum_sq = self._device_weight_sum_sq.item()
+        self._weight_min, self._weight_max = self._device_weight_min.item(), self._device_weight_max.item()
+        self._reservoir = self._device_reservoir.cpu().numpy().copy()
+        self._stale = False
+
+    def _load_host_statistics(self):
+        # the inverse of _flush, e.g. after statistics were merged on the host
+        device = self._device_reservoir.device
+
+        def tensor(value):
+            return torch.as_tensor(value, dtype=torch.float64, device=device)
+
+        self._device_sums = {name: tensor(value) for name, value in self._sums.items()}
+        self._device_compensations = {name: tensor(value) for name, value in self._compensations.items()}
+        self._device_batches = [tuple(tensor(x) for x in batch) for batch in self._batches]
+        self._device_weight_sum_sq = tensor(self._weight_sum_sq)
+        self._device_weight_min, self._device_weight_max = tensor(self._weight_min), tensor(self._weight_max)
+        self._device_reservoir = tensor(self._reservoir)
+
+    def merge(self, other):
+        """
+        Merge the accumulators of another container (e.g. from an independent MCMC chain) into this container.
+        Merging happens on the host, see :meth:`StreamingSampleContainer.merge`.
+        """
+        if other._num_samples + other._device_block_count == 0:
+            return
+        if not self._device_sums:
+            shapes = {name: value.shape for name, value in other._device_sums.items()}
+            self._allocate(shapes, other._device_reservoir.device)
+        self._stale = True
+        super().merge(other)
+        self._load_host_statistics()
+
+
+def reopen_container(container):
+    """
+    Discard the cached summary statistics of a container so that more samples can be added to it,
+    e.g. when an MCMC run is resumed from a checkpoint.
+    """
+    for cls in type(container).__mro__:
+        for name, attr in vars(cls).items():
+            if isinstance(attr, cached_property):
+                container.__dict__.pop(name, None)
@@ -1,21 +1,112 @@
 import math
+from functools import lru_cache
 from types import SimpleNamespace
 
 import torch
-from torch import einsum, matmul, sigmoid
+from torch import cholesky_solve as chosolve
+from torch import einsum, sigmoid
 from torch.distributions import Beta, Categorical
 from torch.linalg import norm
 from torch.linalg import solve_triangular as trisolve
 
 from .sampler import MCMCSampler
 from .util import (
-    get_loo_inverses,
-    leave_one_out,
-    leave_one_out_off_diagonal,
+    DesignMatrix,
+    GramColumnCache,
+    SamplerProfile,
+    as_design_matrix,
+    cholesky_delete,
+    cholesky_insert,
+    get_loo_quadratic_forms,
+    map_shards,
     safe_cholesky,
+    tiled_column_norms_sq,
+    tiled_rmatmat,
+    upcast_column_norms_sq,
+    upcast_gram,
+    upcast_rmatmat,
 )
 
 
+def _normal_probs_kernel(Z, XX_diag, gamma, active, Z_active, L_active, XXt_active, log_h_ratio,
+                         YY, tau, epsilon, N_nu0, explore, prior, c_one_c, log_one_c_sqrt):
+    """
+    Computes the log odds, add probabilities and (unnormalized) i_probs of all P covariates for the
+    Normal likelihood without any data-dependent control flow or shapes so that it can be traced by
+    `torch.compile`. The active set is padded to a fixed bucket size K (see `NormalLikelihoodSampler._pad_active`):
+    `active` contains the K indices of the active covariates padded with the dummy index P, and
+    `Z_active`, `L_active` and `XXt_active` are padded such that padding entries do not contribute.
+    """
+    P, K = gamma.size(-1), active.size(-1)
+    Zt_active = trisolve(L_active, Z_active.unsqueeze(-1), upper=False).squeeze(-1)
+    Zt_active_sq = Zt_active.pow(2.0).sum()
+
+    # quantities for all covariates; for active covariates these are overwritten below
+    XXt_k_active = XXt_active[:P]
+    G_k_inv = XX_diag[:P] + tau - XXt_k_active.pow(2.0).sum(-1)
+    W_k = torch.mv(XXt_k_active, Zt_active) - Z[:P]
+    W_k_sq = W_k.pow(2.0) / (G_k_inv + epsilon)
+
+    F = torch.cholesky_inverse(L_active, upper=False)
+    Zt_active_loo_sq, F_diag = get_loo_quadratic_forms(F, Z_active)
+    Zt_active_loo_sq, F_diag = Zt_active_loo_sq[:K], F_diag[:K]
+    log_h_ratio_active = log_h_ratio[active.clamp(max=P - 1)] if log_h_ratio.ndim > 0 else log_h_ratio
+
+    if prior == 'gprior':
+        log_S_ratio = -torch.log1p(-c_one_c * W_k_sq / (YY - c_one_c * Zt_active_sq))
+        log_odds_inactive = log_h_ratio - log_one_c_sqrt + 0.5 * N_nu0 * log_S_ratio
+        log_S_ratio = torch.log(YY - c_one_c * Zt_active_loo_sq) - torch.log(YY - c_one_c * Zt_active_sq)
+        log_odds_active = log_h_ratio_active - log_one_c_sqrt + 0.5 * N_nu0 * log_S_ratio
+    else:
+        half_log_tau = 0.5 * math.log(tau)
+        log_S_ratio = -torch.log1p(-W_k_sq / (YY - Zt_active_sq))
+        log_odds_inactive = log_h_ratio - 0.5 * G_k_inv.log() + half_log_tau + 0.5 * N_nu0 * log_S_ratio
+        log_S_ratio = (YY - Zt_active_loo_sq).log() - (YY - Zt_active_sq).log()
+        log_odds_active = log_h_ratio_active + 0.5 * F_diag.log() + half_log_tau + 0.5 * N_nu0 * log_S_ratio
+
+    # padding entries are written to the dummy entry P, which is dropped
+    log_odds = torch.cat([log_odds_inactive, log_odds_inactive.new_zeros(1)])
+    log_odds = log_odds.index_put((active,), log_odds_active)[:P]
+
+    add_prob = sigmoid(log_odds)
+    gamma = gamma.type_as(add_prob)
+    prob_gamma_i = gamma * add_prob + (1.0 - gamma) * (1.0 - add_prob)
+    i_prob = 0.5 * (add_prob + explore) / (prob_gamma_i + epsilon)
+    return add_prob, i_prob
+
+
+class _CompiledProbsKernel(object):
+    """
+    Wraps `torch.compile(_normal_probs_kernel)`. Each bucket of active set sizes (and e.g. each dtype) requires a
+    separate specialization, so the recompilation limit of dynamo is raised to `max_compiled_kernels`, but only
+    while a call with new argument shapes may trigger a compilation. This avoids patching the config on every
+    call, which would add noticeable per-call overhead, as well as changing the process-wide config.
+    """
+    def __init__(self, backend, max_compiled_kernels):
+        self.kernel = torch.compile(_normal_probs_kernel, backend=backend, dynamic=False)
+        self.max_compiled_kernels = max_compiled_kernels
+        self._specializations = set()
+
+    def __call__(self, *args):
+        key = tuple((arg.shape, arg.dtype, arg.device) if torch.is_tensor(arg) else arg for arg in args)
+        if key in self._specializations:
+            return self.kernel(*args)
+        # the recompilation limit was called cache_size_limit in older versions of torch
+        name = 'recompile_limit' if hasattr(torch._dynamo.config, 'recompile_limit') else 'cache_size_limit'
+        recompile_limit = max(getattr(torch._dynamo.config, name), self.max_compiled_kernels)
+        with torch._dynamo.config.patch(**{name: recompile_limit}):
+            result = self.kernel(*args)
+        self._specializations.add(key)
+        return result
+
+
+@lru_cache(maxsize=None)
+def _get_compiled_probs_kernel(backend, max_compiled_kernels):
+    # compiled kernels are shared by all samplers in a process; with the default inductor backend
+    # the generated code is additionally cached on disk (see TORCHINDUCTOR_CACHE_DIR) and reused across runs
+    return _CompiledProbsKernel(backend, max_compiled_kernels)
+
+
 class NormalLikelihoodSampler(MCMCSampler):
     r"""
     MCMC sampler for Bayesian variable selection for a linear model with a Normal likelihood.
@@ -70,7 +161,24 @@ class NormalLikelihoodSampler(MCMCSampler):
     Usage of this class is only recommended for advanced users. For most users it should
     suffice to use :class:`NormalLikelihoodVariableSelector`.
 
-    :param tensor X: A N x P `torch.Tensor` of covariates.
+    Since each MCMC move adds or removes at most one covariate, the Cholesky factor of the
+    (regularized) Gram matrix of the active covariates is carried from one iteration to the next
+    and updated with O(k^2) row/column insertions and deletions, where k is the number of active
+    covariates. Likewise the P x k matrix of whitened cross-products :math:`X^{\rm T} X_\gamma L^{-T}` between
+    all covariates and the active covariates is updated by adding or removing a single column, so that the
+    add probabilities of all inactive covariates can be computed in O(P k) time. Only adding a covariate
+    requires a product with :math:`X^{\rm T}` (or a column of :math:`X^{\rm T} X`). To guard
+    against the accumulation of numerical error the factorization is recomputed from scratch every
+    `refactorize_frequency` updates or whenever an update fails.
+
+    If only the summary statistics :math:`X^{\rm T} X`, :math:`X^{\rm T} Y`, :math:`Y^{\rm T} Y` and :math:`N`
+    are available use :meth:`from_sufficient_statistics` to construct the sampler.
+
+    :param tensor X: A N x P `torch.Tensor` of covariates. If `X` is a sparse tensor (COO, CSR or CSC layout)
+        it is never densified: memory usage and the cost of all products involving `X` then scale with the
+        number of non-zero elements. If `X` is a (memory-mapped) numpy array or the path to a .npy file it is
+        never loaded into memory in full: all reductions over the rows of `X` are evaluated in chunks and only
+        the columns of active covariates are kept in memory. See :class:`~millipede.util.MemmapDesignMatrix`.
     :param tensor Y: A N-dimensional `torch.Tensor` of continuous responses.
     :param tensor X_assumed: A N x P' `torch.Tensor` of covariates that are always assumed to be part of the model.
         Defaults to `None`.
@@ -99,20 +207,59 @@ class NormalLikelihoodSampler(MCMCSampler):
         stdout upon initialization.
     :param float xi_target: This hyperparameter controls how often :math:`h` MCMC updates are made if :math:`h`
         is a latent variable. Defaults to 0.2.
+    :param int XX_cache_size: If not `None`, columns of X^t @ X are computed on demand for covariates that
+        enter the model and kept in a least-recently-used cache that holds at most `XX_cache_size` columns.
+        This requires O(P x XX_cache_size) memory and is a middle ground between `precompute_XX=True` and
+        `precompute_XX=False` for problems where P is too large to store X^t @ X in memory.
+        Defaults to `None`. Cannot be combined with `precompute_XX=True`.
+    :param bool mixed_precision: If True, `X` is stored in single precision and all O(N x P) products involving `X`
+        are done in single precision, which halves memory usage and memory bandwidth. Quantities that are computed
+        once (e.g. :math:`X^{\rm T} Y` and :math:`X^{\rm T} X`) as well as all computations that involve the active
+        covariates (e.g. their gram matrix and its Cholesky factorization) are done in double precision.
+        Only supported for dense `X`. Defaults to False.
+    :param int tile_size: If `X` is dense, products with :math:`X^{\rm T}` over all covariates are computed
+        over tiles of `tile_size` columns of `X` in place so that no columns of `X` need to be gathered and
+        temporaries are bounded by the size of a tile. Defaults to 1024.
+    :param int num_threads: If larger than 1, the log odds of the inactive covariates are computed in
+        `num_threads` shards on a thread pool and, if `X` is dense, the tiles of products with :math:`X^{\rm T}`
+        are likewise computed concurrently. This is useful for large P (e.g. :math:`P \ge 10^5`). Defaults to 1.
+    :param str compile_backend: If not `None`, the computation of the inclusion probabilities in each MCMC
+        iteration is done by a kernel compiled with `torch.compile(backend=compile_backend)`, e.g. 'inductor'.
+        To avoid recompilation the active set is padded to the next power of two so that at most O(log P)
+        kernels are compiled. Compiled kernels are shared by all samplers in a process and (for the inductor
+        backend) cached on disk across runs. This reduces Python and dispatcher overhead, which dominates
+        iteration times for small active sets, at the cost of a one-time compilation overhead. While kernels
+        are compiled the recompilation limit of `torch._dynamo` is temporarily raised to `max_compiled_kernels`,
+        i.e. the process-wide config is not modified. Cannot be combined with `mixed_precision=True` or
+        `num_threads > 1`. Defaults to `None`.
     """
+    # incrementally updated factorizations are recomputed from scratch after refactorize_frequency updates
+    # and whenever an updated pivot indicates an ill-conditioned active set (see _update_factorization)
+    refactorize_frequency = 100
+    refactorize_tolerance = 1.0e-3
+    max_compiled_kernels = 64
+
     def __init__(self, X, Y, X_assumed=None, S=5.0,
                  prior="isotropic", include_intercept=True,
                  tau=0.01, tau_intercept=1.0e-4, c=100.0,
                  nu0=0.0, lambda0=0.0,
                  explore=5, precompute_XX=False,
                  compute_betas=False, verbose_constructor=True,
-                 xi_target=0.2):
+                 xi_target=0.2, XX_cache_size=None, mixed_precision=False, tile_size=1024,
+                 num_threads=1, compile_backend=None):
         assert prior in ['isotropic', 'gprior']
 
-        self.N, self.P = X.shape
-        assert (self.N,) == Y.shape
+        X = as_design_matrix(X, device=Y.device)
+        N, P = X.shape
+        assert (N,) == Y.shape
 
-        assert X.dtype == Y.dtype
+        if mixed_precision:
+            if isinstance(X, DesignMatrix):
+                raise ValueError("mixed_precision is only supported for dense covariate matrices X.")
+            X, Y = X.float(), Y.double()
+            X_assumed = None if X_assumed is None else X_assumed.float()
+
+        assert X.dtype == Y.dtype or mixed_precision
         assert X.device == Y.device
 
         if X_assumed is not None:
@@ -121,12 +268,141 @@ class NormalLikelihoodSampler(MCMCSampler):
             if X.size(0) != X_assumed.size(0):
                 raise ValueError("X and X_assumed must have the same number of rows.")
 
-        self.device = X.device
-        self.dtype = X.dtype
+        if XX_cache_size is not None and (not isinstance(XX_cache_size, int) or XX_cache_size <= 0):
+            raise ValueError("XX_cache_size must be a positive integer.")
+        if XX_cache_size is not None and precompute_XX:
+            raise ValueError("At most one of precompute_XX and XX_cache_size may be specified.")
+        if not isinstance(tile_size, int) or tile_size <= 0:
+            raise ValueError("tile_size must be a positive integer.")
+        if not isinstance(num_threads, int) or num_threads <= 0:
+            raise ValueError("num_threads must be a positive integer.")
+        if compile_backend is not None and (mixed_precision or num_threads > 1):
+            raise ValueError("compile_backend cannot be combined with mixed_precision or num_threads > 1.")
 
-        self.prior = prior
         self.X = X
         self.Y = Y
+        self.X_lazy = isinstance(X, DesignMatrix)
+        self.mixed_precision = mixed_precision
+        self.tile_size = tile_size
+        self.num_threads = num_threads
+
+        if X_assumed is not None:
+            assert X_assumed.size(-1) > 0
+
+        if self.X_lazy:
+            self.X = X.with_assumed_covariates(X_assumed=X_assumed, include_intercept=include_intercept)
+        else:
+            if X_assumed is not None:
+                self.X = torch.cat([self.X, X_assumed], dim=-1)
+            if include_intercept:
+                self.X = torch.cat([self.X, X.new_ones(X.size(0), 1)], dim=-1)
+
+        self._initialize(N=N, P=P, P_assumed=0 if X_assumed is None else X_assumed.size(-1),
+                         device=X.device, dtype=Y.dtype, S=S, prior=prior, include_intercept=include_intercept,
+                         tau=tau, tau_intercept=tau_intercept, c=c, nu0=nu0, lambda0=lambda0,
+                         explore=explore, compute_betas=compute_betas, xi_target=xi_target,
+                         compile_backend=compile_backend)
+
+        self.YY = Y.pow(2.0).sum() + nu0 * lambda0
+        if self.X_lazy:
+            self.Z = self.X.rmatvec(Y)
+        elif mixed_precision:
+            self.Z = upcast_rmatmat(self.X, Y, self.dtype)
+        else:
+            self.Z = einsum("np,n->p", self.X, Y)
+
+        self.XX, self.XX_cache = None, None
+        if precompute_XX:
+            if self.X_lazy:
+                self.XX = self.X.gram()
+            else:
+                self.XX = upcast_gram(self.X, self.dtype) if mixed_precision else self.X.t() @ self.X
+            self.XX_diag = self.XX.diagonal()
+        elif XX_cache_size is not None:
+            self.XX_cache = GramColumnCache(self.X, XX_cache_size, dtype=self.dtype)
+
+        if self.X_lazy and not precompute_XX:
+            self.XX_diag = self.X.column_norms_sq()
+        elif mixed_precision and not precompute_XX:
+            self.XX_diag = upcast_column_norms_sq(self.X, self.dtype)
+        elif not precompute_XX:
+            self.XX_diag = tiled_column_norms_sq(self.X, tile_size=tile_size, num_threads=num_threads)
+
+        if verbose_constructor:
+            self._print_constructor_summary(S)
+
+    @classmethod
+    def from_sufficient_statistics(cls, XX, XY, YY, N, P_assumed=0, S=5.0,
+                                   prior="isotropic", include_intercept=False,
+                                   tau=0.01, tau_intercept=1.0e-4, c=100.0,
+                                   nu0=0.0, lambda0=0.0, explore=5,
+                                   compute_betas=False, verbose_constructor=True,
+                                   xi_target=0.2, compile_backend=None):
+        r"""
+        Construct a `NormalLikelihoodSampler` from the sufficient statistics :math:`X^{\rm T} X`,
+        :math:`X^{\rm T} Y`, :math:`Y^{\rm T} Y` and :math:`N` instead of from the raw covariates and
+        responses. The cost of each MCMC iteration is then independent of the number of data points :math:`N`.
+
+        The covariates are ordered as :math:`(X, X_{\rm assumed}, 1)`: the first P rows/columns of `XX`
+        correspond to the covariates subject to selection, the following `P_assumed` rows/columns correspond
+        to covariates that are always assumed to be part of the model, and, if `include_intercept` is True,
+        the last row/column corresponds to the intercept, i.e. it must be computed from a column of ones.
+        All other arguments are as in the `NormalLikelihoodSampler` constructor.
+
+        :param tensor XX: A (P + P_assumed + include_intercept) x (P + P_assumed + include_intercept)
+            `torch.Tensor` that contains the gram matrix :math:`X^{\rm T} X`.
+        :param tensor XY: A (P + P_assumed + include_intercept)-dimensional `torch.Tensor` that contains
+            :math:`X^{\rm T} Y`.
+        :param float YY: The sum of squared responses :math:`Y^{\rm T} Y`.
+        :param int N: The number of data points.
+        :param int P_assumed: The number of covariates that are always assumed to be part of the model.
+            Defaults to 0.
+        :param bool include_intercept: Whether the last row/column of `XX` corresponds to an intercept term.
+            Defaults to False.
+        """
+        assert prior in ['isotropic', 'gprior']
+
+        P = XX.size(-1) - P_assumed - int(include_intercept)
+        if XX.ndim != 2 or XX.size(0) != XX.size(-1) or P <= 0:
+            raise ValueError("XX must be a square matrix with more than P_assumed + include_intercept rows.")
+        if XY.shape != XX.shape[-1:]:
+            raise ValueError("XX and XY should be of shape (P, P) and (P,), respectively.")
+        if not isinstance(N, int) or N <= 0:
+            raise ValueError("N must be a positive integer.")
+
+        assert XX.dtype == XY.dtype
+        assert XX.device == XY.device
+
+        sampler = cls.__new__(cls)
+        sampler.X, sampler.Y, sampler.X_lazy, sampler.mixed_precision = None, None, False, False
+        sampler.num_threads = 1
+        sampler._initialize(N=N, P=P, P_assumed=P_assumed, device=XX.device, dtype=XX.dtype,
+                            S=S, prior=prior, include_intercept=include_intercept,
+                            tau=tau, tau_intercept=tau_intercept, c=c, nu0=nu0, lambda0=lambda0,
+                            explore=explore, compute_betas=compute_betas, xi_target=xi_target,
+                            compile_backend=compile_backend)
+
+        sampler.YY = XX.new_tensor(YY) + nu0 * lambda0
+        sampler.Z = XY
+        sampler.XX, sampler.XX_cache = XX, None
+        sampler.XX_diag = XX.diagonal()
+
+        if verbose_constructor:
+            sampler._print_constructor_summary(S)
+
+        return sampler
+
+    def _initialize(self, N, P, P_assumed, device, dtype, S, prior, include_intercept,
+                    tau, tau_intercept, c, nu0, lambda0, explore, compute_betas, xi_target, compile_backend=None):
+        if compile_backend is not None and not isinstance(compile_backend, str):
+            raise ValueError("compile_backend must be None or the name of a torch.compile backend.")
+        self.compile_backend = compile_backend
+        self.profile = SamplerProfile()
+        self.N, self.P = N, P
+        self.device = device
+        self.dtype = dtype
+
+        self.prior = prior
         self.c = c if prior == 'gprior' else 0.0
         self.tau = tau if prior == 'isotropic' else 0.0
 
@@ -135,13 +411,6 @@ class NormalLikelihoodSampler(MCMCSampler):
         else:
             self.tau_intercept = 0.0
 
-        if X_assumed is not None:
-            assert X_assumed.size(-1) > 0
-            self.X = torch.cat([self.X, X_assumed], dim=-1)
-
-        if include_intercept:
-            self.X = torch.cat([self.X, X.new_ones(X.size(0), 1)], dim=-1)
-
         S = S if not isinstance(S, int) else float(S)
         if isinstance(S, float):
             if S >= self.P or S <= 0:
@@ -169,9 +438,6 @@ class NormalLikelihoodSampler(MCMCSampler):
         if xi_target <= 0.0 or xi_target >= 1.0:
             raise ValueError("xi_target must be in the interval (0, 1).")
 
-        self.YY = Y.pow(2.0).sum() + nu0 * lambda0
-        self.Z = einsum("np,n->p", self.X, Y)
-
         if isinstance(S, float):
             self.h = S / self.P
             self.xi = torch.tensor([0.0], device=self.device)
@@ -198,40 +464,35 @@ class NormalLikelihoodSampler(MCMCSampler):
         self.compute_betas = compute_betas
         self.include_intercept = include_intercept
 
-        if include_intercept and X_assumed is None:
-            self.assumed_covariates = torch.tensor([self.P], device=self.device, dtype=torch.int64)
-        elif include_intercept and X_assumed is not None:
-            self.assumed_covariates = torch.arange(self.P, self.P + X_assumed.size(-1) + 1,
-                                                   device=self.device, dtype=torch.int64)
-        elif not include_intercept and X_assumed is not None:
-            self.assumed_covariates = torch.arange(self.P, self.P + X_assumed.size(-1),
-                                                   device=self.device, dtype=torch.int64)
+        self.Pa = P_assumed + int(include_intercept)
+        if self.Pa > 0:
+            self.assumed_covariates = torch.arange(self.P, self.P + self.Pa, device=self.device, dtype=torch.int64)
         else:
             self.assumed_covariates = None
 
-        if precompute_XX:
-            self.XX = self.X.t() @ self.X
-            self.XX_diag = self.XX.diagonal()
-        else:
-            self.XX = None
+        # diagonal prior precision that regularizes the gram matrix of the active covariates
+        self.prior_precision = torch.full((self.P + self.Pa,), self.tau, device=self.device, dtype=self.dtype)
+        if include_intercept:
+            self.prior_precision[-1] = self.tau_intercept
 
-        self.Pa = 0 if self.assumed_covariates is None else self.assumed_covariates.size(-1)
-        self.epsilon = 1.0e3 * torch.finfo(X.dtype).tiny
+        self.epsilon = 1.0e3 * torch.finfo(self.dtype).tiny
 
-        if verbose_constructor:
-            s2 = " = ({}, {}, {:.1f}, {:.3f})" if not isinstance(S, tuple) else " = ({}, {}, ({:.1f}, {:.1f}), {:.3f})"
-            if isinstance(S, float):
-                S = (S,)
-            elif isinstance(S, torch.Tensor):
-                S = (S.min().item(), S.max().item())
-            if self.prior == 'isotropic':
-                s1 = "Initialized NormalLikelihoodSampler with isotropic prior and (N, P, S, tau)"
-                print((s1 + s2).format(self.N, self.P, *S, self.tau))
-            else:
-                s1 = "Initialized NormalLikelihoodSampler with gprior and (N, P, S, c)"
-                print((s1 + s2).format(self.N, self.P, *S, self.c))
+    def _print_constructor_summary(self, S):
+        S = S if not isinstance(S, int) else float(S)
+        s2 = " = ({}, {}, {:.1f}, {:.3f})" if not isinstance(S, tuple) else " = ({}, {}, ({:.1f}, {:.1f}), {:.3f})"
+        if isinstance(S, float):
+            S = (S,)
+        elif isinstance(S, torch.Tensor):
+            S = (S.min().item(), S.max().item())
+        if self.prior == 'isotropic':
+            s1 = "Initialized NormalLikelihoodSampler with isotropic prior and (N, P, S, tau)"
+            print((s1 + s2).format(self.N, self.P, *S, self.tau))
+        else:
+            s1 = "Initialized NormalLikelihoodSampler with gprior and (N, P, S, c)"
+            print((s1 + s2).format(self.N, self.P, *S, self.c))
 
     def initialize_sample(self, seed=None):
+        self.profile = SamplerProfile()
         if seed is not None:
             torch.manual_seed(seed)
 
@@ -259,105 +520,58 @@ class NormalLikelihoodSampler(MCMCSampler):
             "all covariates have been selected. Are you sure you have chosen a reasonable prior? " +\
             "Are you sure there is signal in your data?"
 
-        X_k = self.X[:, inactive]
-        Z_k = self.Z[inactive]
-        if self.XX is None:
-            XX_k = norm(X_k, dim=0).pow(2.0)
-        else:
-            XX_k = self.XX_diag[inactive]
-
         if self.Pa > 0 or num_active > 0:
-            X_activeb = self.X[:, activeb]
             Z_active = self.Z[activeb]
-            if self.XX is not None:
-                XX_active = self.XX[activeb][:, activeb]
-            else:
-                XX_active = X_activeb.t() @ X_activeb
-            if self.prior == 'isotropic':
-                XX_active.diagonal(dim1=-2, dim2=-1).add_(self.tau)
-                if self.include_intercept:
-                    XX_active[-1, -1].add_(self.tau_intercept - self.tau)
-
-            L_active = safe_cholesky(XX_active)
+            if getattr(sample, '_L_active', None) is None or sample._L_active.size(-1) != activeb.size(-1):
+                self._factorize_active(sample)
+            XX_active, L_active = sample._XX_active, sample._L_active
 
             Zt_active = trisolve(L_active, Z_active.unsqueeze(-1), upper=False).squeeze(-1)
-            Xt_active = trisolve(L_active, X_activeb.t(), upper=False).t()
-            XtZt_active = einsum("np,p->n", Xt_active, Zt_active)
+            beta_active = trisolve(L_active.t(), Zt_active.unsqueeze(-1), upper=True).squeeze(-1)
 
-            if self.XX is None:
-                G_k_inv = XX_k + self.tau - norm(einsum("ni,nk->ik", Xt_active, X_k), dim=0).pow(2.0)
+            if self.mixed_precision:
+                # YY - Zt_active_sq is prone to cancellation, so we refine beta_active = XX_active^{-1} Z_active
+                # with one step of iterative refinement before computing Zt_active_sq = Z_active^T beta_active
+                residual = Z_active - torch.mv(XX_active, beta_active)
+                beta_active = beta_active + chosolve(residual.unsqueeze(-1), L_active).squeeze(-1)
+                Zt_active_sq = torch.dot(Z_active, beta_active)
             else:
-                normsq = trisolve(L_active, self.XX[activeb][:, inactive], upper=False)
-                G_k_inv = XX_k + self.tau - norm(normsq, dim=0).pow(2.0)
-
-            W_k_sq = (einsum("np,n->p", X_k, XtZt_active) - Z_k).pow(2.0) / (G_k_inv + self.epsilon)
-            Zt_active_sq = Zt_active.pow(2.0).sum()
-
-            if self.prior == 'isotropic':
-                log_det_inactive = -0.5 * G_k_inv.log() + 0.5 * math.log(self.tau)
+                Zt_active_sq = Zt_active.pow(2.0).sum()
         else:
-            W_k_sq = Z_k.pow(2.0) / (XX_k + self.tau + self.epsilon)
-            Zt_active_sq = 0.0
-            if self.prior == 'isotropic':
-                log_det_inactive = -0.5 * torch.log1p(XX_k / self.tau)
+            Zt_active, Zt_active_sq = None, 0.0
 
-        if self.compute_betas and (num_active > 0 or self.Pa > 0):
-            beta_active = trisolve(L_active.t(), Zt_active.unsqueeze(-1), upper=True).squeeze(-1)
-            sample.beta = self.X.new_zeros(self.P + self.Pa)
-            epsilon = torch.randn(activeb.size(-1), 1, device=self.device, dtype=self.dtype)
-            if self.prior == 'gprior':
-                sample.beta[activeb] = self.c_one_c * beta_active
-                sample.beta[activeb] += self.c_one_c_sqrt * trisolve(L_active, epsilon, upper=False).squeeze(-1)
-            else:
-                sample.beta[activeb] = beta_active
-                sample.beta[activeb] += trisolve(L_active, epsilon, upper=False).squeeze(-1)
-        elif self.compute_betas and num_active == 0:
-            sample.beta = self.X.new_zeros(self.P + self.Pa)
+        # the log odds of the inactive covariates do not depend on each other, so with num_threads > 1
+        # contiguous shards of the inactive covariates are computed concurrently into a shared buffer
+        log_odds = self.Z.new_zeros(self.P)
 
-        if num_active > 1:
-            active_loo = leave_one_out(active)  # I I-1
+        def compute_shard(inactive_shard):
+            log_odds[inactive_shard] = self._compute_log_odds_inactive(sample, inactive_shard,
+                                                                       Zt_active, Zt_active_sq)
 
-            if self.Pa > 0:
-                assumed_covariates = self.assumed_covariates.expand(num_active, -1)
-                active_loob = torch.cat([active_loo, assumed_covariates], dim=-1)
-            else:
-                active_loob = active_loo
+        shards = inactive.tensor_split(self.num_threads) if self.num_threads > 1 else [inactive]
+        map_shards(compute_shard, shards, self.num_threads)
 
-            Z_active_loo = self.Z[active_loob]
+        if self.compute_betas:
+            self._sample_beta(sample, activeb, beta_active if activeb.size(-1) > 0 else None)
 
+        if num_active > 1:
+            # leave-one-out quantities for each active covariate in O(k^2) given F = (X^T X + Lambda)^{-1}
             F = torch.cholesky_inverse(L_active, upper=False)
-            F_loo = get_loo_inverses(F)
-            if self.Pa > 0:
-                F_loo = F_loo[:-self.Pa]
-
-            Zt_active_loo = matmul(F_loo, Z_active_loo.unsqueeze(-1)).squeeze(-1)
-            Zt_active_loo_sq = einsum("ij,ij->i", Zt_active_loo, Z_active_loo)
+            Zt_active_loo_sq, F_diag = get_loo_quadratic_forms(F, Z_active)
+            Zt_active_loo_sq, F_diag = Zt_active_loo_sq[:num_active], F_diag[:num_active]
 
             if self.prior == 'isotropic':
-                X_I_X_k = leave_one_out_off_diagonal(XX_active).unsqueeze(-1)
-                X_I_X_k = X_I_X_k if self.Pa == 0 else X_I_X_k[:-self.Pa]
-
-                F_X_I_X_k = matmul(F_loo, X_I_X_k).squeeze(-1)
-                XXFXX = einsum("ij,ij->i", X_I_X_k.squeeze(-1), F_X_I_X_k)
-                XX_active_diag = XX_active.diag() if self.Pa == 0 else XX_active.diag()[:-self.Pa]
-                G_k_inv = XX_active_diag - XXFXX
-                log_det_active = -0.5 * G_k_inv.log() + 0.5 * math.log(self.tau)
+                # the schur complement G_k_inv = X_k^T X_k + tau - X_k^T X_I F_I X_I^T X_k equals 1 / F_kk
+                log_det_active = 0.5 * F_diag.log() + 0.5 * math.log(self.tau)
 
         elif num_active == 1:
             if self.Pa == 0:
                 Zt_active_loo_sq = 0.0
                 if self.prior == 'isotropic':
-                    log_det_active = -0.5 * torch.log1p(norm(self.X[:, active], dim=0).pow(2.0) / self.tau)
+                    log_det_active = -0.5 * (XX_active.diagonal() / self.tau).log()
             else:
-                if self.XX is None:
-                    XX_assumed = self.X[:, self.assumed_covariates].t() @ self.X[:, self.assumed_covariates]
-                else:
-                    XX_assumed = self.XX[self.assumed_covariates][:, self.assumed_covariates]
-                if self.prior == "isotropic":
-                    XX_assumed.diagonal(dim1=-2, dim2=-1).add_(self.tau)
-                    if self.include_intercept:
-                        XX_assumed[-1, -1].add_(self.tau_intercept - self.tau)
-                L_assumed = safe_cholesky(XX_assumed)
+                XX_assumed = XX_active[-self.Pa:, -self.Pa:]
+                L_assumed = safe_cholesky(XX_assumed, profile=self.profile)
                 Zt_active_loo = trisolve(L_assumed, self.Z[self.assumed_covariates].unsqueeze(-1),
                                          upper=False).squeeze(-1)
                 Zt_active_loo_sq = norm(Zt_active_loo, dim=0).pow(2.0)
@@ -370,35 +584,147 @@ class NormalLikelihoodSampler(MCMCSampler):
             log_det_active = torch.tensor(0.0, device=self.device, dtype=self.dtype)
 
         log_h_ratio_active = sample._log_h_ratio[active] if isinstance(self.h, torch.Tensor) else sample._log_h_ratio
-        log_h_ratio_inactive = sample._log_h_ratio[inactive] if isinstance(self.h, torch.Tensor) \
-            else sample._log_h_ratio
 
         if self.prior == 'gprior':
-            log_S_ratio = -torch.log1p(-self.c_one_c * W_k_sq / (self.YY - self.c_one_c * Zt_active_sq))
-            log_odds_inactive = log_h_ratio_inactive - self.log_one_c_sqrt + 0.5 * self.N_nu0 * log_S_ratio
-
             log_S_ratio = torch.log(self.YY - self.c_one_c * Zt_active_loo_sq) -\
                 torch.log(self.YY - self.c_one_c * Zt_active_sq)
             log_odds_active = log_h_ratio_active - self.log_one_c_sqrt + 0.5 * self.N_nu0 * log_S_ratio
         elif self.prior == 'isotropic':
-            log_S_ratio = -torch.log1p(- W_k_sq / (self.YY - Zt_active_sq))
-            log_odds_inactive = log_h_ratio_inactive + log_det_inactive + 0.5 * self.N_nu0 * log_S_ratio
-
             log_S_ratio = (self.YY - Zt_active_loo_sq).log() - (self.YY - Zt_active_sq).log()
             log_odds_active = log_h_ratio_active + log_det_active + 0.5 * self.N_nu0 * log_S_ratio
 
-        log_odds = self.X.new_zeros(self.P)
-        log_odds[inactive] = log_odds_inactive
         log_odds[active] = log_odds_active
 
         return log_odds
 
+    def _sample_beta(self, sample, activeb, beta_active):
+        sample.beta = self.Z.new_zeros(self.P + self.Pa)
+        if beta_active is None:
+            return
+        L_active = sample._L_active
+        epsilon = torch.randn(activeb.size(-1), 1, device=self.device, dtype=self.dtype)
+        if self.prior == 'gprior':
+            sample.beta[activeb] = self.c_one_c * beta_active
+            sample.beta[activeb] += self.c_one_c_sqrt * trisolve(L_active, epsilon, upper=False).squeeze(-1)
+        else:
+            sample.beta[activeb] = beta_active
+            sample.beta[activeb] += trisolve(L_active, epsilon, upper=False).squeeze(-1)
+
+    def _compute_log_odds_inactive(self, sample, inactive, Zt_active, Zt_active_sq):
+        # computes the log odds for (a subset of) the inactive covariates; Zt_active is None if there
+        # are no active or assumed covariates
+        Z_k = self.Z[inactive]
+        XX_k = self.XX_diag[inactive]
+
+        if Zt_active is not None:
+            # with the whitened cross-products XXt_active = X^T X_activeb L_active^{-T} (which are maintained
+            # incrementally and refactorized whenever the active set is ill-conditioned, see _update_factorization)
+            # the quantities for all inactive covariates only require O(P k) operations
+            XXt_k_active = sample._XXt_active[inactive]
+            G_k_inv = XX_k + self.tau - XXt_k_active.pow(2.0).sum(-1)
+            W_k = torch.mv(XXt_k_active, Zt_active) - Z_k
+            W_k_sq = W_k.pow(2.0) / (G_k_inv + self.epsilon)
+            if self.prior == 'isotropic':
+                log_det_inactive = -0.5 * G_k_inv.log() + 0.5 * math.log(self.tau)
+        else:
+            W_k_sq = Z_k.pow(2.0) / (XX_k + self.tau + self.epsilon)
+            if self.prior == 'isotropic':
+                log_det_inactive = -0.5 * torch.log1p(XX_k / self.tau)
+
+        log_h_ratio_inactive = sample._log_h_ratio[inactive] if isinstance(self.h, torch.Tensor) \
+            else sample._log_h_ratio
+
+        if self.prior == 'gprior':
+            log_S_ratio = -torch.log1p(-self.c_one_c * W_k_sq / (self.YY - self.c_one_c * Zt_active_sq))
+            return log_h_ratio_inactive - self.log_one_c_sqrt + 0.5 * self.N_nu0 * log_S_ratio
+        log_S_ratio = -torch.log1p(- W_k_sq / (self.YY - Zt_active_sq))
+        return log_h_ratio_inactive + log_det_inactive + 0.5 * self.N_nu0 * log_S_ratio
+
+    def _get_XX_columns(self, indices):
+        if self.XX is not None:
+            return self.XX[:, indices]
+        return self.XX_cache(indices)
+
+    def _get_X_columns(self, indices):
+        # with mixed precision the columns of active covariates are upcast
+        return self.X[:, indices].to(self.dtype)
+
+    def _factorize_active(self, sample):
+        activeb = sample._activeb if self.Pa > 0 else sample._active
+        sample._XX_active, sample._L_active, sample._XXt_active = None, None, None
+        sample._num_factor_updates = 0
+        if activeb.size(-1) == 0:
+            return sample
+
+        XX_activeb = self._get_cross_products(activeb)
+        XX_active = XX_activeb[activeb]
+        XX_active.diagonal(dim1=-2, dim2=-1).add_(self.prior_precision[activeb])
+        sample._XX_active = XX_active
+        sample._L_active = safe_cholesky(XX_active, profile=self.profile)
+        sample._XXt_active = trisolve(sample._L_active, XX_activeb.t(), upper=False).t()
+        return sample
+
+    def _get_cross_products(self, indices):
+        # the (P + Pa) x len(indices) matrix of cross-products X^T X[:, indices]
+        if self.XX is not None or self.XX_cache is not None:
+            return self._get_XX_columns(indices)
+        X_indices = self._get_X_columns(indices)
+        if self.X_lazy:
+            return self.X.rmatmat(X_indices)
+        elif self.mixed_precision:
+            return upcast_rmatmat(self.X, X_indices, self.dtype)
+        return tiled_rmatmat(self.X, X_indices, self.tile_size, num_threads=self.num_threads)
+
+    def _update_factorization(self, sample, idx, position, added):
+        # idx was added to (removed from) the active set at (from) the given position,
+        # so update the cholesky factorization of XX_active with a row/column insertion (deletion)
+        if getattr(sample, '_L_active', None) is None or sample._num_factor_updates >= self.refactorize_frequency:
+            return self._factorize_active(sample)
+
+        XX_active, L_active, XXt_active = sample._XX_active, sample._L_active, sample._XXt_active
+        try:
+            if added:
+                # only the cross-products with the new column need to be computed
+                activeb = sample._activeb if self.Pa > 0 else sample._active
+                XX_col = self._get_cross_products(idx.unsqueeze(-1)).squeeze(-1)
+                XX_new = XX_col[activeb].clone()
+                XX_new[position] += self.prior_precision[idx]
+                XX_row = torch.cat([XX_new[:position], XX_new[position + 1:]]).unsqueeze(0)
+                XX_active = torch.cat([XX_active[:position], XX_row, XX_active[position:]], dim=0)
+                XX_active = torch.cat([XX_active[:, :position], XX_new.unsqueeze(-1), XX_active[:, position:]], dim=-1)
+                L_active, XXt_active = cholesky_insert(L_active, position, XX_new, XXt_active, XX_col)
+            else:
+                if XX_active.size(-1) == 1:
+                    return self._factorize_active(sample)
+                keep = torch.arange(XX_active.size(-1), device=self.device) != position
+                XX_active = XX_active[keep][:, keep]
+                L_active, XXt_active = cholesky_delete(L_active, position, XXt_active)
+        except RuntimeError:
+            return self._factorize_active(sample)
+
+        # besides non-finite or non-positive pivots, a pivot that is small relative to the corresponding diagonal
+        # entry of XX_active signals cancellation (e.g. nearly collinear active covariates), in which case updated
+        # factors can deviate noticeably from a fresh factorization, so we refactorize from scratch instead
+        L_diag = L_active.diagonal()
+        if not torch.isfinite(L_active).all().item() or not (L_diag > 0.0).all().item() or \
+                (L_diag.pow(2.0) < self.refactorize_tolerance * XX_active.diagonal()).any().item():
+            return self._factorize_active(sample)
+
+        sample._XX_active, sample._L_active, sample._XXt_active = XX_active, L_active, XXt_active
+        sample._num_factor_updates += 1
+        return sample
+
     def _compute_probs(self, sample):
-        sample.add_prob = sigmoid(self._compute_add_prob(sample))
+        if self.compile_backend is not None:
+            with self.profile.phase('compute_add_prob'):
+                sample.add_prob, i_prob = self._compute_probs_compiled(sample)
+        else:
+            with self.profile.phase('compute_add_prob'):
+                sample.add_prob = sigmoid(self._compute_add_prob(sample))
 
-        gamma = sample.gamma.type_as(sample.add_prob)
-        prob_gamma_i = gamma * sample.add_prob + (1.0 - gamma) * (1.0 - sample.add_prob)
-        i_prob = 0.5 * (sample.add_prob + self.explore) / (prob_gamma_i + self.epsilon)
+            gamma = sample.gamma.type_as(sample.add_prob)
+            prob_gamma_i = gamma * sample.add_prob + (1.0 - gamma) * (1.0 - sample.add_prob)
+            i_prob = 0.5 * (sample.add_prob + self.explore) / (prob_gamma_i + self.epsilon)
 
         if hasattr(self, 'h_alpha') and self.t <= self.T_burnin:  # adapt xi
             self.xi += (self.xi_target - self.xi / (self.xi + i_prob.sum())) / math.sqrt(self.t + 1)
@@ -407,6 +733,58 @@ class NormalLikelihoodSampler(MCMCSampler):
 
         return sample
 
+    def _compute_probs_compiled(self, sample):
+        # equivalent to _compute_add_prob followed by the computation of i_prob in _compute_probs,
+        # but with the active set padded to a bucket size so that a compiled kernel can be used
+        active = sample._active
+        activeb = sample._activeb if self.Pa > 0 else active
+        num_active = active.size(-1)
+
+        assert num_active < self.P, "The MCMC sampler has been driven into a regime where " +\
+            "all covariates have been selected. Are you sure you have chosen a reasonable prior? " +\
+            "Are you sure there is signal in your data?"
+
+        if activeb.size(-1) > 0 and (getattr(sample, '_L_active', None) is None or
+                                     sample._L_active.size(-1) != activeb.size(-1)):
+            self._factorize_active(sample)
+
+        active_pad, Z_active, L_active, XXt_active = self._pad_active(sample, active, activeb)
+        log_h_ratio = torch.as_tensor(sample._log_h_ratio, dtype=self.dtype, device=self.device)
+        kernel = _get_compiled_probs_kernel(self.compile_backend, self.max_compiled_kernels)
+        add_prob, i_prob = kernel(self.Z, self.XX_diag, sample.gamma, active_pad, Z_active, L_active,
+                                  XXt_active, log_h_ratio, self.YY, self.tau, self.epsilon, self.N_nu0,
+                                  self.explore, self.prior, getattr(self, 'c_one_c', 0.0),
+                                  getattr(self, 'log_one_c_sqrt', 0.0))
+
+        if self.compute_betas:
+            beta_active = None
+            if activeb.size(-1) > 0:
+                beta_active = chosolve(self.Z[activeb].unsqueeze(-1), sample._L_active).squeeze(-1)
+            self._sample_beta(sample, activeb, beta_active)
+
+        return add_prob, i_prob
+
+    def _pad_active(self, sample, active, activeb):
+        # pads the active covariates to the next power of two K >= num_active so that compiled kernels are
+        # specialized to O(log P) distinct shapes. the padded (K + Pa) x (K + Pa) matrix XX_active is block
+        # diagonal with an identity block for the padding, so that L_active is padded in the same way and
+        # padding entries of Z_active and XXt_active are zero
+        num_active = active.size(-1)
+        K = 1 << max(num_active - 1, 0).bit_length()
+        D = K + self.Pa
+        index = torch.cat([torch.arange(num_active, device=self.device), torch.arange(K, D, device=self.device)])
+
+        L_active = torch.eye(D, device=self.device, dtype=self.dtype)
+        Z_active = self.Z.new_zeros(D)
+        XXt_active = self.Z.new_zeros(self.P + self.Pa, D)
+        if activeb.size(-1) > 0:
+            L_active[index.unsqueeze(-1), index] = sample._L_active
+            Z_active[index] = self.Z[activeb]
+            XXt_active[:, index] = sample._XXt_active
+
+        active_pad = torch.cat([active, active.new_full((K - num_active,), self.P)])
+        return active_pad, Z_active, L_active, XXt_active
+
     def mcmc_move(self, sample):
         self.t += 1
 
@@ -415,22 +793,242 @@ class NormalLikelihoodSampler(MCMCSampler):
         if sample._idx.item() >= 0:
             sample.gamma[sample._idx] = ~sample.gamma[sample._idx]
 
-            sample._active = torch.nonzero(sample.gamma).squeeze(-1)
+            # active covariates are kept in order of inclusion so that the factorization
+            # of XX_active can be updated by inserting a single row/column
+            if sample.gamma[sample._idx].item():
+                position = sample._active.size(-1)
+                sample._active = torch.cat([sample._active, sample._idx.unsqueeze(-1)])
+            else:
+                position = torch.nonzero(sample._active == sample._idx).item()
+                sample._active = torch.cat([sample._active[:position], sample._active[position + 1:]])
             if self.Pa > 0:
                 sample._activeb = torch.cat([sample._active, self.assumed_covariates])
+
+            with self.profile.phase('update_factorization'):
+                sample = self._update_factorization(sample, sample._idx, position,
+                                                    sample.gamma[sample._idx].item())
         else:
-            sample = self.sample_alpha_beta(sample)
+            with self.profile.phase('sample_h'):
+                sample = self.sample_alpha_beta(sample)
 
         sample = self._compute_probs(sample)
         sample.weight = sample._i_prob.mean().reciprocal()
+        self.profile.active_set_size(sample._active.size(-1))
 
         return sample
 
     def sample_alpha_beta(self, sample):
         num_active = sample._active.size(-1)
         num_inactive = self.P - num_active
-        sample.h_alpha = torch.tensor(self.h_alpha + num_active, device=self.X.device)
-        sample.h_beta = torch.tensor(self.h_beta + num_inactive, device=self.X.device)
+        sample.h_alpha = torch.tensor(self.h_alpha + num_active, device=self.device)
+        sample.h_beta = torch.tensor(self.h_beta + num_inactive, device=self.device)
         h = Beta(sample.h_alpha, sample.h_beta).sample().item()
         sample._log_h_ratio = math.log(h) - math.log(1.0 - h)
         return sample
+
+
+class MultiChainNormalLikelihoodSampler(NormalLikelihoodSampler):
+    r"""
+    Variant of :class:`NormalLikelihoodSampler` that runs `num_chains` independent MCMC chains in lockstep.
+    Instead of driving a single chain with many small linear algebra operations, all chains are advanced
+    together with batched linear algebra: the gram matrices of the active covariates of all chains are
+    padded to a common size and factorized with a single batched Cholesky decomposition, the add/remove
+    probabilities of all chains are computed with batched triangular solves and a single matrix-matrix
+    product with :math:`X^{\rm T}` (or :math:`X^{\rm T} X`), and the next moves are drawn with a batched
+    Categorical distribution. This raises arithmetic intensity and amortizes Python and dispatch overhead,
+    which dominate a single chain with a small number of active covariates.
+
+    Samples yielded by `mcmc_chain` carry a leading chain dimension, e.g. `sample.gamma` is a
+    `num_chains x P` boolean tensor and `sample.weight` is a `num_chains`-dimensional tensor.
+    The factorization is recomputed from scratch at each iteration so that the incremental updates of
+    :class:`NormalLikelihoodSampler` are not used.
+
+    :param int num_chains: The number of chains to run in lockstep. Defaults to 4.
+
+    All other arguments are as in :class:`NormalLikelihoodSampler`.
+    """
+    def __init__(self, X, Y, num_chains=4, **kwargs):
+        if kwargs.get('compile_backend') is not None:
+            raise ValueError("compile_backend is not supported by MultiChainNormalLikelihoodSampler.")
+        super().__init__(X, Y, **kwargs)
+        self._initialize_chains(num_chains)
+
+    @classmethod
+    def from_sufficient_statistics(cls, XX, XY, YY, N, num_chains=4, **kwargs):
+        if kwargs.get('compile_backend') is not None:
+            raise ValueError("compile_backend is not supported by MultiChainNormalLikelihoodSampler.")
+        sampler = super().from_sufficient_statistics(XX, XY, YY, N, **kwargs)
+        sampler._initialize_chains(num_chains)
+        return sampler
+
+    def _initialize_chains(self, num_chains):
+        if not isinstance(num_chains, int) or num_chains <= 0:
+            raise ValueError("num_chains must be a positive integer.")
+        self.num_chains = num_chains
+        self.xi = self.xi.expand(num_chains, 1).clone()
+
+    def initialize_sample(self, seed=None):
+        self.profile = SamplerProfile()
+        if seed is not None:
+            torch.manual_seed(seed)
+
+        C = self.num_chains
+        sample = SimpleNamespace(gamma=torch.zeros(C, self.P, device=self.device).bool(),
+                                 _log_h_ratio=self.log_h_ratio)
+
+        if hasattr(self, "h_alpha"):
+            sample.h_alpha = torch.full((C,), self.h_alpha, device=self.device, dtype=self.dtype)
+            sample.h_beta = torch.full((C,), self.h_beta, device=self.device, dtype=self.dtype)
+            sample._log_h_ratio = torch.full((C, 1), self.log_h_ratio, device=self.device, dtype=self.dtype)
+
+        sample = self._compute_probs(sample)
+        return sample
+
+    def _get_active_columns(self, activeb):
+        # gather the columns of X^T X (or X) that correspond to the C x K padded active sets
+        union, inverse = torch.unique(activeb, return_inverse=True)
+        if self.XX is not None or self.XX_cache is not None:
+            return self._get_XX_columns(union)[:, inverse]
+        return self._get_X_columns(union)[:, inverse]
+
+    def _compute_add_prob(self, sample):
+        C, P, Pa = self.num_chains, self.P, self.Pa
+        chains = torch.arange(C, device=self.device)
+        num_active = sample.gamma.sum(-1)
+
+        assert (num_active < P).all().item(), "The MCMC sampler has been driven into a regime where " +\
+            "all covariates have been selected. Are you sure you have chosen a reasonable prior? " +\
+            "Are you sure there is signal in your data?"
+
+        # pad the active sets to a common size K >= 1; active covariates come first (in ascending order),
+        # followed by padding and the assumed covariates. padded entries are masked out below.
+        K = max(1, num_active.max().item())
+        active = torch.argsort((~sample.gamma).to(torch.int64), dim=-1, stable=True)[:, :K]
+        valid = torch.arange(K, device=self.device) < num_active.unsqueeze(-1)
+        if Pa > 0:
+            activeb = torch.cat([active, self.assumed_covariates.expand(C, Pa)], dim=-1)
+            validb = torch.cat([valid, valid.new_ones(C, Pa)], dim=-1)
+        else:
+            activeb, validb = active, valid
+        maskb = validb.type_as(self.Z)
+
+        columns = self._get_active_columns(activeb) * maskb
+        if self.XX is not None or self.XX_cache is not None:
+            XX_active = columns[activeb, chains.unsqueeze(-1)]
+        else:
+            XX_active = einsum("nci,ncj->cij", columns, columns)
+        XX_active = XX_active * maskb.unsqueeze(-1) * maskb.unsqueeze(-2)
+        XX_active.diagonal(dim1=-2, dim2=-1).add_(torch.where(validb, self.prior_precision[activeb],
+                                                              torch.ones_like(maskb)))
+        L_active = safe_cholesky(XX_active, profile=self.profile)
+
+        Z_active = self.Z[activeb] * maskb
+        Zt_active = trisolve(L_active, Z_active.unsqueeze(-1), upper=False)
+        beta_active = trisolve(L_active.transpose(-1, -2), Zt_active, upper=True).squeeze(-1)
+        Zt_active_sq = Zt_active.squeeze(-1).pow(2.0).sum(-1, keepdim=True)
+
+        # quantities for adding each covariate p to each chain (only used for inactive covariates)
+        Z_k, XX_k = self.Z[:P], self.XX_diag[:P]
+        if self.XX is not None or self.XX_cache is not None:
+            XX_k_active = columns[:P]
+            G_k_inv = XX_k + self.tau - trisolve(L_active, XX_k_active.permute(1, 2, 0), upper=False).pow(2.0).sum(-2)
+            W_k = einsum("pci,ci->cp", XX_k_active, beta_active) - Z_k
+        else:
+            Xt_active = trisolve(L_active, columns.permute(1, 2, 0), upper=False)  # C K N
+            XtZt_active = einsum("cin,ci->cn", Xt_active, Zt_active.squeeze(-1))
+            if self.mixed_precision:
+                # see NormalLikelihoodSampler._compute_add_prob
+                V = torch.cat([Xt_active, (XtZt_active - self.Y).unsqueeze(-2)], dim=-2).reshape(-1, self.N).t()
+                XtV = tiled_rmatmat(self.X, V, self.tile_size, self.dtype, self.num_threads)[:P].reshape(P, C, -1)
+            else:
+                V = torch.cat([Xt_active, XtZt_active.unsqueeze(-2)], dim=-2).reshape(-1, self.N).t()
+                if self.X_lazy:
+                    XtV = self.X.rmatmat(V)
+                else:
+                    XtV = tiled_rmatmat(self.X, V, self.tile_size, num_threads=self.num_threads)
+                XtV = XtV[:P].reshape(P, C, -1)
+            G_k_inv = XX_k + self.tau - XtV[..., :-1].pow(2.0).sum(-1).t()
+            W_k = XtV[..., -1].t() if self.mixed_precision else XtV[..., -1].t() - Z_k
+        W_k_sq = W_k.pow(2.0) / (G_k_inv + self.epsilon)
+
+        # quantities for removing each active covariate: with F = XX_active^{-1} the leave-one-out
+        # quantities follow from the diagonal of F and do not require additional factorizations
+        L_inv = trisolve(L_active, torch.eye(L_active.size(-1), device=self.device, dtype=self.dtype)
+                         .expand_as(L_active), upper=False)
+        F_diag = L_inv.pow(2.0).sum(-2)[:, :K]
+        Zt_active_loo_sq = Zt_active_sq - beta_active[:, :K].pow(2.0) / F_diag
+
+        if isinstance(self.h, torch.Tensor):
+            log_h_ratio_inactive, log_h_ratio_active = sample._log_h_ratio, sample._log_h_ratio[active]
+        else:
+            log_h_ratio_inactive = log_h_ratio_active = sample._log_h_ratio
+
+        if self.prior == 'gprior':
+            log_S_ratio = -torch.log1p(-self.c_one_c * W_k_sq / (self.YY - self.c_one_c * Zt_active_sq))
+            log_odds = log_h_ratio_inactive - self.log_one_c_sqrt + 0.5 * self.N_nu0 * log_S_ratio
+
+            log_S_ratio = torch.log(self.YY - self.c_one_c * Zt_active_loo_sq) -\
+                torch.log(self.YY - self.c_one_c * Zt_active_sq)
+            log_odds_active = log_h_ratio_active - self.log_one_c_sqrt + 0.5 * self.N_nu0 * log_S_ratio
+        elif self.prior == 'isotropic':
+            log_det_inactive = -0.5 * G_k_inv.log() + 0.5 * math.log(self.tau)
+            log_S_ratio = -torch.log1p(- W_k_sq / (self.YY - Zt_active_sq))
+            log_odds = log_h_ratio_inactive + log_det_inactive + 0.5 * self.N_nu0 * log_S_ratio
+
+            log_det_active = 0.5 * F_diag.log() + 0.5 * math.log(self.tau)
+            log_S_ratio = (self.YY - Zt_active_loo_sq).log() - (self.YY - Zt_active_sq).log()
+            log_odds_active = log_h_ratio_active + log_det_active + 0.5 * self.N_nu0 * log_S_ratio
+
+        log_odds = log_odds.expand(C, P).clone()
+        log_odds[chains.unsqueeze(-1).expand(C, K)[valid], active[valid]] = log_odds_active.expand(C, K)[valid]
+
+        if self.compute_betas:
+            epsilon = torch.randn(C, activeb.size(-1), 1, device=self.device, dtype=self.dtype)
+            if self.prior == 'gprior':
+                beta_active = self.c_one_c * beta_active + \
+                    self.c_one_c_sqrt * trisolve(L_active, epsilon, upper=False).squeeze(-1)
+            else:
+                beta_active = beta_active + trisolve(L_active, epsilon, upper=False).squeeze(-1)
+            sample.beta = self.Z.new_zeros(C, P + Pa)
+            sample.beta[chains.unsqueeze(-1).expand_as(activeb)[validb], activeb[validb]] = beta_active[validb]
+
+        return log_odds
+
+    def _compute_probs(self, sample):
+        with self.profile.phase('compute_add_prob'):
+            sample.add_prob = sigmoid(self._compute_add_prob(sample))
+
+        gamma = sample.gamma.type_as(sample.add_prob)
+        prob_gamma_i = gamma * sample.add_prob + (1.0 - gamma) * (1.0 - sample.add_prob)
+        i_prob = 0.5 * (sample.add_prob + self.explore) / (prob_gamma_i + self.epsilon)
+
+        if hasattr(self, 'h_alpha') and self.t <= self.T_burnin:  # adapt xi
+            self.xi += (self.xi_target - self.xi / (self.xi + i_prob.sum(-1, keepdim=True))) / math.sqrt(self.t + 1)
+
+        sample._i_prob = torch.cat([self.xi, i_prob], dim=-1)
+
+        return sample
+
+    def mcmc_move(self, sample):
+        self.t += 1
+
+        sample._idx = Categorical(probs=sample._i_prob).sample() - 1
+
+        flip = sample._idx >= 0
+        chains = torch.arange(self.num_chains, device=self.device)
+        sample.gamma[chains[flip], sample._idx[flip]] = ~sample.gamma[chains[flip], sample._idx[flip]]
+        if hasattr(self, 'h_alpha') and not flip.all().item():
+            sample = self.sample_alpha_beta(sample, ~flip)
+
+        sample = self._compute_probs(sample)
+        sample.weight = sample._i_prob.mean(-1).reciprocal()
+
+        return sample
+
+    def sample_alpha_beta(self, sample, chains):
+        num_active = sample.gamma[chains].sum(-1).type_as(sample.h_alpha)
+        sample.h_alpha[chains] = self.h_alpha + num_active
+        sample.h_beta[chains] = self.h_beta + self.P - num_active
+        h = Beta(sample.h_alpha[chains], sample.h_beta[chains]).sample()
+        sample._log_h_ratio[chains] = (h.log() - torch.log1p(-h)).unsqueeze(-1)
+        return sample
@@ -1,7 +1,17 @@
+import copy
+
+import torch
+
+from .util import load_checkpoint_file, save_checkpoint_file
+
+
 class MCMCSampler(object):
     """
     Base class for all MCMC samplers.
     """
+    # attributes that are updated during MCMC and that are required to continue a chain from a checkpoint
+    _state_attributes = ['t', 'T_burnin', 'xi', 'profile']
+
     def initialize_sample(self, seed=None):
         raise NotImplementedError
 
@@ -9,13 +19,68 @@ class MCMCSampler(object):
         self.t = 0
         self.T_burnin = T_burnin
         sample = self.initialize_sample(seed=seed)
+        yield from self._mcmc_steps(sample, T_burnin + T)
 
-        for step in range(T_burnin + T):
+    def _mcmc_steps(self, sample, num_steps):
+        for step in range(self.t, num_steps):
             sample = self.mcmc_move(sample)
-            if step >= T_burnin:
+            if step >= self.T_burnin:
                 yield (True, sample)
             else:
                 yield (False, sample)
 
     def mcmc_move(self, sample):
         raise NotImplementedError
+
+    def get_state(self, sample):
+        """
+        Return a copy of the complete MCMC state, i.e. the current `sample`, the adapted parameters,
+        the iteration counter and the state of the random number generators.
+        """
+        state = {name: getattr(self, name) for name in self._state_attributes if hasattr(self, name)}
+        state['sample'] = sample
+        state = copy.deepcopy(state)
+        state['torch_rng_state'] = torch.get_rng_state()
+        if torch.cuda.is_initialized():
+            state['cuda_rng_state'] = torch.cuda.get_rng_state_all()
+        return state
+
+    def set_state(self, state):
+        """
+        Restore an MCMC state returned by :meth:`get_state` and return the corresponding sample.
+        """
+        state = copy.deepcopy(state)
+        for name in self._state_attributes:
+            if name in state:
+                setattr(self, name, state[name])
+        torch.set_rng_state(state['torch_rng_state'])
+        if 'cuda_rng_state' in state:
+            torch.cuda.set_rng_state_all(state['cuda_rng_state'])
+        return state['sample']
+
+    def save_checkpoint(self, path, sample):
+        """
+        Save the complete MCMC state to `path` so that the chain can be continued with :meth:`resume`.
+
+        :param str path: The checkpoint file.
+        :param sample: The most recent sample yielded by :meth:`mcmc_chain` or :meth:`resume`.
+        """
+        save_checkpoint_file(self.get_state(sample), path)
+
+    def resume(self, checkpoint, T):
+        """
+        Continue an MCMC chain from a checkpoint. The chain continues exactly where it stopped (without
+        additional burn-in) and runs until `T` samples have been generated after burn-in, counting the
+        samples generated before the checkpoint was saved. Like :meth:`mcmc_chain` this returns a generator.
+
+        :param checkpoint: A path to a checkpoint written by :meth:`save_checkpoint` or a state
+            returned by :meth:`get_state`.
+        :param int T: The total number of MCMC samples to generate after burn-in.
+        """
+        if isinstance(checkpoint, str):
+            checkpoint = load_checkpoint_file(checkpoint)
+        sample = self.set_state(checkpoint)
+        if not isinstance(T, int) or T < self.t - self.T_burnin:
+            raise ValueError("T must be an integer that is at least as large as the number of samples " +
+                             "generated after burn-in before the checkpoint was saved.")
+        return self._mcmc_steps(sample, self.T_burnin + T)
@@ -1,15 +1,28 @@
 import math
+import os
 import time
 
 import numpy as np
 import pandas as pd
 import torch
+from tqdm import tqdm
 from tqdm.contrib import tenumerate
 
 from millipede import CountLikelihoodSampler, NormalLikelihoodSampler
 
-from .containers import SimpleSampleContainer, StreamingSampleContainer
-from .util import namespace_to_numpy
+from .containers import (
+    ChunkedSampleContainer,
+    SimpleSampleContainer,
+    StreamingSampleContainer,
+    TorchStreamingSampleContainer,
+    reopen_container,
+)
+from .util import (
+    SamplerProfile,
+    load_checkpoint_file,
+    namespace_to_numpy,
+    save_checkpoint_file,
+)
 
 
 def populate_alpha_beta_stats(container, stats):
@@ -23,8 +36,12 @@ def populate_weight_stats(selector, stats, weights, quantiles=[5.0, 10.0, 20.0,
     s = "5/10/20/50/90/95:  {:.2e}  {:.2e}  {:.2e}  {:.2e}  {:.2e}  {:.2e}"
     stats['Weight quantiles'] = s.format(q5, q10, q20, q50, q90, q95)
     s = "mean/std/min/max:  {:.2e}  {:.2e}  {:.2e}  {:.2e}"
-    stats['Weight moments'] = s.format(weights.mean().item(), weights.std().item(),
-                                       weights.min().item(), weights.max().item())
+    if hasattr(selector.container, 'weight_moments'):
+        # the weights of a streaming container are a reservoir sample, but its moments are exact
+        stats['Weight moments'] = s.format(*selector.container.weight_moments)
+    else:
+        stats['Weight moments'] = s.format(weights.mean().item(), weights.std().item(),
+                                           weights.min().item(), weights.max().item())
 
     T, T_burnin = selector.T, selector.T_burnin
     elapsed_time = time.time() - selector.ts[0]
@@ -33,13 +50,79 @@ def populate_weight_stats(selector, stats, weights, quantiles=[5.0, 10.0, 20.0,
     stats['Mean iteration time'] = "{:.3f} ms".format(1000.0 * elapsed_time / (T + T_burnin))
     stats['Number of retained samples'] = T
     stats['Number of burn-in samples'] = T_burnin
+    pip_mcse = getattr(selector.container, 'pip_mcse', None)
+    if pip_mcse is not None and np.isfinite(pip_mcse).all():
+        stats['Max PIP MCSE'] = "{:.2e}".format(pip_mcse.max())
+        stats['Max coefficient MCSE'] = "{:.2e}".format(selector.container.beta_mcse.max())
+    if getattr(selector, 'num_chains', 1) > 1:
+        stats['Number of chains'] = selector.num_chains
+
+
+def populate_profile_stats(profile, stats):
+    phases = sorted(profile.phase_times.items(), key=lambda item: -item[1])
+    for name, elapsed_time in phases:
+        s = "{:.2f} seconds ({:.3f} ms per call)"
+        stats['Time in ' + name] = s.format(elapsed_time, 1000.0 * elapsed_time / profile.phase_calls[name])
+    for name, count in profile.events.items():
+        stats[name] = count
+    if profile.active_set_count > 0:
+        s = "mean/min/max:  {:.2f}  {}  {}"
+        stats['Active set size'] = s.format(profile.mean_active_set_size, profile.active_set_min,
+                                            profile.active_set_max)
+
+
+def _run_chain(args):
+    """
+    Run a single MCMC chain in a worker process. Used by :meth:`BayesianVariableSelector.run`
+    if `num_chains > 1`.
+    """
+    chain, (sampler, T, T_burnin, streaming, delta_gamma, coinclusion, max_pairs, seed, num_threads) = args
+    torch.set_num_threads(num_threads)
+    if streaming:
+        container = StreamingSampleContainer(coinclusion=coinclusion, max_pairs=max_pairs)
+    else:
+        container = SimpleSampleContainer(delta_gamma=delta_gamma, T=T)
+    for burned, sample in sampler.mcmc_chain(T=T, T_burnin=T_burnin, seed=seed):
+        if burned:
+            container(namespace_to_numpy(sample))
+    sampler_stats = {name: getattr(sampler, name) for name in _SAMPLER_STATS if hasattr(sampler, name)}
+    return chain, container, sampler_stats
+
+
+def _validate_checkpoint_args(checkpoint_path, checkpoint_frequency):
+    if checkpoint_frequency is not None:
+        if not isinstance(checkpoint_frequency, int) or checkpoint_frequency < 1:
+            raise ValueError("checkpoint_frequency must be a positive integer or None.")
+        if checkpoint_path is None:
+            raise ValueError("checkpoint_frequency requires checkpoint_path.")
+
+
+def _validate_mcse_tolerance(mcse_tolerance, streaming):
+    if mcse_tolerance is not None:
+        if not isinstance(mcse_tolerance, float) or mcse_tolerance <= 0.0:
+            raise ValueError("mcse_tolerance must be a positive float or None.")
+        if not streaming:
+            raise ValueError("mcse_tolerance requires streaming=True.")
+
+
+_SAMPLER_STATS = ['xi', 'acceptance_probs', 'accepted_omega_updates', 'attempted_omega_updates', 'profile']
 
 
 class BayesianVariableSelector(object):
     """
     Base class for all Bayesian variable selection classes.
     """
-    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=200, streaming=True, seed=None):
+    # the number of batches used to estimate Monte Carlo standard errors and how often (in MCMC iterations)
+    # the stopping rule is checked if run() is called with mcse_tolerance
+    mcse_num_batches = 32
+    mcse_check_frequency = 100
+    # if not None and run() is called with coinclusion=True, at most (roughly) this many pairs of covariates
+    # are kept, see millipede.containers.CoinclusionAccumulator
+    coinclusion_max_pairs = None
+
+    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=200, streaming=True, seed=None,
+            num_chains=1, num_workers=None, checkpoint_path=None, checkpoint_frequency=None, mcse_tolerance=None,
+            delta_gamma=False, memmap_dir=None, chunk_dir=None, coinclusion=False):
         r"""
         Run MCMC inference for :math:`T + T_{\rm burn-in}` iterations. After completion the results
         of the MCMC run can be accessed in the `summary` and `stats` attributes. Additionally,
@@ -66,46 +149,247 @@ class BayesianVariableSelector(object):
             online. Otherwise all `T` MCMC samples are stored in memory. Defaults to True. Only disable streaming if
             you wish to do something with the samples in the `samples` attribute (and have sufficient memory available).
         :param int seed: Random number seed for reproducibility. Defaults to None.
+        :param int num_chains: The number of independent MCMC chains to run. If larger than 1, chains are run
+            in parallel in separate worker processes, each chain generates `T` retained samples, and the summary
+            statistics of all chains are merged. Each chain uses a distinct random number stream derived
+            from `seed`. Defaults to 1.
+        :param int num_workers: The number of worker processes used if `num_chains > 1`. Defaults to None,
+            in which case `min(num_chains, os.cpu_count())` workers are used.
+        :param str checkpoint_path: If not None, the complete MCMC state is saved to this file at the end of the
+            run (and every `checkpoint_frequency` iterations) so that the run can be continued with :meth:`resume`,
+            e.g. after the process was preempted or in order to generate more samples. Defaults to None.
+            Not supported if `num_chains > 1`.
+        :param int checkpoint_frequency: If not None, a checkpoint is saved to `checkpoint_path` every
+            `checkpoint_frequency` MCMC iterations (including burn-in iterations). Defaults to None.
+        :param float mcse_tolerance: If not None, the run stops early once the Monte Carlo standard error (MCSE)
+            of every PIP is below `mcse_tolerance` (e.g. 0.01), in which case `T` is the maximum number of samples
+            generated after burn-in. MCSEs are estimated with batch means using at least `mcse_num_batches` batches
+            and the stopping rule is checked every `mcse_check_frequency` iterations. The number of retained
+            samples is reported in `stats`. Only supported if `streaming == True` and `num_chains == 1`.
+            Defaults to None.
+        :param bool delta_gamma: If True and `streaming == False`, the inclusion indicators :math:`\gamma` of the
+            stored samples are delta-encoded, i.e. only the first :math:`\gamma` and the covariates that change from
+            one sample to the next are stored. This reduces the memory required to store :math:`\gamma` from
+            O(T x P) to O(T + P). In this case `samples.gamma` is a :class:`millipede.containers.DeltaEncodedGamma`
+            that reconstructs :math:`\gamma` on demand. Defaults to False.
+        :param str memmap_dir: If not None and `streaming == False`, the samples are written to memory-mapped
+            `.npy` files in this directory (one file per sample site, e.g. `add_prob.npy`) instead of being
+            kept in memory. Not supported if `num_chains > 1`. Defaults to None.
+        :param str chunk_dir: If not None and `streaming == False`, the samples are written to disk in compressed
+            chunks by a background thread instead of being kept in memory, see
+            :class:`millipede.containers.ChunkedSampleContainer`. At the end of the run the `samples` attribute is
+            memory-mapped from files in this directory and `samples.gamma` is a
+            :class:`millipede.containers.PackedGamma`. Not supported if `num_chains > 1` or together with
+            `memmap_dir` or `delta_gamma`. Defaults to None.
+        :param bool coinclusion: If True, the pairwise co-inclusion probabilities
+            :math:`p(\gamma_i = 1, \gamma_j = 1)` are accumulated online from the active set of each sample.
+            After completion they can be accessed in the `coinclusion` attribute, a symmetric P x P
+            `scipy.sparse.csr_matrix` whose rows and columns are ordered like `pip`. If `coinclusion_max_pairs`
+            is not None, only (roughly) the `coinclusion_max_pairs` largest entries are kept to bound memory usage.
+            Only supported if `streaming == True`. Defaults to False.
         """
         if not isinstance(T, int) and T > 0:
             raise ValueError("T must be a positive integer.")
         if not isinstance(T_burnin, int) and T_burnin > 0:
             raise ValueError("T_burnin must be a positive integer.")
+        if not isinstance(num_chains, int) or num_chains < 1:
+            raise ValueError("num_chains must be a positive integer.")
+        if num_workers is not None and (not isinstance(num_workers, int) or num_workers < 1):
+            raise ValueError("num_workers must be a positive integer or None.")
+        _validate_checkpoint_args(checkpoint_path, checkpoint_frequency)
+        if checkpoint_path is not None and num_chains > 1:
+            raise ValueError("Checkpoints are not supported if num_chains > 1.")
+        _validate_mcse_tolerance(mcse_tolerance, streaming)
+        if mcse_tolerance is not None and num_chains > 1:
+            raise ValueError("mcse_tolerance is not supported if num_chains > 1.")
+        if memmap_dir is not None and num_chains > 1:
+            raise ValueError("memmap_dir is not supported if num_chains > 1.")
+        if coinclusion and not streaming:
+            raise ValueError("coinclusion requires streaming=True.")
+        if chunk_dir is not None and (num_chains > 1 or memmap_dir is not None or delta_gamma):
+            raise ValueError("chunk_dir is not supported if num_chains > 1 or together with memmap_dir or delta_gamma.")
 
         self.T = T
         self.T_burnin = T_burnin
+        self.num_chains = num_chains
+        self._sampler_state = None
+
+        if num_chains > 1:
+            self._run_chains(T, T_burnin, verbosity, streaming, delta_gamma, seed, num_chains, num_workers,
+                             coinclusion)
+            self._summarize(verbosity)
+            return
 
         if streaming:
-            self.container = StreamingSampleContainer()
+            # accumulate on the device of the sampler to avoid copying every sample to the host
+            self.container = TorchStreamingSampleContainer(num_batches=self.mcse_num_batches, coinclusion=coinclusion,
+                                                           max_pairs=self.coinclusion_max_pairs)
+        elif chunk_dir is not None:
+            self.container = ChunkedSampleContainer(chunk_dir)
         else:
-            self.container = SimpleSampleContainer()
+            self.container = SimpleSampleContainer(delta_gamma=delta_gamma, T=T, memmap_dir=memmap_dir)
 
         self.ts = [time.time()]
+        chain = self.sampler.mcmc_chain(T=T, T_burnin=T_burnin, seed=seed)
+        self._process_samples(chain, 0, verbosity, report_frequency, streaming, checkpoint_path, checkpoint_frequency,
+                              mcse_tolerance)
+        self._summarize(verbosity)
+
+    def resume(self, checkpoint_path, T=None, verbosity='bar', report_frequency=200, checkpoint_frequency=None,
+               mcse_tolerance=None):
+        r"""
+        Continue an MCMC run from a checkpoint written by :meth:`run` or :meth:`save_checkpoint`. The run continues
+        exactly where it stopped without any additional burn-in, i.e. the resulting samples are identical to those
+        of an uninterrupted run with the same seed. Afterwards the `summary` and `stats` attributes reflect all
+        samples, including those generated before the checkpoint was saved. The checkpoint is updated in place.
+
+        :param str checkpoint_path: The checkpoint file.
+        :param int T: The total number of MCMC samples that are generated after burn-in, including the samples
+            generated before the checkpoint was saved. This can be larger than the `T` of the original run
+            to generate additional samples. Defaults to None, in which case the original `T` is used.
+        :param str verbosity: Controls the verbosity of the `resume` method. See :meth:`run`.
+        :param int report_frequency: Controls the frequency with which progress is reported if the `verbosity`
+            argument is `stdout`. Defaults to 200.
+        :param int checkpoint_frequency: If not None, a checkpoint is saved to `checkpoint_path` every
+            `checkpoint_frequency` MCMC iterations. Defaults to None.
+        :param float mcse_tolerance: If not None, the run stops early once the MCSE of every PIP is below
+            `mcse_tolerance`. See :meth:`run`. Defaults to None.
+        """
+        _validate_checkpoint_args(checkpoint_path, checkpoint_frequency)
+        checkpoint = load_checkpoint_file(checkpoint_path)
+        T = checkpoint['T'] if T is None else T
+        chain = self.sampler.resume(checkpoint['sampler'], T)
+
+        self.T = T
+        self.T_burnin = checkpoint['T_burnin']
+        self.num_chains = 1
+        self._sampler_state = checkpoint['sampler']
+        self.container = checkpoint['container']
+        reopen_container(self.container)
+        streaming = isinstance(self.container, StreamingSampleContainer)
+        _validate_mcse_tolerance(mcse_tolerance, streaming)
+
+        self.ts = [time.time() - checkpoint['elapsed_time']]
+        self._process_samples(chain, self.sampler.t, verbosity, report_frequency, streaming,
+                              checkpoint_path, checkpoint_frequency, mcse_tolerance)
+        self._summarize(verbosity)
+
+    def save_checkpoint(self, path):
+        """
+        Save the complete state of the most recent MCMC run (the state of the sampler, including the state
+        of the random number generators, and the summary statistics collected so far) to `path` so that the run
+        can be continued with :meth:`resume`.
+
+        :param str path: The checkpoint file.
+        """
+        if getattr(self, '_sampler_state', None) is None:
+            raise ValueError("There is no MCMC state to save. Note that checkpoints are not supported " +
+                             "if num_chains > 1.")
+        checkpoint = {'sampler': self._sampler_state,
+                      'container': self.container,
+                      'T': self.T,
+                      'T_burnin': self.T_burnin,
+                      'elapsed_time': self.ts[-1] - self.ts[0]}
+        save_checkpoint_file(checkpoint, path)
+
+    def _process_samples(self, chain, t_start, verbosity, report_frequency, streaming,
+                         checkpoint_path, checkpoint_frequency, mcse_tolerance):
+        T, T_burnin = self.T, self.T_burnin
         digits_to_print = str(1 + int(math.log(T + T_burnin + 1, 10)))
 
         if verbosity == 'bar':
-            enumerate_samples = tenumerate(self.sampler.mcmc_chain(T=T, T_burnin=T_burnin, seed=seed),
-                                           total=T + T_burnin)
+            enumerate_samples = tenumerate(chain, start=t_start, total=T + T_burnin - t_start)
         else:
-            enumerate_samples = enumerate(self.sampler.mcmc_chain(T=T, T_burnin=T_burnin, seed=seed))
+            enumerate_samples = enumerate(chain, start=t_start)
 
+        sample = None
         for t, (burned, sample) in enumerate_samples:
             self.ts.append(time.time())
             if burned:
-                self.container(namespace_to_numpy(sample))
+                if isinstance(self.container, TorchStreamingSampleContainer):
+                    self.container(sample)
+                else:
+                    self.container(namespace_to_numpy(sample))
+                if mcse_tolerance is not None and (t + 1 - T_burnin) % self.mcse_check_frequency == 0 and \
+                        self.container.pip_mcse.max() < mcse_tolerance:
+                    self.T = t + 1 - T_burnin
+                    if verbosity == 'stdout':
+                        print("[Iteration {}]\tstopping early since the MCSE of all PIPs is below {}".format(
+                              t, mcse_tolerance))
+                    break
+            if checkpoint_frequency is not None and (t + 1) % checkpoint_frequency == 0 and t + 1 < T + T_burnin:
+                self._sampler_state = self.sampler.get_state(sample)
+                self.save_checkpoint(checkpoint_path)
             if verbosity == 'stdout' and (t % report_frequency == 0 or t == T + T_burnin - 1):
                 s = ("[Iteration {:0" + digits_to_print + "d}]").format(t)
                 s += "\t# of active features: {}".format(sample.gamma.sum().item())
-                if t >= report_frequency:
+                if len(self.ts) > report_frequency:
                     dt = 1000.0 * (self.ts[-1] - self.ts[-1 - report_frequency]) / report_frequency
                     s += "   mean iteration time: {:.2f} ms".format(dt)
                 print(s)
 
+        if sample is not None:
+            self._sampler_state = self.sampler.get_state(sample)
+        if checkpoint_path is not None:
+            self.save_checkpoint(checkpoint_path)
+        self._finalize_container(streaming)
+
+    def _summarize(self, verbosity):
+        raise NotImplementedError
+
+    def _finalize_container(self, streaming):
         if not streaming:
             self.samples = self.container.samples
             self.weights = self.samples.weight
+            self.coinclusion = None
         else:
-            self.weights = np.array(self.container._weights)
+            self.weights = self.container.weight_reservoir
+            self.coinclusion = self.container.coinclusion
+
+    def _run_chains(self, T, T_burnin, verbosity, streaming, delta_gamma, seed, num_chains, num_workers,
+                    coinclusion):
+        num_workers = min(num_chains, os.cpu_count() or 1) if num_workers is None else num_workers
+        num_threads = max(1, torch.get_num_threads() // num_workers)
+        # derive statistically independent (and reproducible if seed is not None) seeds for each chain
+        seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(num_chains)]
+        max_pairs = self.coinclusion_max_pairs if coinclusion else None
+        args = [(self.sampler, T, T_burnin, streaming, delta_gamma, coinclusion, max_pairs, chain_seed, num_threads)
+                for chain_seed in seeds]
+
+        self.ts = [time.time()]
+        # tensors held by the sampler are moved to shared memory when they are sent to the workers so that the
+        # covariates are not copied once per chain
+        ctx = torch.multiprocessing.get_context('spawn')
+        with ctx.Pool(num_workers) as pool:
+            results = pool.imap_unordered(_run_chain, enumerate(args))
+            if verbosity == 'bar':
+                results = tqdm(results, total=num_chains)
+            chain_results = [None] * num_chains
+            for chain, container, sampler_stats in results:
+                self.ts.append(time.time())
+                chain_results[chain] = (container, sampler_stats)
+                if verbosity == 'stdout':
+                    print("[Chain {}]\tfinished after {:.1f} seconds".format(chain, self.ts[-1] - self.ts[0]))
+
+        # merge in chain order so that the result does not depend on the order in which the workers finish
+        self.container = chain_results[0][0]
+        for container, _ in chain_results[1:]:
+            self.container.merge(container)
+        self._finalize_container(streaming)
+
+        # aggregate sampler diagnostics (e.g. Polya-Gamma MH statistics) across chains
+        for name, value in chain_results[0][1].items():
+            values = [stats[name] for _, stats in chain_results]
+            if isinstance(value, list):
+                value = sum(values, [])
+            elif isinstance(value, SamplerProfile):
+                for other in values[1:]:
+                    value.merge(other)
+            elif isinstance(value, torch.Tensor):
+                value = torch.stack(values).mean(0)
+            else:
+                value = sum(values)
+            setattr(self.sampler, name, value)
 
 
 class NormalLikelihoodVariableSelector(BayesianVariableSelector):
@@ -203,6 +487,9 @@ class NormalLikelihoodVariableSelector(BayesianVariableSelector):
     :param float lambda0: Controls the prior over the variance in the Normal likelihood. Defaults to 0.0.
     :param str precision: Whether computations should be done with 'single' (i.e. 32-bit) or 'double' (i.e. 64-bit)
         floating point precision. Defaults to 'double'. Note that it may be ill-advised to use single precision.
+        Alternatively, if 'mixed', the covariates and all large matrix products involving them are stored and
+        computed in single precision while all computations that involve the active covariates are done in double
+        precision. This roughly halves memory usage with little loss of accuracy.
     :param str device: Whether computations should be done on CPU ('cpu') or GPU ('gpu'). Defaults to 'cpu'.
     :param float explore: This hyperparameter controls how greedy the MCMC algorithm is. Defaults to 5.0.
         For expert users only.
@@ -212,6 +499,10 @@ class NormalLikelihoodVariableSelector(BayesianVariableSelector):
         However, if sufficient memory is available, setting precompute_XX to True should be faster.
     :param float xi_target: This hyperparameter controls how frequently the MCMC algorithm makes :math:`h` updates
         if :math:`h` is a latent variable. Defaults to 0.20. For expert users only.
+    :param int XX_cache_size: If not `None`, the columns of :math:`X^{\rm T} X` that correspond to covariates
+        that enter the model are computed on demand and kept in a least-recently-used cache that holds at most
+        `XX_cache_size` columns. This is a middle ground between `precompute_XX=True` and `precompute_XX=False`
+        that requires :math:`\mathcal{O}(P \times {\rm XX\_cache\_size})` memory. Defaults to `None`.
     """
     def __init__(self, dataframe, response_column,
                  assumed_columns=[],
@@ -222,10 +513,10 @@ class NormalLikelihoodVariableSelector(BayesianVariableSelector):
                  nu0=0.0, lambda0=0.0,
                  precision="double", device="cpu",
                  explore=5, precompute_XX=False,
-                 xi_target=0.2):
+                 xi_target=0.2, XX_cache_size=None):
 
-        if precision not in ['single', 'double']:
-            raise ValueError("precision must be one of `single` or `double`")
+        if precision not in ['single', 'double', 'mixed']:
+            raise ValueError("precision must be one of `single`, `double` or `mixed`")
         if device not in ['cpu', 'gpu']:
             raise ValueError("device must be one of `cpu` or `gpu`")
         if response_column not in dataframe.columns:
@@ -246,6 +537,9 @@ class NormalLikelihoodVariableSelector(BayesianVariableSelector):
         elif precision == 'double':
             X, Y = torch.from_numpy(X.values).double(), torch.from_numpy(Y.values).double()
             X_assumed = None if X_assumed is None else torch.from_numpy(X_assumed.values).double()
+        elif precision == 'mixed':
+            X, Y = torch.from_numpy(X.values).float(), torch.from_numpy(Y.values).double()
+            X_assumed = None if X_assumed is None else torch.from_numpy(X_assumed.values).float()
 
         if device == 'cpu':
             X, Y = X.cpu(), Y.cpu()
@@ -257,7 +551,7 @@ class NormalLikelihoodVariableSelector(BayesianVariableSelector):
         if isinstance(S, pd.Series):
             if set(self.X_columns) != set(S.index):
                 raise ValueError("The index of S must match the named columns of dataframe.")
-            S = torch.from_numpy(S.loc[self.X_columns].values).type_as(X)
+            S = torch.from_numpy(S.loc[self.X_columns].values).type_as(Y)
 
         self.sampler = NormalLikelihoodSampler(X, Y, X_assumed=X_assumed, S=S, c=c, explore=explore,
                                                precompute_XX=precompute_XX, prior=prior,
@@ -265,12 +559,93 @@ class NormalLikelihoodVariableSelector(BayesianVariableSelector):
                                                compute_betas=True, nu0=nu0, lambda0=lambda0,
                                                include_intercept=include_intercept,
                                                verbose_constructor=False,
-                                               xi_target=xi_target)
+                                               xi_target=xi_target, XX_cache_size=XX_cache_size,
+                                               mixed_precision=precision == 'mixed')
+
+    @classmethod
+    def from_sufficient_statistics(cls, XX, XY, YY, N,
+                                   assumed_columns=[],
+                                   S=5, prior="isotropic",
+                                   include_intercept=False,
+                                   tau=0.01, tau_intercept=1.0e-4,
+                                   c=100.0,
+                                   nu0=0.0, lambda0=0.0,
+                                   precision="double", device="cpu",
+                                   explore=5, xi_target=0.2):
+        r"""
+        Construct a :class:`NormalLikelihoodVariableSelector` from the sufficient statistics
+        :math:`X^{\rm T} X`, :math:`X^{\rm T} Y`, :math:`Y^{\rm T} Y` and :math:`N` instead of from a
+        dataframe of covariates and responses. This is useful if the raw data are not available or if
+        :math:`N` is very large. Usage::
+
+            selector = NormalLikelihoodVariableSelector.from_sufficient_statistics(XX, XY, YY, N, ...)
+            selector.run(T=2000, T_burnin=1000)
+            print(selector.summary)
+
+        :param DataFrame XX: A square `pandas.DataFrame` that contains the gram matrix :math:`X^{\rm T} X`.
+            The index and columns must both be given by the covariate names.
+        :param Series XY: A `pandas.Series` that contains :math:`X^{\rm T} Y` and whose index is given by the
+            covariate names.
+        :param float YY: The sum of squared responses :math:`Y^{\rm T} Y`.
+        :param int N: The number of data points.
+        :param list assumed_columns: A list of the names of the covariates that are always assumed to be part of the
+            model. Defaults to [].
+        :param bool include_intercept: Whether to include an intercept term. If True, `XX` and `XY` must contain
+            an entry named 'Intercept' that was computed from a column of ones. Defaults to False.
+
+        All other arguments are as in the :class:`NormalLikelihoodVariableSelector` constructor.
+        """
+        if precision not in ['single', 'double']:
+            raise ValueError("precision must be one of `single` or `double`")
+        if device not in ['cpu', 'gpu']:
+            raise ValueError("device must be one of `cpu` or `gpu`")
+        if XX.columns.tolist() != XX.index.tolist():
+            raise ValueError("The index and the columns of XX must be identical.")
+        if set(XX.columns) != set(XY.index):
+            raise ValueError("The index of XY must match the columns of XX.")
+        if not isinstance(assumed_columns, list) or any([c not in XX.columns for c in assumed_columns]):
+            raise ValueError("assumed_columns must be a list of string names of columns in XX.")
+        if include_intercept and 'Intercept' not in XX.columns:
+            raise ValueError("If include_intercept is True XX must contain a column named 'Intercept'.")
+
+        selector = cls.__new__(cls)
+        selector.X_columns = [c for c in XX.columns if c not in assumed_columns and
+                              not (include_intercept and c == 'Intercept')]
+        selector.assumed_columns = assumed_columns
+        selector.include_intercept = include_intercept
+
+        columns = selector.X_columns + assumed_columns + (['Intercept'] if include_intercept else [])
+        XX, XY = XX.loc[columns, columns], XY.loc[columns]
+
+        if precision == 'single':
+            XX, XY = torch.from_numpy(XX.values).float(), torch.from_numpy(XY.values).float()
+        elif precision == 'double':
+            XX, XY = torch.from_numpy(XX.values).double(), torch.from_numpy(XY.values).double()
+
+        if device == 'cpu':
+            XX, XY = XX.cpu(), XY.cpu()
+        elif device == 'gpu':
+            XX, XY = XX.cuda(), XY.cuda()
+
+        if isinstance(S, pd.Series):
+            if set(selector.X_columns) != set(S.index):
+                raise ValueError("The index of S must match the covariate names.")
+            S = torch.from_numpy(S.loc[selector.X_columns].values).type_as(XX)
 
-    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=200, streaming=True, seed=None):
+        selector.sampler = NormalLikelihoodSampler.from_sufficient_statistics(
+            XX, XY, float(YY), N, P_assumed=len(assumed_columns), S=S, c=c, explore=explore, prior=prior,
+            tau=tau, tau_intercept=tau_intercept, compute_betas=True, nu0=nu0, lambda0=lambda0,
+            include_intercept=include_intercept, verbose_constructor=False, xi_target=xi_target)
+
+        return selector
+
+    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=200, streaming=True, seed=None,
+            **kwargs):
+        # all other keyword arguments are forwarded to BayesianVariableSelector.run, see there for details
         super().run(T=T, T_burnin=T_burnin, verbosity=verbosity, report_frequency=report_frequency,
-                    streaming=streaming, seed=seed)
+                    streaming=streaming, seed=seed, **kwargs)
 
+    def _summarize(self, verbosity):
         self.pip = pd.Series(self.container.pip, index=self.X_columns, name="PIP")
         column_names = self.X_columns + self.assumed_columns
         if self.include_intercept:
@@ -288,6 +663,7 @@ class NormalLikelihoodVariableSelector(BayesianVariableSelector):
         self.stats = {}
         populate_alpha_beta_stats(self.container, self.stats)
         populate_weight_stats(self, self.stats, self.weights)
+        populate_profile_stats(self.sampler.profile, self.stats)
 
         if verbosity == 'stdout':
             for k, v in self.stats.items():
@@ -372,6 +748,9 @@ class BinomialLikelihoodVariableSelector(BayesianVariableSelector):
     :param float tau_intercept: Controls the precision of the intercept in the isotropic prior. Defaults to 1.0e-4.
     :param str precision: Whether computations should be done with 'single' (i.e. 32-bit) or 'double' (i.e. 64-bit)
         floating point precision. Defaults to 'double'. Note that it may be ill-advised to use single precision.
+        Alternatively, if 'mixed', the covariates and all large matrix products involving them are stored and
+        computed in single precision while all computations that involve the active covariates are done in double
+        precision. This roughly halves memory usage with little loss of accuracy.
     :param str device: Whether computations should be done on CPU ('cpu') or GPU ('gpu'). Defaults to 'cpu'.
     :param float explore: This hyperparameter controls how greedy the MCMC algorithm is. Defaults to 5.0.
         For expert users only.
@@ -383,8 +762,8 @@ class BinomialLikelihoodVariableSelector(BayesianVariableSelector):
                  precision="double", device="cpu",
                  explore=5, xi_target=0.25):
 
-        if precision not in ['single', 'double']:
-            raise ValueError("precision must be one of `single` or `double`")
+        if precision not in ['single', 'double', 'mixed']:
+            raise ValueError("precision must be one of `single`, `double` or `mixed`")
         if device not in ['cpu', 'gpu']:
             raise ValueError("device must be one of `cpu` or `gpu`")
         if response_column not in dataframe.columns:
@@ -410,6 +789,10 @@ class BinomialLikelihoodVariableSelector(BayesianVariableSelector):
             X, Y = torch.from_numpy(X.values).double(), torch.from_numpy(Y.values).double()
             TC = torch.from_numpy(TC.values).double()
             X_assumed = None if X_assumed is None else torch.from_numpy(X_assumed.values).double()
+        elif precision == 'mixed':
+            X, Y = torch.from_numpy(X.values).float(), torch.from_numpy(Y.values).double()
+            TC = torch.from_numpy(TC.values).double()
+            X_assumed = None if X_assumed is None else torch.from_numpy(X_assumed.values).float()
 
         if device == 'cpu':
             X, Y, TC = X.cpu(), Y.cpu(), TC.cpu()
@@ -421,17 +804,20 @@ class BinomialLikelihoodVariableSelector(BayesianVariableSelector):
         if isinstance(S, pd.Series):
             if set(self.X_columns) != set(S.index):
                 raise ValueError("The index of S must match the named columns of dataframe.")
-            S = torch.from_numpy(S.loc[self.X_columns].values).type_as(X)
+            S = torch.from_numpy(S.loc[self.X_columns].values).type_as(Y)
 
         self.sampler = CountLikelihoodSampler(X, Y, TC=TC, S=S, X_assumed=X_assumed, explore=explore,
                                               tau=tau, tau_intercept=tau_intercept,
                                               xi_target=xi_target,
-                                              verbose_constructor=False)
+                                              verbose_constructor=False,
+                                              mixed_precision=precision == 'mixed')
 
-    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=100, streaming=True, seed=None):
-        super().run(T=T, T_burnin=T_burnin, verbosity=verbosity,
-                    report_frequency=report_frequency, streaming=streaming, seed=seed)
+    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=100, streaming=True, seed=None,
+            **kwargs):
+        super().run(T=T, T_burnin=T_burnin, verbosity=verbosity, report_frequency=report_frequency,
+                    streaming=streaming, seed=seed, **kwargs)
 
+    def _summarize(self, verbosity):
         self.pip = pd.Series(self.container.pip, index=self.X_columns, name="PIP")
         column_names = self.X_columns + self.assumed_columns + ['Intercept']
 
@@ -448,6 +834,7 @@ class BinomialLikelihoodVariableSelector(BayesianVariableSelector):
         self.stats = {}
         populate_alpha_beta_stats(self.container, self.stats)
         populate_weight_stats(self, self.stats, self.weights)
+        populate_profile_stats(self.sampler.profile, self.stats)
 
         self.stats['Adapted xi value'] = "{:.3f}".format(self.sampler.xi.item())
         s = "Mean acc. prob.: {:.3f}  Accepted/Attempted: {}/{}"
@@ -533,6 +920,9 @@ class BernoulliLikelihoodVariableSelector(BinomialLikelihoodVariableSelector):
     :param float tau_intercept: Controls the precision of the intercept in the isotropic prior. Defaults to 1.0e-4.
     :param str precision: Whether computations should be done with 'single' (i.e. 32-bit) or 'double' (i.e. 64-bit)
         floating point precision. Defaults to 'double'. Note that it may be ill-advised to use single precision.
+        Alternatively, if 'mixed', the covariates and all large matrix products involving them are stored and
+        computed in single precision while all computations that involve the active covariates are done in double
+        precision. This roughly halves memory usage with little loss of accuracy.
     :param str device: Whether computations should be done on CPU ('cpu') or GPU ('gpu'). Defaults to 'cpu'.
     :param float explore: This hyperparameter controls how greedy the MCMC algorithm is. Defaults to 5.0.
         For expert users only.
@@ -549,9 +939,10 @@ class BernoulliLikelihoodVariableSelector(BinomialLikelihoodVariableSelector):
                          S=S, explore=explore, tau=tau, tau_intercept=tau_intercept, precision=precision,
                          device=device, xi_target=xi_target)
 
-    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=100, streaming=True, seed=None):
+    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=100, streaming=True, seed=None,
+            **kwargs):
         super().run(T=T, T_burnin=T_burnin, verbosity=verbosity, report_frequency=report_frequency,
-                    streaming=streaming, seed=seed)
+                    streaming=streaming, seed=seed, **kwargs)
 
 
 class NegativeBinomialLikelihoodVariableSelector(BayesianVariableSelector):
@@ -643,6 +1034,9 @@ class NegativeBinomialLikelihoodVariableSelector(BayesianVariableSelector):
     :param float tau_intercept: Controls the precision of the intercept in the isotropic prior. Defaults to 1.0e-4.
     :param str precision: Whether computations should be done with 'single' (i.e. 32-bit) or 'double' (i.e. 64-bit)
         floating point precision. Defaults to 'double'. Note that it may be ill-advised to use single precision.
+        Alternatively, if 'mixed', the covariates and all large matrix products involving them are stored and
+        computed in single precision while all computations that involve the active covariates are done in double
+        precision. This roughly halves memory usage with little loss of accuracy.
     :param str device: Whether computations should be done on CPU ('cpu') or GPU ('gpu'). Defaults to 'cpu'.
     :param float log_nu_rw_scale: This hyperparameter controls the proposal distribution for :math:`\log \nu` updates.
         Defaults to 0.05. For expert users only.
@@ -659,8 +1053,8 @@ class NegativeBinomialLikelihoodVariableSelector(BayesianVariableSelector):
                  log_nu_rw_scale=0.05, explore=5.0,
                  xi_target=0.25, init_nu=5.0):
 
-        if precision not in ['single', 'double']:
-            raise ValueError("precision must be one of `single` or `double`")
+        if precision not in ['single', 'double', 'mixed']:
+            raise ValueError("precision must be one of `single`, `double` or `mixed`")
         if device not in ['cpu', 'gpu']:
             raise ValueError("device must be one of `cpu` or `gpu`")
         if response_column not in dataframe.columns:
@@ -686,6 +1080,10 @@ class NegativeBinomialLikelihoodVariableSelector(BayesianVariableSelector):
             X, Y = torch.from_numpy(X.values).double(), torch.from_numpy(Y.values).double()
             psi0 = torch.from_numpy(psi0.values).double()
             X_assumed = None if X_assumed is None else torch.from_numpy(X_assumed.values).double()
+        elif precision == 'mixed':
+            X, Y = torch.from_numpy(X.values).float(), torch.from_numpy(Y.values).double()
+            psi0 = torch.from_numpy(psi0.values).double()
+            X_assumed = None if X_assumed is None else torch.from_numpy(X_assumed.values).float()
 
         if device == 'cpu':
             X, Y, psi0 = X.cpu(), Y.cpu(), psi0.cpu()
@@ -697,18 +1095,21 @@ class NegativeBinomialLikelihoodVariableSelector(BayesianVariableSelector):
         if isinstance(S, pd.Series):
             if set(self.X_columns) != set(S.index):
                 raise ValueError("The index of S must match the named columns of dataframe.")
-            S = torch.from_numpy(S.loc[self.X_columns].values).type_as(X)
+            S = torch.from_numpy(S.loc[self.X_columns].values).type_as(Y)
 
         self.sampler = CountLikelihoodSampler(X, Y, X_assumed=X_assumed, psi0=psi0, S=S, explore=explore,
                                               tau=tau, tau_intercept=tau_intercept,
                                               log_nu_rw_scale=log_nu_rw_scale,
                                               xi_target=xi_target, init_nu=init_nu,
-                                              verbose_constructor=False)
+                                              verbose_constructor=False,
+                                              mixed_precision=precision == 'mixed')
 
-    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=100, streaming=True, seed=None):
+    def run(self, T=2000, T_burnin=1000, verbosity='bar', report_frequency=100, streaming=True, seed=None,
+            **kwargs):
         super().run(T=T, T_burnin=T_burnin, verbosity=verbosity, report_frequency=report_frequency,
-                    streaming=streaming, seed=seed)
+                    streaming=streaming, seed=seed, **kwargs)
 
+    def _summarize(self, verbosity):
         self.pip = pd.Series(self.container.pip, index=self.X_columns, name="PIP")
         column_names = self.X_columns + self.assumed_columns + ['Intercept']
 
@@ -725,6 +1126,7 @@ class NegativeBinomialLikelihoodVariableSelector(BayesianVariableSelector):
         self.stats = {}
         populate_alpha_beta_stats(self.container, self.stats)
         populate_weight_stats(self, self.stats, self.weights)
+        populate_profile_stats(self.sampler.profile, self.stats)
 
         self.stats['nu posterior'] = '{:.3f} +- {:.3f}'.format(self.container.nu, self.container.nu_std)
         self.stats['log(nu) posterior'] = '{:.3f} +- {:.3f}'.format(self.container.log_nu, self.container.log_nu_std)
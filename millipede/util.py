@@ -1,14 +1,31 @@
+import copy
+import os
+import pickle
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from types import SimpleNamespace
 
 import numpy as np
 import torch
+from torch.linalg import solve_triangular as trisolve
+from torch.profiler import record_function
 
 
-def safe_cholesky(A, epsilon=1.0e-8):
+def safe_cholesky(A, epsilon=1.0e-8, profile=None):
     """
     Equivalent of torch.linalg.cholesky that progressively adds
-    diagonal jitter to avoid cholesky errors.
+    diagonal jitter to avoid cholesky errors. If a :class:`SamplerProfile` is provided, the time spent
+    in this function and the number of jitter retries are recorded.
     """
+    if profile is None:
+        return _safe_cholesky(A, epsilon)
+    with profile.phase('safe_cholesky'):
+        return _safe_cholesky(A, epsilon, profile)
+
+
+def _safe_cholesky(A, epsilon=1.0e-8, profile=None):
     if A.shape == (1, 1):
         return A.sqrt()
     try:
@@ -17,6 +34,8 @@ def safe_cholesky(A, epsilon=1.0e-8):
         Aprime = A.clone()
         jitter_prev = 0.0
         for i in range(5):
+            if profile is not None:
+                profile.event('Cholesky jitter retries')
             jitter_new = epsilon * (10 ** i)
             Aprime.diagonal(dim1=-2, dim2=-1).add_(jitter_new - jitter_prev)
             jitter_prev = jitter_new
@@ -27,44 +46,506 @@ def safe_cholesky(A, epsilon=1.0e-8):
         raise e
 
 
-def get_loo_inverses(F):
-    N = F.size(-1)
+class SamplerProfile(object):
+    """
+    Records the wall-clock time and number of calls of named phases, counts of numerical events
+    and running statistics of the active set size of an MCMC sampler.
+    """
+    def __init__(self):
+        self.phase_times = defaultdict(float)
+        self.phase_calls = defaultdict(int)
+        # jitter retries are always reported, even if there were none
+        self.events = defaultdict(int)
+        self.events.setdefault('Cholesky jitter retries', 0)
+        self.active_set_count = 0
+        self.active_set_sum = 0
+        self.active_set_min = None
+        self.active_set_max = None
+
+    def phase(self, name):
+        """
+        Return a context manager that records the time spent in the phase `name`.
+        """
+        return _ProfilePhase(self, name)
+
+    def event(self, name, count=1):
+        """
+        Increment the counter of the numerical event `name` by `count`.
+        """
+        self.events[name] += count
+
+    def active_set_size(self, size):
+        """
+        Record the size of the active set at an MCMC iteration.
+        """
+        self.active_set_count += 1
+        self.active_set_sum += size
+        self.active_set_min = size if self.active_set_min is None else min(self.active_set_min, size)
+        self.active_set_max = size if self.active_set_max is None else max(self.active_set_max, size)
+
+    @property
+    def mean_active_set_size(self):
+        """
+        The mean size of the active set over all recorded MCMC iterations or None if none were recorded.
+        """
+        return self.active_set_sum / self.active_set_count if self.active_set_count > 0 else None
+
+    def merge(self, other):
+        """
+        Merge the statistics of another profile (e.g. from an independent MCMC chain) into this profile.
+        """
+        for name, value in other.phase_times.items():
+            self.phase_times[name] += value
+        for name, value in other.phase_calls.items():
+            self.phase_calls[name] += value
+        for name, value in other.events.items():
+            self.events[name] += value
+        self.active_set_count += other.active_set_count
+        self.active_set_sum += other.active_set_sum
+        for size in [other.active_set_min, other.active_set_max]:
+            if size is not None:
+                self.active_set_min = size if self.active_set_min is None else min(self.active_set_min, size)
+                self.active_set_max = size if self.active_set_max is None else max(self.active_set_max, size)
+
+
+class _ProfilePhase(object):
+    __slots__ = ('profile', 'name', 'start', 'range')
+
+    def __init__(self, profile, name):
+        self.profile, self.name = profile, name
+
+    def __enter__(self):
+        self.range = record_function(self.name).__enter__() if torch._C._autograd._profiler_enabled() else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profile.phase_times[self.name] += time.perf_counter() - self.start
+        self.profile.phase_calls[self.name] += 1
+        if self.range is not None:
+            self.range.__exit__(*args)
+
+
+def cholesky_update(L, x, M=None, m=None):
+    """
+    Given the Cholesky factor L of A, compute the Cholesky factor of A + x x^T with Givens rotations.
+    If M and m are provided, the same rotations are applied to [m, M] and the rotated M is returned as well.
+    """
+    L, x = L.clone(), x.clone()
+    if M is not None:
+        M, m = M.clone(), m.clone()
+    for k in range(L.size(-1)):
+        r = torch.hypot(L[k, k], x[k])
+        cos, sin = L[k, k] / r, x[k] / r
+        L_k = L[k:, k].clone()
+        L[k:, k] = cos * L_k + sin * x[k:]
+        x[k:] = cos * x[k:] - sin * L_k
+        if M is not None:
+            M_k = M[:, k].clone()
+            M[:, k] = cos * M_k + sin * m
+            m = cos * m - sin * M_k
+    return L if M is None else (L, M)
+
+
+def cholesky_insert(L, i, a, M=None, x=None):
+    """
+    Given the Cholesky factor L of A, compute the Cholesky factor of A with the row/column `a` inserted
+    at position `i`. If M = X L^{-T} and the new column `x` of X are provided, M is updated alongside L.
+    Raises a RuntimeError if the resulting matrix is not numerically positive definite.
+    """
+    D = L.size(-1)
+    L11, L31, L33 = L[:i, :i], L[i:, :i], L[i:, i:]
+
+    l12 = trisolve(L11, a[:i].unsqueeze(-1), upper=False).squeeze(-1)
+    l22_sq = a[i] - l12.pow(2.0).sum()
+    if not l22_sq.item() > 0.0:
+        raise RuntimeError("cholesky_insert: the updated matrix is not positive definite.")
+    l22 = l22_sq.sqrt()
+    l32 = (a[i + 1:] - torch.mv(L31, l12)) / l22
+
+    L_new = L.new_zeros(D + 1, D + 1)
+    L_new[:i, :i] = L11
+    L_new[i, :i] = l12
+    L_new[i, i] = l22
+    L_new[i + 1:, :i] = L31
+    L_new[i + 1:, i] = l32
+    if i < D:
+        L_new[i + 1:, i + 1:] = torch.linalg.cholesky(L33 @ L33.t() - torch.outer(l32, l32))
+
+    if M is None:
+        return L_new
+
+    m = (x - torch.mv(M[:, :i], l12)) / l22
+    M_new = torch.cat([M[:, :i], m.unsqueeze(-1), M[:, i:]], dim=-1)
+    if i < D:
+        M3 = M[:, i:] @ L33.t() - torch.outer(m, l32)
+        M_new[:, i + 1:] = trisolve(L_new[i + 1:, i + 1:], M3.t(), upper=False).t()
+    return L_new, M_new
+
+
+def cholesky_delete(L, i, M=None):
+    """
+    Given the Cholesky factor L of A, compute the Cholesky factor of A with row/column `i` deleted.
+    If M = X L^{-T} is provided, M is updated alongside L.
+    """
+    D = L.size(-1)
+    keep = torch.arange(D, device=L.device) != i
+    L_new = L[keep][:, keep]
+    M_new = None if M is None else M[:, keep]
+    if i < D - 1 and M is None:
+        L_new[i:, i:] = cholesky_update(L[i + 1:, i + 1:], L[i + 1:, i])
+    elif i < D - 1:
+        L_new[i:, i:], M_new[:, i:] = cholesky_update(L[i + 1:, i + 1:], L[i + 1:, i], M[:, i + 1:], M[:, i])
+    return L_new if M is None else (L_new, M_new)
+
+
+class GramColumnCache(object):
+    """
+    A least-recently-used cache of at most `cache_size` columns of X^T X.
+    """
+    def __init__(self, X, cache_size, dtype=None):
+        self.X = X
+        self.cache_size = cache_size
+        self.dtype = X.dtype if dtype is None else dtype
+        self._columns = torch.zeros(X.size(-1), cache_size, dtype=self.dtype, device=X.device)
+        self._slots = OrderedDict()  # maps covariate index => slot in self._columns
+        self.hits, self.misses = 0, 0
+
+    def __call__(self, indices):
+        """
+        Return the P x len(indices) matrix with columns X^T X[:, indices].
+        """
+        indices_list = indices.tolist()
+        if len(indices_list) > self.cache_size:  # too many columns requested for the cache to be useful
+            self.misses += len(indices_list)
+            return self._compute_columns(indices)
+
+        missing = []
+        for i in indices_list:
+            if i in self._slots:
+                self._slots.move_to_end(i)
+                self.hits += 1
+            elif i not in missing:
+                missing.append(i)
+
+        if missing:
+            self.misses += len(missing)
+            num_free = self.cache_size - len(self._slots)
+            slots = list(range(len(self._slots), len(self._slots) + min(num_free, len(missing))))
+            while len(slots) < len(missing):  # evict least recently used columns
+                slots.append(self._slots.popitem(last=False)[1])
+            self._columns[:, slots] = self._compute_columns(missing)
+            self._slots.update(zip(missing, slots))
+
+        return self._columns[:, [self._slots[i] for i in indices_list]]
+
+    def _compute_columns(self, indices):
+        if isinstance(self.X, DesignMatrix):
+            return self.X.rmatmat(self.X[:, indices])
+        elif self.dtype != self.X.dtype:
+            return upcast_rmatmat(self.X, self.X[:, indices], self.dtype)
+        return self.X.t() @ self.X[:, indices]
+
+
+def _upcast_row_chunks(X, dtype, chunk_size=None):
+    if chunk_size is None:  # chunks of roughly 16MB
+        chunk_size = max(1, 2 ** 24 // (torch.finfo(dtype).bits // 8 * X.size(-1)))
+    for start in range(0, X.size(0), chunk_size):
+        stop = min(start + chunk_size, X.size(0))
+        yield start, stop, X[start:stop].to(dtype)
+
+
+def upcast_rmatmat(X, V, dtype=torch.float64, chunk_size=None):
+    """
+    Compute X^T V in `dtype` for a dense X stored in lower precision, upcasting chunks of rows of X at a time.
+    """
+    V = V.to(dtype)
+    result = torch.zeros((X.size(-1),) + V.shape[1:], dtype=dtype, device=X.device)
+    for start, stop, X_chunk in _upcast_row_chunks(X, dtype, chunk_size):
+        result += X_chunk.t() @ V[start:stop]
+    return result
+
+
+def upcast_gram(X, dtype=torch.float64, chunk_size=None):
+    """
+    Compute the gram matrix X^T X in `dtype` for a dense N x P matrix X that is stored in lower precision.
+    """
+    XX = torch.zeros(X.size(-1), X.size(-1), dtype=dtype, device=X.device)
+    for _, _, X_chunk in _upcast_row_chunks(X, dtype, chunk_size):
+        XX += X_chunk.t() @ X_chunk
+    return XX
+
+
+def upcast_column_norms_sq(X, dtype=torch.float64, chunk_size=None):
+    """
+    Compute the squared column norms of a dense N x P matrix X that is stored in lower precision in `dtype`.
+    """
+    result = torch.zeros(X.size(-1), dtype=dtype, device=X.device)
+    for _, _, X_chunk in _upcast_row_chunks(X, dtype, chunk_size):
+        result += X_chunk.pow(2.0).sum(0)
+    return result
+
+
+@lru_cache(maxsize=None)
+def get_thread_pool(num_threads):
+    """
+    Return a process-wide thread pool with `num_threads` workers.
+    """
+    return ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="millipede")
+
+
+def map_shards(fn, shards, num_threads=1):
+    """
+    Call `fn` on each element of `shards`, on a thread pool if `num_threads > 1`.
+    """
+    if num_threads > 1 and len(shards) > 1:
+        # consume the iterator so that exceptions raised in the workers are propagated
+        list(get_thread_pool(num_threads).map(fn, shards))
+    else:
+        for shard in shards:
+            fn(shard)
+
+
+def tiled_rmatmat(X, V, tile_size=None, dtype=None, num_threads=1):
+    """
+    Compute X^T V for a dense X over tiles of `tile_size` columns of X without gathering columns of X.
+    """
+    dtype = X.dtype if dtype is None else dtype
+    tile_size = X.size(-1) if tile_size is None else tile_size
+    V = V.to(X.dtype)
+    result = torch.empty((X.size(-1),) + V.shape[1:], dtype=dtype, device=X.device)
+
+    def compute_tile(start):
+        result[start:start + tile_size] = X[:, start:start + tile_size].t() @ V
+
+    map_shards(compute_tile, range(0, X.size(-1), tile_size), num_threads)
+    return result
+
+
+def tiled_column_norms_sq(X, weights=None, tile_size=None, dtype=None, num_threads=1):
+    """
+    Compute the (optionally weighted) squared column norms of a dense X over tiles of `tile_size` columns.
+    """
+    dtype = X.dtype if dtype is None else dtype
+    tile_size = X.size(-1) if tile_size is None else tile_size
+    weights = None if weights is None else weights.to(X.dtype)
+    result = torch.empty(X.size(-1), dtype=dtype, device=X.device)
+
+    def compute_tile(start):
+        X_tile_sq = X[:, start:start + tile_size].pow(2.0)
+        result[start:start + tile_size] = X_tile_sq.sum(0) if weights is None else weights @ X_tile_sq
+
+    map_shards(compute_tile, range(0, X.size(-1), tile_size), num_threads)
+    return result
+
+
+def as_design_matrix(X, device="cpu"):
+    """
+    Wrap sparse tensors and (paths to) numpy arrays in a :class:`DesignMatrix`.
+    """
+    if isinstance(X, torch.Tensor) and X.layout != torch.strided:
+        return SparseDesignMatrix(X)
+    elif isinstance(X, (str, np.ndarray)):
+        return MemmapDesignMatrix(X, device=device)
+    return X
+
+
+class DesignMatrix(object):
+    """
+    Base class for N x (P + P' + 1) covariate matrices that are only accessed through products and columns.
+    The first P columns are stored by the subclass, followed by dense assumed covariates and an implicit intercept.
+    """
+    def __init__(self, N, P, X_assumed=None, include_intercept=False, dtype=torch.float64, device="cpu"):
+        self.N, self.P = N, P
+        self.dtype, self.device = dtype, device
+        self.X_assumed = X_assumed
+        self.include_intercept = include_intercept
+        self.Pa = (0 if X_assumed is None else X_assumed.size(-1)) + int(include_intercept)
+
+    def with_assumed_covariates(self, X_assumed=None, include_intercept=False):
+        """
+        Return a shallow copy of this design matrix with the given assumed covariates and intercept.
+        """
+        design = copy.copy(self)
+        DesignMatrix.__init__(design, self.N, self.P, X_assumed=X_assumed, include_intercept=include_intercept,
+                              dtype=self.dtype, device=self.device)
+        return design
+
+    @property
+    def shape(self):
+        return torch.Size((self.N, self.P + self.Pa))
+
+    def size(self, dim=None):
+        return self.shape if dim is None else self.shape[dim]
 
-    mask = torch.ones(N, N, N).bool()
-    idx = torch.arange(N)
-    mask[idx, idx] = 0
-    mask[idx, :, idx] = 0
-    F_sub = F.expand(N, N, N)[mask].reshape(N, N - 1, N - 1)
+    def _dense_columns(self, v, op):
+        columns = []
+        if self.X_assumed is not None:
+            columns.append(op(self.X_assumed, v))
+        if self.include_intercept:
+            columns.append(v.sum(0, keepdim=True))
+        return columns
 
-    mask = torch.zeros(N, N, N).bool()
-    mask[idx, idx] = 1
-    mask[idx, idx, idx] = 0
-    F_top = F.expand(N, N, N)[mask].reshape(N, 1, N - 1)
+    def rmatvec(self, v):
+        """
+        Compute the (P + P' + 1)-dimensional matrix-vector product X^T v.
+        """
+        return self.rmatmat(v.unsqueeze(-1)).squeeze(-1)
 
-    mask = torch.zeros(N, N, N).bool()
-    mask[idx, :, idx] = 1
-    mask[idx, idx, idx] = 0
-    F_left = F.expand(N, N, N)[mask].reshape(N, N - 1, 1)
+    def rmatmat(self, V):
+        """
+        Compute the (P + P' + 1) x K matrix-matrix product X^T V for a dense N x K matrix V.
+        """
+        return torch.cat([self._rmatmat(V)] + self._dense_columns(V, lambda X, V: X.t() @ V), dim=0)
 
-    F_corner = F[idx, idx]
+    def column_norms_sq(self, weights=None):
+        """
+        Compute the (P + P' + 1)-dimensional vector of weighted squared column norms sum_n w_n X_np^2.
+        """
+        weights = torch.ones(self.N, dtype=self.dtype, device=self.device) if weights is None else weights
+        return torch.cat([self._column_norms_sq(weights)] +
+                         self._dense_columns(weights, lambda X, w: w @ X.pow(2.0)), dim=0)
 
-    F_loo = F_sub - torch.matmul(F_left, F_top) / F_corner.unsqueeze(-1).unsqueeze(-1)
+    def gram(self):
+        """
+        Compute the dense (P + P' + 1) x (P + P' + 1) gram matrix X^T X.
+        """
+        XX = torch.zeros(self.size(-1), self.size(-1), dtype=self.dtype, device=self.device)
+        XX[:self.P, :self.P] = self._gram()
+        if self.Pa > 0:
+            XX[:, self.P:] = self.rmatmat(self[:, torch.arange(self.P, self.P + self.Pa, device=self.device)])
+            XX[self.P:, :self.P] = XX[:self.P, self.P:].t()
+        return XX
 
-    return F_loo
+    def __getitem__(self, index):
+        if not isinstance(index, tuple) or len(index) != 2:
+            raise IndexError("{} only supports indexing of the form X[rows, columns].".format(type(self).__name__))
+        rows, columns = index
 
+        columns = torch.as_tensor(columns, device=self.device)
+        squeeze = columns.ndim == 0
+        columns = columns.reshape(-1)
 
-def leave_one_out(x):
-    N = x.size(-1)
-    mask = ~torch.eye(N, N, device=x.device).bool()
-    return x.expand(N, N)[mask].reshape(N, N - 1)
+        result = torch.zeros(self.N, columns.size(-1), dtype=self.dtype, device=self.device)
+        is_covariate = columns < self.P
+        if is_covariate.any():
+            result[:, is_covariate] = self._columns(columns[is_covariate])
+        if self.X_assumed is not None:
+            is_assumed = (columns >= self.P) & (columns < self.P + self.X_assumed.size(-1))
+            result[:, is_assumed] = self.X_assumed[:, columns[is_assumed] - self.P]
+        if self.include_intercept:
+            result[:, columns == self.P + self.Pa - 1] = 1.0
 
+        result = result.squeeze(-1) if squeeze else result
+        return result if isinstance(rows, slice) and rows == slice(None) else result[rows]
 
-def leave_one_out_off_diagonal(x):
-    N = x.size(-1)
-    N_arange = torch.arange(N, device=x.device)
-    mask = N_arange.expand(N, N, N) != N_arange.unsqueeze(-1).unsqueeze(-1)
-    mask = ~mask & mask.transpose(dim0=-1, dim1=-2)
-    return x.expand(N, N, N)[mask].reshape(N, N - 1)
+
+class SparseDesignMatrix(DesignMatrix):
+    """
+    A :class:`DesignMatrix` whose first P columns are given by a sparse N x P tensor.
+    """
+    def __init__(self, X, X_assumed=None, include_intercept=False, chunk_size=256):
+        super().__init__(X.size(0), X.size(1), X_assumed=X_assumed, include_intercept=include_intercept,
+                         dtype=X.dtype, device=X.device)
+        self.Xt = X.to_sparse().t().coalesce()
+        self.Xt_sq = self.Xt.pow(2.0)
+        self.chunk_size = chunk_size
+
+    def _rmatmat(self, V):
+        return torch.sparse.mm(self.Xt, V)
+
+    def _column_norms_sq(self, weights):
+        return torch.sparse.mm(self.Xt_sq, weights.unsqueeze(-1)).squeeze(-1)
+
+    def _gram(self):
+        XX = torch.zeros(self.P, self.P, dtype=self.dtype, device=self.device)
+        for start in range(0, self.P, self.chunk_size):
+            chunk = torch.arange(start, min(start + self.chunk_size, self.P), device=self.device)
+            XX[:, chunk] = self._rmatmat(self._columns(chunk))
+        return XX
+
+    def _columns(self, indices):
+        return self.Xt.index_select(0, indices).to_dense().t()
+
+
+class MemmapDesignMatrix(DesignMatrix):
+    """
+    A :class:`DesignMatrix` whose first P columns are given by a disk-backed N x P numpy array (or a .npy path).
+    Rows are read in chunks of `chunk_size` and at most `column_cache_size` columns are kept in memory.
+    """
+    def __init__(self, X, X_assumed=None, include_intercept=False, device="cpu",
+                 chunk_size=None, column_cache_size=256):
+        X = np.load(X, mmap_mode='r') if isinstance(X, str) else X
+        if X.ndim != 2:
+            raise ValueError("X must be a two-dimensional array.")
+        dtype = torch.from_numpy(np.zeros(0, dtype=X.dtype)).dtype
+        super().__init__(X.shape[0], X.shape[1], X_assumed=X_assumed, include_intercept=include_intercept,
+                         dtype=dtype, device=device)
+        self.X = X
+        self.chunk_size = chunk_size if chunk_size is not None else max(1, 2 ** 24 // (X.itemsize * self.P))
+        self.column_cache_size = column_cache_size
+        self._column_cache = OrderedDict()
+
+    def __getstate__(self):
+        # when sent to another process re-open the memory map instead of pickling its contents
+        state = self.__dict__.copy()
+        if isinstance(self.X, np.memmap) and self.X.filename is not None:
+            order = 'F' if self.X.flags.f_contiguous and not self.X.flags.c_contiguous else 'C'
+            state['X'] = (self.X.filename, self.X.dtype, self.X.shape, self.X.offset, order)
+            state['_column_cache'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state['X'], tuple):
+            filename, dtype, shape, offset, order = state['X']
+            state['X'] = np.memmap(filename, dtype=dtype, mode='r', shape=shape, offset=offset, order=order)
+        self.__dict__.update(state)
+
+    def _chunks(self):
+        for start in range(0, self.N, self.chunk_size):
+            stop = min(start + self.chunk_size, self.N)
+            yield start, stop, torch.from_numpy(np.array(self.X[start:stop])).to(device=self.device)
+
+    def _rmatmat(self, V):
+        result = torch.zeros(self.P, V.size(-1), dtype=self.dtype, device=self.device)
+        for start, stop, X_chunk in self._chunks():
+            result += X_chunk.t() @ V[start:stop]
+        return result
+
+    def _column_norms_sq(self, weights):
+        result = torch.zeros(self.P, dtype=self.dtype, device=self.device)
+        for start, stop, X_chunk in self._chunks():
+            result += weights[start:stop] @ X_chunk.pow(2.0)
+        return result
+
+    def _gram(self):
+        XX = torch.zeros(self.P, self.P, dtype=self.dtype, device=self.device)
+        for _, _, X_chunk in self._chunks():
+            XX += X_chunk.t() @ X_chunk
+        return XX
+
+    def _columns(self, indices):
+        indices = indices.tolist()
+        missing = [i for i in dict.fromkeys(indices) if i not in self._column_cache]
+        if missing:
+            columns = torch.from_numpy(np.array(self.X[:, missing])).to(device=self.device)
+            self._column_cache.update(zip(missing, [column.clone() for column in columns.unbind(-1)]))
+        for i in indices:
+            self._column_cache.move_to_end(i)
+        result = torch.stack([self._column_cache[i] for i in indices], dim=-1)
+        while len(self._column_cache) > self.column_cache_size:
+            self._column_cache.popitem(last=False)
+        return result
+
+
+def get_loo_quadratic_forms(F, z):
+    """
+    Given F = A^{-1}, compute the leave-one-out quadratic forms z_{-i}^T (A_{-i,-i})^{-1} z_{-i}
+    in O(k^2) as well as the diagonal of F.
+    """
+    Fz = torch.mv(F, z)
+    F_diag = F.diagonal()
+    return torch.dot(z, Fz) - Fz.pow(2.0) / F_diag, F_diag
 
 
 def namespace_to_numpy(namespace, filter_sites=True, keep_sites=[]):
@@ -86,3 +567,19 @@ def stack_namespaces(namespaces):
         if val is not None:
             d[attr] = np.stack([ns.__getattribute__(attr) for ns in namespaces])
     return SimpleNamespace(**d)
+
+
+def save_checkpoint_file(checkpoint, path):
+    """
+    Pickle `checkpoint` to `path`. The file is written atomically so that an interrupted write
+    never corrupts an existing checkpoint.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint_file(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
@@ -31,6 +31,7 @@ setup(
         "torch>=1.11",
         "pandas",
         "polyagamma==1.3.2",
+        "scipy",
         "tqdm",
     ],
     extras_require={
@@ -0,0 +1,123 @@
+import pandas as pd
+import pytest
+import torch
+from common import assert_close
+
+from millipede import (
+    CountLikelihoodSampler,
+    NegativeBinomialLikelihoodVariableSelector,
+    NormalLikelihoodSampler,
+    NormalLikelihoodVariableSelector,
+)
+from millipede.util import load_checkpoint_file, namespace_to_numpy
+
+
+def get_sampler(likelihood, N=30, P=8, seed=0):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    if likelihood == 'normal':
+        Y = X[:, 0] - 0.5 * X[:, 1] + 0.3 * torch.randn(N).double()
+        return NormalLikelihoodSampler(X, Y, S=(1.0, 5.0), verbose_constructor=False)
+    TC = 10 * torch.ones(N, dtype=torch.int64)
+    Y = torch.distributions.Binomial(total_count=TC, logits=X[:, 0]).sample().double()
+    return CountLikelihoodSampler(X, Y, TC=TC, S=(1.0, 5.0), verbose_constructor=False)
+
+
+@pytest.mark.parametrize("likelihood", ["normal", "binomial"])
+def test_mcmc_chain_is_lazy(likelihood, seed=1):
+    sampler = get_sampler(likelihood)
+    rng_state = torch.get_rng_state()
+    chain = sampler.mcmc_chain(T_burnin=10, T=20, seed=seed)
+    # the chain is only initialized (and the random number generator seeded) once iteration starts
+    assert torch.equal(torch.get_rng_state(), rng_state)
+    next(chain)
+    assert sampler.t == 1 and not torch.equal(torch.get_rng_state(), rng_state)
+
+
+@pytest.mark.parametrize("likelihood", ["normal", "binomial"])
+@pytest.mark.parametrize("T_checkpoint", [5, 15])
+def test_sampler_resume(likelihood, T_checkpoint, tmp_path, T_burnin=10, T=20, seed=1):
+    sampler = get_sampler(likelihood)
+    expected = [namespace_to_numpy(sample) for _, sample in sampler.mcmc_chain(T_burnin=T_burnin, T=T, seed=seed)]
+
+    # interrupt the chain (during burn-in if T_checkpoint < T_burnin) and continue it with a fresh sampler
+    path = str(tmp_path / "checkpoint.pkl")
+    sampler = get_sampler(likelihood)
+    for t, (_, sample) in enumerate(sampler.mcmc_chain(T_burnin=T_burnin, T=T, seed=seed)):
+        if t + 1 == T_checkpoint:
+            sampler.save_checkpoint(path, sample)
+            break
+    torch.manual_seed(seed + 1)
+
+    sampler = get_sampler(likelihood)
+    actual = [namespace_to_numpy(sample) for _, sample in sampler.resume(path, T=T)]
+    assert len(actual) == T_burnin + T - T_checkpoint
+    for s1, s2 in zip(actual, expected[T_checkpoint:]):
+        assert (s1.gamma == s2.gamma).all()
+        assert_close(s1.weight, s2.weight, atol=0.0)
+        assert_close(s1.add_prob, s2.add_prob, atol=0.0)
+    assert sampler.t == T_burnin + T
+
+
+@pytest.mark.parametrize("streaming,delta_gamma,chunked", [(True, False, False), (False, False, False),
+                                                           (False, True, False), (False, False, True)])
+@pytest.mark.parametrize("likelihood", ["normal", "negative_binomial"])
+def test_selector_resume(likelihood, streaming, delta_gamma, chunked, tmp_path, N=30, P=8, T_burnin=20, seed=2):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    dataframe = pd.DataFrame(X.numpy(), columns=['x{}'.format(p) for p in range(P)])
+    if likelihood == 'normal':
+        dataframe['y'] = (X[:, 0] + 0.3 * torch.randn(N).double()).numpy()
+    else:
+        dataframe['y'] = torch.distributions.Poisson(X[:, 0].exp()).sample().numpy()
+        dataframe['psi0'] = 0.0
+
+    def get_selector():
+        # use a fresh selector for each run since the adapted xi is not reset by run()
+        if likelihood == 'normal':
+            return NormalLikelihoodVariableSelector(dataframe, 'y', S=(1.0, 5.0))
+        return NegativeBinomialLikelihoodVariableSelector(dataframe, 'y', 'psi0', S=(1.0, 5.0))
+
+    def chunk_dir(name):
+        return str(tmp_path / name) if chunked else None
+
+    selector = get_selector()
+    selector.run(T=60, T_burnin=T_burnin, streaming=streaming, delta_gamma=delta_gamma, seed=seed,
+                 verbosity=None, chunk_dir=chunk_dir("expected"))
+    expected = selector.summary.copy()
+
+    # extend a finished run
+    path = str(tmp_path / "checkpoint.pkl")
+    selector = get_selector()
+    selector.run(T=25, T_burnin=T_burnin, streaming=streaming, delta_gamma=delta_gamma, seed=seed,
+                 verbosity=None, checkpoint_path=path, chunk_dir=chunk_dir("extended"))
+    selector.resume(path, T=60, verbosity=None)
+    assert_close(selector.summary.values, expected.values, atol=1.0e-12, equal_nan=True)
+    assert selector.stats['Number of retained samples'] == 60
+    if not streaming:
+        assert selector.samples.gamma.shape == (60, P)
+
+    # resume from the most recent periodic checkpoint after the run was interrupted, e.g. by preemption
+    class Preempted(Exception):
+        pass
+
+    selector = get_selector()
+    mcmc_move = selector.sampler.mcmc_move
+
+    def preempted_mcmc_move(sample):
+        if selector.sampler.t == T_burnin + 37:
+            raise Preempted
+        return mcmc_move(sample)
+
+    selector.sampler.mcmc_move = preempted_mcmc_move
+    with pytest.raises(Preempted):
+        selector.run(T=60, T_burnin=T_burnin, streaming=streaming, delta_gamma=delta_gamma, seed=seed,
+                     verbosity=None, chunk_dir=chunk_dir("resumed"),
+                     checkpoint_path=path, checkpoint_frequency=10)
+    # the most recent checkpoint was saved after 50 of the 57 completed iterations
+    assert load_checkpoint_file(path)['sampler']['t'] == T_burnin + 30
+    selector = get_selector()
+    selector.resume(path, verbosity=None, checkpoint_frequency=10)
+    assert selector.sampler.t == T_burnin + 60
+    assert_close(selector.summary.values, expected.values, atol=1.0e-12, equal_nan=True)
+    assert selector.stats['Number of retained samples'] == 60
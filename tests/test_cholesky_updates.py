@@ -0,0 +1,137 @@
+import copy
+
+import pytest
+import torch
+from common import assert_close
+
+from millipede import NormalLikelihoodSampler
+from millipede.util import (
+    GramColumnCache,
+    cholesky_delete,
+    cholesky_insert,
+    cholesky_update,
+    get_loo_quadratic_forms,
+)
+
+
+def random_spd(D):
+    A = torch.randn(D + 3, D).double()
+    return A.t() @ A + 0.1 * torch.eye(D).double()
+
+
+def whiten(X, L):
+    return torch.linalg.solve_triangular(L, X.t(), upper=False).t()
+
+
+@pytest.mark.parametrize("D", [1, 2, 5])
+def test_cholesky_update(D):
+    A = random_spd(D)
+    x = torch.randn(D).double()
+    L = cholesky_update(torch.linalg.cholesky(A), x)
+    assert_close(L, torch.linalg.cholesky(A + torch.outer(x, x)), atol=1.0e-10)
+
+
+@pytest.mark.parametrize("D", [1, 2, 5])
+def test_cholesky_insert_delete(D, N=11):
+    X = torch.randn(N, D + 1).double()
+    A = X.t() @ X + 0.1 * torch.eye(D + 1).double()
+    L = torch.linalg.cholesky(A)
+    for i in range(D + 1):
+        keep = torch.arange(D + 1) != i
+        A_sub = A[keep][:, keep]
+        L_sub = torch.linalg.cholesky(A_sub)
+
+        L_ins, M_ins = cholesky_insert(L_sub, i, A[i], whiten(X[:, keep], L_sub), X[:, i])
+        assert_close(L_ins, L, atol=1.0e-10)
+        assert_close(M_ins, whiten(X, L), atol=1.0e-10)
+
+        L_del, M_del = cholesky_delete(L, i, whiten(X, L))
+        assert_close(L_del, L_sub, atol=1.0e-10)
+        assert_close(M_del, whiten(X[:, keep], L_sub), atol=1.0e-10)
+
+
+@pytest.mark.parametrize("precompute_XX,XX_cache_size", [(False, None), (True, None), (False, 4)])
+@pytest.mark.parametrize("prior", ["isotropic", "gprior"])
+@pytest.mark.parametrize("include_intercept", [False, True])
+@pytest.mark.parametrize("P_assumed", [0, 2])
+def test_normal_incremental_factorization(precompute_XX, XX_cache_size, prior, include_intercept, P_assumed,
+                                          N=33, P=9, T=300):
+    torch.manual_seed(0)
+    X = torch.randn(N, P).double()
+    X_assumed = torch.randn(N, P_assumed).double() if P_assumed > 0 else None
+    Y = X[:, 0] + X[:, 1] + 0.5 * torch.randn(N).double()
+
+    sampler = NormalLikelihoodSampler(X, Y, X_assumed=X_assumed, S=3.0, prior=prior,
+                                      include_intercept=include_intercept, precompute_XX=precompute_XX,
+                                      XX_cache_size=XX_cache_size,
+                                      explore=20.0, verbose_constructor=False)
+    sampler.refactorize_frequency = T + 1
+
+    num_flips, max_factor_updates = 0, 0
+    for _, sample in sampler.mcmc_chain(T=T, T_burnin=0, seed=1):
+        num_flips += int(sample._idx.item() >= 0)
+        assert_close(sample._active.sort()[0], torch.nonzero(sample.gamma).squeeze(-1))
+
+        if sample._L_active is None:
+            continue
+        # compare against a fresh factorization of a copy so that the chain keeps updating its own factor
+        expected = sampler._factorize_active(copy.copy(sample))
+        assert_close(sample._XX_active, expected._XX_active, atol=1.0e-10)
+        assert_close(sample._L_active, expected._L_active, atol=1.0e-8)
+        assert_close(sample._XXt_active, expected._XXt_active, atol=1.0e-8)
+        max_factor_updates = max(max_factor_updates, sample._num_factor_updates)
+
+    assert num_flips > 50
+    # the factor accumulates many consecutive insertions and deletions without being refactorized
+    assert max_factor_updates > 20
+
+
+@pytest.mark.parametrize("precompute_XX", [False, True])
+@pytest.mark.parametrize("prior", ["isotropic", "gprior"])
+def test_normal_incremental_log_odds_collinear(precompute_XX, prior, N=128, P=16, T=1000):
+    torch.manual_seed(1)
+    X = torch.randn(N, P).double()
+    Z = torch.randn(N).double()
+    X[:, 0:2] = Z.unsqueeze(-1) + 0.001 * torch.randn(N, 2).double()
+    X[:, 2:4] = X[:, 4:6] + 0.001 * torch.randn(N, 2).double()
+    Y = Z + X[:, 4] + 0.05 * torch.randn(N).double()
+
+    sampler = NormalLikelihoodSampler(X, Y, S=1.0, prior=prior, include_intercept=False,
+                                      precompute_XX=precompute_XX, verbose_constructor=False)
+    sampler.refactorize_frequency = T + 1
+
+    max_factor_updates = 0
+    for _, sample in sampler.mcmc_chain(T=T, T_burnin=0, seed=1):
+        if sample._L_active is None:
+            continue
+        # the log odds computed from the incrementally updated factors agree with those of a fresh
+        # factorization even if the active set contains nearly collinear covariates
+        expected = sampler._factorize_active(copy.copy(sample))
+        assert_close(sampler._compute_add_prob(sample), sampler._compute_add_prob(expected), atol=1.0e-9)
+        max_factor_updates = max(max_factor_updates, sample._num_factor_updates)
+
+    assert max_factor_updates > 5
+
+
+def test_gram_column_cache(N=7, P=6):
+    X = torch.randn(N, P).double()
+    XX = X.t() @ X
+    cache = GramColumnCache(X, 3)
+    for indices in [[0, 1], [1, 2], [3], [0, 4, 5], [5, 0, 1, 2], [2]]:
+        indices = torch.tensor(indices)
+        assert_close(cache(indices), XX[:, indices], atol=1.0e-12)
+    assert cache.hits > 0 and len(cache._slots) == 3
+
+
+@pytest.mark.parametrize("D", [2, 5])
+def test_get_loo_quadratic_forms(D):
+    A = random_spd(D)
+    z = torch.randn(D).double()
+    zFz_loo, F_diag = get_loo_quadratic_forms(torch.linalg.inv(A), z)
+
+    for i in range(D):
+        keep = torch.arange(D) != i
+        A_loo = A[keep][:, keep]
+        assert_close(zFz_loo[i], z[keep] @ torch.linalg.solve(A_loo, z[keep]), atol=1.0e-10)
+        schur = A[i, i] - A[i, keep] @ torch.linalg.solve(A_loo, A[keep, i])
+        assert_close(1.0 / F_diag[i], schur, atol=1.0e-10)
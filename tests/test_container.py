@@ -1,17 +1,29 @@
 import math
+import os
+import pickle
 from types import SimpleNamespace
 
 import numpy as np
 import pytest
+import torch
 from common import assert_close
 
-from millipede.containers import SimpleSampleContainer, StreamingSampleContainer
+from millipede.containers import (
+    ChunkedSampleContainer,
+    CoinclusionAccumulator,
+    PackedGamma,
+    SimpleSampleContainer,
+    StreamingSampleContainer,
+    TorchStreamingSampleContainer,
+)
+from millipede.util import namespace_to_numpy, stack_namespaces
 
 
 @pytest.mark.parametrize("P_assumed", [0, 1, 3])
 def test_containers(P_assumed, P=101, atol=1.0e-7):
     c1 = SimpleSampleContainer()
     c2 = StreamingSampleContainer()
+    betas = []
 
     for _ in range(4):
         gamma = np.random.binomial(1, 0.5 * np.ones(P))
@@ -29,6 +41,11 @@ def test_containers(P_assumed, P=101, atol=1.0e-7):
                                  weight=np.random.rand())
         c1(sample)
         c2(sample)
+        betas.append(beta)
+
+    # coefficients are stored in sparse form
+    assert c1.samples.beta.nnz == np.count_nonzero(betas)
+    assert_close(c1.samples.beta.toarray(), np.stack(betas), atol=0.0)
 
     assert_close(c1.pip, c2.pip, atol=atol)
     assert_close(c1.beta, c2.beta, atol=atol)
@@ -39,7 +56,7 @@ def test_containers(P_assumed, P=101, atol=1.0e-7):
     assert_close(c1.h, c2.h, atol=atol)
 
     for p in range(P + P_assumed):
-        beta = c1.samples.beta[:, p]
+        beta = c1.samples.beta[:, p].toarray()[:, 0]
         nz = np.nonzero(beta)[0]
         beta = beta[nz]
         weight = c1.samples.weight[nz]
@@ -57,3 +74,286 @@ def test_containers(P_assumed, P=101, atol=1.0e-7):
     assert_close(c1.nu, c2.nu, atol=atol)
     assert_close(c1.nu_std, c2.nu_std, atol=atol)
     assert_close(c1.beta_std, c2.beta_std, atol=atol)
+
+
+@pytest.mark.parametrize("num_samples", [(3, 5), (0, 4), (4, 0)])
+def test_container_merge(num_samples, P=11, atol=1.0e-10):
+    c1, c2 = StreamingSampleContainer(), StreamingSampleContainer()
+    s1, s2 = SimpleSampleContainer(), SimpleSampleContainer()
+    expected, expected_simple = StreamingSampleContainer(), SimpleSampleContainer()
+
+    for streaming, simple, T in zip([c1, c2], [s1, s2], num_samples):
+        for _ in range(T):
+            gamma = np.random.binomial(1, 0.5 * np.ones(P))
+            sample = SimpleNamespace(gamma=gamma,
+                                     beta=np.random.randn(P) * gamma,
+                                     add_prob=np.random.rand(P),
+                                     log_nu=np.random.randn(),
+                                     h_alpha=np.random.rand(),
+                                     h_beta=np.random.rand(),
+                                     weight=np.random.rand())
+            for c in [streaming, simple, expected, expected_simple]:
+                c(sample)
+
+    c1.merge(c2)
+    s1.merge(s2)
+
+    assert c1._num_samples == sum(num_samples)
+    assert_close(c1.weight_reservoir, expected.weight_reservoir, atol=atol)
+    assert_close(s1.samples.weight, expected_simple.samples.weight, atol=atol)
+    for s in ['pip', 'beta', 'beta_std', 'conditional_beta', 'conditional_beta_std',
+              'log_nu', 'log_nu_std', 'nu', 'nu_std', 'h_alpha', 'h_beta', 'h']:
+        assert_close(getattr(c1, s), getattr(expected, s), atol=atol)
+        assert_close(getattr(s1, s), getattr(expected_simple, s), atol=atol)
+
+
+@pytest.mark.parametrize("rho", [0.0, 0.9])
+def test_container_mcse(rho, P=3, T=20000, num_batches=16):
+    # PIPs follow an AR(1) process with autocorrelation rho and unit marginal variance
+    np.random.seed(0)
+    container = StreamingSampleContainer(num_batches=num_batches, batch_size=5)
+    add_prob = np.random.randn(P)
+    for t in range(T):
+        if t == num_batches * 5 - 1:
+            assert np.isinf(container.pip_mcse).all()
+        add_prob = rho * add_prob + np.sqrt(1.0 - rho ** 2) * np.random.randn(P)
+        container(SimpleNamespace(gamma=np.ones(P), beta=2.0 * add_prob, add_prob=add_prob,
+                                  weight=np.array(1.0)))
+
+    assert num_batches <= len(container._batches) < 2 * num_batches
+    expected = np.sqrt((1.0 + rho) / (1.0 - rho) / T)
+    assert_close(container.pip_mcse, np.full(P, expected), rtol=0.5)
+    assert_close(container.beta_mcse, 2.0 * container.pip_mcse, atol=1.0e-12)
+    assert StreamingSampleContainer().pip_mcse is None
+
+
+@pytest.mark.parametrize("num_samples", [(1, 0), (30, 0), (20, 25)])
+def test_delta_gamma_container(num_samples, P=7, atol=1.0e-10):
+    dense, delta = SimpleSampleContainer(), SimpleSampleContainer(delta_gamma=True)
+    others = SimpleSampleContainer(), SimpleSampleContainer(delta_gamma=True)
+
+    for containers, T in zip([(dense, delta), others], num_samples):
+        # flip at most one covariate per sample, as in a single MCMC chain
+        gamma = np.random.binomial(1, 0.5 * np.ones(P)).astype(bool)
+        for _ in range(T):
+            idx = np.random.randint(-2, P)
+            if idx >= 0:
+                gamma[idx] = ~gamma[idx]
+            sample = SimpleNamespace(gamma=gamma.copy(),
+                                     beta=np.random.randn(P) * gamma,
+                                     add_prob=np.random.rand(P),
+                                     weight=np.random.rand())
+            for c in containers:
+                c(sample)
+    dense.merge(others[0])
+    delta.merge(others[1])
+
+    assert delta.samples.gamma.shape == dense.samples.gamma.shape
+    assert (np.asarray(delta.samples.gamma) == dense.samples.gamma).all()
+    for t in [0, sum(num_samples) // 2, -1]:
+        assert (delta.samples.gamma[t] == dense.samples.gamma[t]).all()
+    assert_close(delta.samples.gamma.weighted_sum(dense.weights), np.dot(dense.samples.gamma.T, dense.weights),
+                 atol=atol)
+    for s in ['pip', 'beta', 'conditional_beta', 'conditional_beta_std']:
+        assert_close(getattr(delta, s), getattr(dense, s), atol=atol)
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+@pytest.mark.parametrize("T", [None, 5, 12])
+def test_container_preallocation(T, memmap, tmp_path, P=6, num_samples=12):
+    memmap_dir = str(tmp_path / "samples") if memmap else None
+    container = SimpleSampleContainer(T=T, memmap_dir=memmap_dir)
+    samples = []
+    for _ in range(num_samples):
+        gamma = np.random.binomial(1, 0.5 * np.ones(P)).astype(bool)
+        sample = SimpleNamespace(gamma=gamma, beta=np.random.randn(P) * gamma, add_prob=np.random.rand(P),
+                                 log_nu=None, weight=np.random.rand())
+        container(sample)
+        samples.append(sample)
+
+    expected = stack_namespaces(samples)
+    for site in ['gamma', 'add_prob', 'weight']:
+        assert_close(getattr(container.samples, site), getattr(expected, site), atol=0.0)
+    assert_close(container.samples.beta.toarray(), expected.beta, atol=0.0)
+    assert not hasattr(container.samples, 'log_nu')
+    # samples are views of the sample arrays rather than copies
+    assert np.shares_memory(container.samples.add_prob, container._columns['add_prob'])
+
+    if memmap:
+        add_prob = np.load(os.path.join(memmap_dir, "add_prob.npy"), mmap_mode='r')
+        assert_close(np.array(add_prob[:num_samples]), expected.add_prob, atol=0.0)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 4, 100])
+def test_chunked_container(chunk_size, compress, tmp_path, P=11, num_samples=(10, 7), atol=1.0e-12):
+    expected = SimpleSampleContainer()
+    containers = [ChunkedSampleContainer(str(tmp_path / "chunks{}".format(i)), chunk_size=chunk_size,
+                                         compress=compress) for i in range(2)]
+    for i, (container, T) in enumerate(zip(containers, num_samples)):
+        for t in range(T):
+            gamma = np.random.binomial(1, 0.5 * np.ones(P)).astype(bool)
+            sample = SimpleNamespace(gamma=gamma, beta=np.concatenate([np.random.randn(P) * gamma, np.random.randn(1)]),
+                                     add_prob=np.random.rand(P), log_nu=np.random.randn(), weight=np.random.rand())
+            container(sample)
+            expected(sample)
+            if i == 0 and t == 4:
+                # e.g. a checkpoint in the middle of a run
+                container = containers[0] = pickle.loads(pickle.dumps(container))
+    container = containers[0]
+    container.merge(containers[1])
+
+    samples = container.samples
+    assert isinstance(samples.gamma, PackedGamma)
+    assert isinstance(samples.add_prob, np.memmap)
+    assert samples.gamma.shape == expected.samples.gamma.shape
+    assert (np.asarray(samples.gamma) == expected.samples.gamma).all()
+    assert (samples.gamma[3] == expected.samples.gamma[3]).all()
+    for site in ['add_prob', 'log_nu', 'weight']:
+        assert_close(np.asarray(getattr(samples, site)), getattr(expected.samples, site), atol=0.0)
+    assert_close(samples.beta.toarray(), expected.samples.beta.toarray(), atol=0.0)
+    for s in ['pip', 'beta', 'beta_std', 'conditional_beta', 'conditional_beta_std', 'log_nu', 'nu']:
+        assert_close(getattr(container, s), getattr(expected, s), atol=atol)
+
+
+def test_streaming_container_accumulation(P=5, T=3000):
+    class SmallReservoirContainer(StreamingSampleContainer):
+        reservoir_size = 100
+
+    np.random.seed(1)
+    container = SmallReservoirContainer()
+    add_prob = np.random.rand(T, P).astype(np.float32)
+    weights = np.random.rand(T).astype(np.float32)
+    for t in range(T):
+        container(SimpleNamespace(gamma=add_prob[t] > 0.5, beta=add_prob[t] - 0.5, add_prob=add_prob[t],
+                                  weight=weights[t]))
+
+    # statistics are accumulated in double precision with compensated summation
+    expected = np.dot(weights.astype(np.float64), add_prob.astype(np.float64)) / weights.astype(np.float64).sum()
+    assert_close(container.pip, expected, atol=1.0e-14)
+
+    # the weights are summarized by a bounded reservoir sample and exact moments
+    assert container.weight_reservoir.shape == (100,)
+    assert np.isin(container.weight_reservoir, weights).all()
+    mean, std, min_weight, max_weight = container.weight_moments
+    assert_close(np.array([mean, std, min_weight, max_weight]),
+                 np.array([weights.mean(dtype=np.float64), weights.std(dtype=np.float64),
+                           weights.min(), weights.max()], dtype=np.float64), atol=1.0e-12)
+
+
+@pytest.mark.parametrize("num_samples", [(37, 0), (25, 14)])
+def test_torch_streaming_container(num_samples, P=7, atol=1.0e-12):
+    torch.manual_seed(0)
+    expected = [StreamingSampleContainer(num_batches=2, batch_size=3) for _ in num_samples]
+    containers = [TorchStreamingSampleContainer(num_batches=2, batch_size=3) for _ in num_samples]
+
+    for container, expected_container, T in zip(containers, expected, num_samples):
+        for _ in range(T):
+            gamma = torch.rand(P) < 0.5
+            sample = SimpleNamespace(gamma=gamma,
+                                     beta=torch.randn(P + 1).double() * torch.cat([gamma, torch.ones(1).bool()]),
+                                     add_prob=torch.rand(P).double(),
+                                     log_nu=torch.randn(()).double(),
+                                     h_alpha=torch.rand(()).double(),
+                                     h_beta=torch.rand(()).double(),
+                                     weight=torch.rand(()))
+            container(sample)
+            expected_container(namespace_to_numpy(sample))
+    # merging pools the batches of both chains in the same way
+    containers[0].merge(containers[1])
+    expected[0].merge(expected[1])
+    container, expected = containers[0], expected[0]
+
+    for name in ['pip', 'beta', 'beta_std', 'conditional_beta', 'conditional_beta_std', 'log_nu', 'log_nu_std',
+                 'nu', 'nu_std', 'h_alpha', 'h_beta', 'h', 'pip_mcse', 'beta_mcse']:
+        assert_close(getattr(container, name), getattr(expected, name), atol=atol)
+    assert_close(np.array(container.weight_moments), np.array(expected.weight_moments), atol=atol)
+    assert_close(np.sort(container.weight_reservoir), np.sort(expected.weight_reservoir), atol=0.0)
+
+
+@pytest.mark.parametrize("torch_container", [False, True])
+@pytest.mark.parametrize("num_samples", [(50, 0), (30, 20)])
+def test_container_coinclusion(num_samples, torch_container, P=9, atol=1.0e-12):
+    np.random.seed(0)
+    cls = TorchStreamingSampleContainer if torch_container else StreamingSampleContainer
+    containers = [cls(coinclusion=True) for _ in num_samples]
+    gammas, weights = [], []
+    for container, T in zip(containers, num_samples):
+        for _ in range(T):
+            gamma = np.random.binomial(1, np.linspace(0.1, 0.9, P)).astype(bool)
+            sample = SimpleNamespace(gamma=gamma, beta=np.random.randn(P) * gamma, add_prob=np.random.rand(P),
+                                     weight=np.random.rand())
+            if torch_container:
+                sample = SimpleNamespace(**{k: torch.as_tensor(v) for k, v in sample.__dict__.items()})
+            container(sample)
+            gammas.append(gamma)
+            weights.append(sample.weight)
+    container = containers[0]
+    container.merge(containers[1])
+
+    gamma, weights = np.stack(gammas).astype(np.float64), np.array(weights, dtype=np.float64)
+    expected = np.einsum("t,ti,tj->ij", weights, gamma, gamma) / weights.sum()
+    coinclusion = container.coinclusion
+    assert coinclusion.shape == (P, P)
+    assert_close(coinclusion.toarray(), expected, atol=atol)
+    assert StreamingSampleContainer().coinclusion is None
+
+
+def test_coinclusion_pruning(P=50, T=400, max_pairs=20):
+    class SmallBufferAccumulator(CoinclusionAccumulator):
+        buffer_size = 64
+
+    np.random.seed(1)
+    accumulator = SmallBufferAccumulator(P, max_pairs=max_pairs)
+    exact = SmallBufferAccumulator(P)
+    # the first covariates are included much more often than the others
+    probs = np.concatenate([np.full(4, 0.9), np.full(P - 4, 0.05)])
+    for _ in range(T):
+        active = np.flatnonzero(np.random.rand(P) < probs)
+        accumulator.update(active, 1.0)
+        exact.update(active, 1.0)
+
+    matrix, expected = accumulator.matrix(T), exact.matrix(T).toarray()
+    # memory is bounded and the pairs of the frequently included covariates are retained
+    assert accumulator._keys.shape[0] <= 2 * max_pairs
+    assert np.count_nonzero(np.triu(matrix.toarray())) <= max_pairs
+    assert accumulator.pruned_weight > 0.0
+    assert_close(matrix.toarray()[:4, :4], expected[:4, :4], atol=1.0e-12)
+    assert (matrix.toarray() <= expected + 1.0e-12).all()
+    with pytest.raises(ValueError):
+        CoinclusionAccumulator(P, max_pairs=0)
+
+
+def test_torch_streaming_container_bounded_state(P=4, T=500):
+    class SmallContainer(TorchStreamingSampleContainer):
+        max_block_size = 8
+        reservoir_size = 50
+
+    torch.manual_seed(1)
+    containers = [SmallContainer(coinclusion=True) for _ in range(2)]
+    gammas, weights, add_probs = [], [], []
+    for container in containers:
+        for _ in range(T):
+            gamma = torch.rand(P) < 0.5
+            sample = SimpleNamespace(gamma=gamma, beta=torch.randn(P).double() * gamma,
+                                     add_prob=torch.rand(P).double(), weight=torch.rand(()))
+            container(sample)
+            gammas.append(gamma.numpy())
+            weights.append(sample.weight.item())
+            add_probs.append(sample.add_prob.numpy())
+        # the weights are summarized by their moments and a fixed-size reservoir rather than stored
+        assert container._device_reservoir.shape == (50,)
+        assert container._device_block_weights.shape == (8,)
+    container = containers[0]
+    container.merge(containers[1])
+
+    weights = np.array(weights)
+    assert_close(container.pip, weights @ np.stack(add_probs) / weights.sum(), atol=1.0e-12)
+    gamma = np.stack(gammas).astype(np.float64)
+    assert_close(container.coinclusion.toarray(), np.einsum("t,ti,tj->ij", weights, gamma, gamma) / weights.sum(),
+                 atol=1.0e-12)
+    assert container.weight_reservoir.shape == (50,)
+    assert np.isin(container.weight_reservoir, weights).all()
+    mean, std, min_weight, max_weight = container.weight_moments
+    assert_close(np.array([mean, std, min_weight, max_weight]),
+                 np.array([weights.mean(), weights.std(), weights.min(), weights.max()]), atol=1.0e-12)
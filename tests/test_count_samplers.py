@@ -164,3 +164,27 @@ def test_negative_binomial(streaming, N=256, P=16, T=2000, T_burnin=500, psi0=0.
 
     if streaming:
         print(selector.summary)
+
+
+@pytest.mark.parametrize("likelihood", ["binomial", "negative_binomial"])
+def test_omega_rejections_during_forced_acceptance(likelihood, N=50, P=8, seed=0):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    if likelihood == "binomial":
+        TC = 20 * torch.ones(N, dtype=torch.int64)
+        Y = torch.distributions.Binomial(TC, logits=X[:, 0]).sample().double()
+        sampler = CountLikelihoodSampler(X, Y, TC=TC, S=1.0, verbose_constructor=False)
+        T_burnin = 100
+        T_forced = T_burnin // 2
+    else:
+        Y = torch.distributions.Poisson((X[:, 0] + 2.0).exp()).sample().double()
+        sampler = CountLikelihoodSampler(X, Y, psi0=torch.zeros(N).double(), S=1.0, verbose_constructor=False)
+        T_burnin = 400
+        T_forced = min(50, T_burnin // 4)
+
+    # proposals are applied during the first part of burn-in, so they are not counted as rejections
+    rejections = []
+    for _ in sampler.mcmc_chain(T=0, T_burnin=T_burnin, seed=seed):
+        rejections.append(sampler.profile.events.get('Polya-Gamma MH rejections', 0))
+    assert rejections[T_forced - 1] == 0
+    assert rejections[-1] > 0
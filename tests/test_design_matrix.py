@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+import torch
+from common import assert_close
+
+from millipede import CountLikelihoodSampler, NormalLikelihoodSampler
+from millipede.util import (
+    MemmapDesignMatrix,
+    SparseDesignMatrix,
+    tiled_column_norms_sq,
+    tiled_rmatmat,
+)
+
+
+def sparse_covariates(N, P, density=0.2):
+    return (torch.rand(N, P) < density).double() * torch.randn(N, P).double()
+
+
+def to_layout(X, layout, tmp_path):
+    if layout == "sparse":
+        return X.to_sparse()
+    elif layout == "sparse_csr":
+        return X.to_sparse_csr()
+    elif layout == "memmap":
+        np.save(str(tmp_path / "X.npy"), X.numpy())
+        return str(tmp_path / "X.npy")
+
+
+def assert_chains_agree(sampler, other_sampler, T, seed, atol):
+    def run(sampler):
+        return [(s.gamma.clone(), s.add_prob.clone(), s.beta.clone())
+                for _, s in sampler.mcmc_chain(T=T, T_burnin=0, seed=seed)]
+
+    for (gamma, add_prob, beta), (other_gamma, other_add_prob, other_beta) in \
+            zip(run(sampler), run(other_sampler)):
+        assert (gamma == other_gamma).all()
+        assert_close(other_add_prob, add_prob, atol=atol)
+        assert_close(other_beta, beta, atol=atol)
+
+
+@pytest.mark.parametrize("layout", ["sparse", "memmap"])
+@pytest.mark.parametrize("P_assumed", [0, 2])
+@pytest.mark.parametrize("include_intercept", [False, True])
+def test_design_matrix(layout, P_assumed, include_intercept, tmp_path, N=13, P=7):
+    X = sparse_covariates(N, P)
+    X_assumed = torch.randn(N, P_assumed).double() if P_assumed > 0 else None
+    if layout == "sparse":
+        design = SparseDesignMatrix(X.to_sparse(), X_assumed=X_assumed, include_intercept=include_intercept,
+                                    chunk_size=3)
+    else:
+        design = MemmapDesignMatrix(to_layout(X, layout, tmp_path), X_assumed=X_assumed,
+                                    include_intercept=include_intercept, chunk_size=5, column_cache_size=3)
+
+    Xb = X if X_assumed is None else torch.cat([X, X_assumed], dim=-1)
+    if include_intercept:
+        Xb = torch.cat([Xb, torch.ones(N, 1).double()], dim=-1)
+    assert design.shape == Xb.shape
+
+    v, V = torch.randn(N).double(), torch.randn(N, 3).double()
+    assert_close(design.rmatvec(v), Xb.t() @ v, atol=1.0e-12)
+    assert_close(design.rmatmat(V), Xb.t() @ V, atol=1.0e-12)
+    assert_close(design.column_norms_sq(v.abs()), (v.abs().unsqueeze(-1) * Xb.pow(2.0)).sum(0), atol=1.0e-12)
+    assert_close(design.gram(), Xb.t() @ Xb, atol=1.0e-12)
+
+    for _ in range(3):
+        indices = torch.randperm(Xb.size(-1))[:4]
+        assert_close(design[:, indices], Xb[:, indices])
+        assert_close(design[:, indices[0]], Xb[:, indices[0]])
+        rows = torch.randperm(N)[:5]
+        assert_close(design[rows, indices], Xb[rows][:, indices])
+        assert_close(design[2:9:3, indices[0]], Xb[2:9:3, indices[0]])
+        assert_close(design[3, indices], Xb[3, indices])
+
+    with pytest.raises(IndexError):
+        design[3]
+
+
+@pytest.mark.filterwarnings("ignore:Sparse CSR tensor support is in beta state")
+@pytest.mark.parametrize("layout", ["sparse_csr", "memmap"])
+@pytest.mark.parametrize("precompute_XX,XX_cache_size", [(False, None), (True, None), (False, 3)])
+@pytest.mark.parametrize("prior", ["isotropic", "gprior"])
+@pytest.mark.parametrize("P_assumed", [0, 2])
+def test_normal_design_matrix_sampler(layout, precompute_XX, XX_cache_size, prior, P_assumed, tmp_path,
+                                      N=40, P=12, T=40, seed=3):
+    torch.manual_seed(seed)
+    X = sparse_covariates(N, P)
+    X_assumed = torch.randn(N, P_assumed).double() if P_assumed > 0 else None
+    Y = X[:, 0] - X[:, 1] + 0.3 * torch.randn(N).double()
+
+    kwargs = dict(X_assumed=X_assumed, S=2.0, prior=prior, precompute_XX=precompute_XX,
+                  XX_cache_size=XX_cache_size, compute_betas=True, verbose_constructor=False)
+    assert_chains_agree(NormalLikelihoodSampler(X, Y, **kwargs),
+                        NormalLikelihoodSampler(to_layout(X, layout, tmp_path), Y, **kwargs),
+                        T=T, seed=seed, atol=1.0e-8)
+
+
+@pytest.mark.parametrize("layout", ["sparse", "memmap"])
+@pytest.mark.parametrize("likelihood", ["binomial", "negative binomial"])
+@pytest.mark.parametrize("P_assumed", [0, 2])
+def test_count_design_matrix_sampler(layout, likelihood, P_assumed, tmp_path, N=40, P=12, T=40, seed=4):
+    torch.manual_seed(seed)
+    X = sparse_covariates(N, P)
+    X_assumed = torch.randn(N, P_assumed).double() if P_assumed > 0 else None
+    TC = 10 * torch.ones(N).long() if likelihood == "binomial" else None
+    psi0 = 0.1 * torch.randn(N).double() if likelihood == "negative binomial" else None
+    if likelihood == "binomial":
+        Y = torch.distributions.Binomial(total_count=TC, logits=X[:, 0] - X[:, 1]).sample()
+    else:
+        Y = torch.distributions.Poisson((X[:, 0] - X[:, 1]).exp()).sample()
+
+    kwargs = dict(X_assumed=X_assumed, TC=TC, psi0=psi0, S=2.0, verbose_constructor=False)
+    assert_chains_agree(CountLikelihoodSampler(X, Y, **kwargs),
+                        CountLikelihoodSampler(to_layout(X, layout, tmp_path), Y, **kwargs),
+                        T=T, seed=seed, atol=1.0e-8)
+
+
+@pytest.mark.parametrize("num_threads", [1, 3])
+@pytest.mark.parametrize("tile_size", [1, 3, 100])
+def test_tiled_products(tile_size, num_threads, N=11, P=7):
+    X, V, w = torch.randn(N, P).double(), torch.randn(N, 3).double(), torch.rand(N).double()
+    assert_close(tiled_rmatmat(X, V, tile_size, num_threads=num_threads), X.t() @ V, atol=1.0e-12)
+    assert_close(tiled_rmatmat(X, V[:, 0], tile_size, num_threads=num_threads), X.t() @ V[:, 0], atol=1.0e-12)
+    assert_close(tiled_column_norms_sq(X, tile_size=tile_size, num_threads=num_threads), X.pow(2.0).sum(0),
+                 atol=1.0e-12)
+    assert_close(tiled_column_norms_sq(X, w, tile_size, num_threads=num_threads), w @ X.pow(2.0), atol=1.0e-12)
+
+
+@pytest.mark.parametrize("num_threads", [1, 4])
+@pytest.mark.parametrize("likelihood", ["binomial", "normal"])
+def test_sampler_tile_size(likelihood, num_threads, N=40, P=12, T=40, seed=5):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    if likelihood == "binomial":
+        TC = 10 * torch.ones(N).long()
+        Y = torch.distributions.Binomial(total_count=TC, logits=X[:, 0] - X[:, 1]).sample()
+        sampler_cls, kwargs = CountLikelihoodSampler, dict(TC=TC)
+    else:
+        Y = X[:, 0] - X[:, 1] + 0.3 * torch.randn(N).double()
+        sampler_cls, kwargs = NormalLikelihoodSampler, dict(compute_betas=True)
+
+    # the sharded/threaded computation should agree with the serial one up to floating point error
+    assert_chains_agree(sampler_cls(X, Y, S=2.0, tile_size=1024, verbose_constructor=False, **kwargs),
+                        sampler_cls(X, Y, S=2.0, tile_size=5, num_threads=num_threads,
+                                    verbose_constructor=False, **kwargs),
+                        T=T, seed=seed, atol=1.0e-10)
@@ -0,0 +1,82 @@
+import pytest
+import torch
+from common import assert_close
+
+from millipede import CountLikelihoodSampler, NormalLikelihoodSampler
+
+
+def random_gamma(P, num_active):
+    gamma = torch.zeros(P).bool()
+    gamma[torch.randperm(P)[:num_active]] = True
+    return gamma
+
+
+@pytest.mark.parametrize("precompute_XX,XX_cache_size", [(False, None), (True, None), (False, 3)])
+@pytest.mark.parametrize("prior", ["isotropic", "gprior"])
+@pytest.mark.parametrize("P_assumed", [0, 2])
+def test_normal_mixed_precision(precompute_XX, XX_cache_size, prior, P_assumed, N=200, P=15, seed=0):
+    torch.manual_seed(seed)
+    # round X to single precision so that the two samplers only differ in the precision of their arithmetic
+    X = torch.randn(N, P).float().double()
+    X_assumed = torch.randn(N, P_assumed).float().double() if P_assumed > 0 else None
+    Y = 10.0 + X[:, 0] - X[:, 1] + 0.1 * torch.randn(N).double()
+
+    kwargs = dict(X_assumed=X_assumed, S=2.0, prior=prior, precompute_XX=precompute_XX,
+                  XX_cache_size=XX_cache_size, compute_betas=True, verbose_constructor=False)
+    sampler = NormalLikelihoodSampler(X, Y, **kwargs)
+    mixed_sampler = NormalLikelihoodSampler(X, Y, mixed_precision=True, **kwargs)
+    assert mixed_sampler.X.dtype == torch.float32 and mixed_sampler.Z.dtype == torch.float64
+
+    for num_active in range(4):
+        gamma = random_gamma(P, num_active)
+        log_odds = []
+        for s in [sampler, mixed_sampler]:
+            sample = s.initialize_sample()
+            sample.gamma = gamma.clone()
+            sample._active = torch.nonzero(gamma).squeeze(-1)
+            if s.Pa > 0:
+                sample._activeb = torch.cat([sample._active, s.assumed_covariates])
+            sample._L_active = None
+            log_odds.append(s._compute_add_prob(sample))
+        assert log_odds[1].dtype == torch.float64
+        assert_close(log_odds[1], log_odds[0], atol=1.0e-3, rtol=1.0e-4)
+
+    for _, sample in mixed_sampler.mcmc_chain(T=20, T_burnin=5, seed=seed):
+        assert sample.beta.dtype == torch.float64
+    assert sample.gamma[0].item() and sample.gamma[1].item()
+
+
+@pytest.mark.parametrize("likelihood", ["binomial", "negative binomial"])
+@pytest.mark.parametrize("P_assumed", [0, 2])
+def test_count_mixed_precision(likelihood, P_assumed, N=200, P=15, seed=1):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).float().double()
+    X_assumed = torch.randn(N, P_assumed).float().double() if P_assumed > 0 else None
+    TC = 10 * torch.ones(N).long() if likelihood == "binomial" else None
+    psi0 = 0.1 * torch.randn(N).double() if likelihood == "negative binomial" else None
+    if likelihood == "binomial":
+        Y = torch.distributions.Binomial(total_count=TC, logits=X[:, 0] - X[:, 1]).sample()
+    else:
+        Y = torch.distributions.Poisson((X[:, 0] - X[:, 1]).exp()).sample()
+
+    kwargs = dict(X_assumed=X_assumed, TC=TC, psi0=psi0, S=2.0, verbose_constructor=False)
+    sampler = CountLikelihoodSampler(X, Y, **kwargs)
+    mixed_sampler = CountLikelihoodSampler(X, Y, mixed_precision=True, **kwargs)
+    assert mixed_sampler.Xb.dtype == torch.float32
+
+    for num_active in range(4):
+        gamma = random_gamma(P, num_active)
+        log_odds = []
+        for s in [sampler, mixed_sampler]:
+            s.t, s.T_burnin = 0, 0
+            sample = s.initialize_sample(seed=seed)
+            sample.gamma = gamma.clone()
+            sample._active = torch.nonzero(gamma).squeeze(-1)
+            sample._activeb = torch.cat([sample._active, s.assumed_covariates])
+            sample = s.sample_beta(sample)
+            log_odds.append(s._compute_add_prob(sample))
+        assert log_odds[1].dtype == torch.float64
+        assert_close(log_odds[1], log_odds[0], atol=1.0e-3, rtol=1.0e-4)
+
+    for _, sample in mixed_sampler.mcmc_chain(T=20, T_burnin=5, seed=seed):
+        assert sample.beta.dtype == torch.float64
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+import torch
+from common import assert_close
+
+from millipede import (
+    MultiChainNormalLikelihoodSampler,
+    NormalLikelihoodSampler,
+    NormalLikelihoodVariableSelector,
+)
+
+
+@pytest.mark.parametrize("precompute_XX,XX_cache_size", [(False, None), (True, None), (False, 3)])
+@pytest.mark.parametrize("prior", ["isotropic", "gprior"])
+@pytest.mark.parametrize("include_intercept", [False, True])
+@pytest.mark.parametrize("P_assumed", [0, 2])
+def test_multichain_compute_add_prob(precompute_XX, XX_cache_size, prior, include_intercept, P_assumed,
+                                     N=23, P=9, C=5, seed=0):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    X_assumed = torch.randn(N, P_assumed).double() if P_assumed > 0 else None
+    Y = X[:, 0] - X[:, 1] + 0.3 * torch.randn(N).double()
+    S = (torch.randn(P) / 10).exp().double() / P if prior == "isotropic" else 2.0
+
+    kwargs = dict(X_assumed=X_assumed, S=S, prior=prior, include_intercept=include_intercept,
+                  precompute_XX=precompute_XX, XX_cache_size=XX_cache_size, compute_betas=True,
+                  verbose_constructor=False)
+    sampler = NormalLikelihoodSampler(X, Y, **kwargs)
+    multi_sampler = MultiChainNormalLikelihoodSampler(X, Y, num_chains=C, **kwargs)
+
+    # chains with 0, 1, 2, 3 and 4 active covariates
+    gamma = torch.zeros(C, P).bool()
+    for c in range(C):
+        gamma[c, torch.randperm(P)[:c]] = True
+
+    multi_sample = SimpleNamespace(gamma=gamma, _log_h_ratio=multi_sampler.log_h_ratio)
+    log_odds = multi_sampler._compute_add_prob(multi_sample)
+    assert log_odds.shape == (C, P)
+
+    for c in range(C):
+        sample = SimpleNamespace(gamma=gamma[c], _active=torch.nonzero(gamma[c]).squeeze(-1),
+                                 _log_h_ratio=sampler.log_h_ratio)
+        if sampler.Pa > 0:
+            sample._activeb = torch.cat([sample._active, sampler.assumed_covariates])
+        assert_close(log_odds[c], sampler._compute_add_prob(sample), atol=1.0e-8)
+        assert ((multi_sample.beta[c] != 0.0) == (sample.beta != 0.0)).all()
+
+
+@pytest.mark.parametrize("S", [1.0, (1.0, 9.0)])
+def test_multichain_sampler(S, N=50, P=10, C=3, T=1000, T_burnin=200, seed=1):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    Y = X[:, 0] + 0.05 * torch.randn(N).double()
+
+    sampler = MultiChainNormalLikelihoodSampler(X, Y, num_chains=C, S=S, verbose_constructor=False)
+    gammas, weights = [], []
+    for burned, sample in sampler.mcmc_chain(T=T, T_burnin=T_burnin, seed=seed):
+        if burned:
+            gammas.append(sample.gamma.clone().double())
+            weights.append(sample.weight.clone())
+
+    gammas, weights = torch.stack(gammas), torch.stack(weights)
+    assert gammas.shape == (T, C, P) and weights.shape == (T, C)
+
+    pip = (weights.unsqueeze(-1) * gammas).sum(0) / weights.sum(0).unsqueeze(-1)
+    assert (pip[:, 0] > 0.99).all()
+    assert (pip[:, 1:] < 0.2).all()
+
+
+def test_parallel_chains_selector(N=50, P=8, T=300, T_burnin=100, seed=2):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    Y = X[:, 0] + 0.05 * torch.randn(N).double()
+    dataframe = pd.DataFrame(torch.cat([X, Y.unsqueeze(-1)], dim=-1).numpy(),
+                             columns=['x{}'.format(p) for p in range(P)] + ['y'])
+
+    def run(streaming):
+        selector = NormalLikelihoodVariableSelector(dataframe, 'y', S=1.0, precision='double')
+        selector.run(T=T, T_burnin=T_burnin, verbosity=None, streaming=streaming, seed=seed,
+                     num_chains=2, num_workers=2)
+        return selector
+
+    # the chains are seeded deterministically so both runs should agree up to floating point error
+    selector1, selector2 = run(streaming=True), run(streaming=False)
+    assert selector1.weights.shape == (2 * T,) and selector2.weights.shape == (2 * T,)
+    assert selector1.stats['Number of chains'] == 2
+    assert selector1.stats['Cholesky jitter retries'] == 0
+    assert selector1.sampler.profile.phase_calls['compute_add_prob'] == 2 * (T + T_burnin + 1)
+    assert selector1.sampler.profile.active_set_count == 2 * (T + T_burnin)
+    assert selector1.pip['x0'] > 0.99
+    assert (selector1.pip.values[1:] < 0.2).all()
+    assert_close(selector1.pip.values, selector2.pip.values, atol=1.0e-10)
+    assert_close(selector1.beta.values, selector2.beta.values, atol=1.0e-10)
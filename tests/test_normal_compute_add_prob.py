@@ -58,9 +58,9 @@ def check_gammas(sampler, included_covariates, P, compute_log_factor_ratio):
 
 @pytest.mark.parametrize("P", [4, 7])
 @pytest.mark.parametrize("P_assumed", [0, 1, 2])
-@pytest.mark.parametrize("precompute_XX", [False, True])
+@pytest.mark.parametrize("precompute_XX,XX_cache_size", [(False, None), (True, None), (False, 3), (False, 20)])
 @pytest.mark.parametrize("include_intercept", [False, True])
-def test_isotropic_compute_add_log_prob(P, P_assumed, precompute_XX, include_intercept,
+def test_isotropic_compute_add_log_prob(P, P_assumed, precompute_XX, XX_cache_size, include_intercept,
                                         N=11, tau=0.47, tau_intercept=0.11):
     X = torch.randn(N, P).double()
     X_assumed = torch.randn(N, P_assumed).double() if P_assumed > 0 else None
@@ -70,7 +70,8 @@ def test_isotropic_compute_add_log_prob(P, P_assumed, precompute_XX, include_int
     S = 1.0 if include_intercept else (torch.randn(P) / 100).exp().double() / P
     sampler = NormalLikelihoodSampler(X, Y, X_assumed=X_assumed, S=S, c=0.0,
                                       tau=tau, tau_intercept=tau_intercept, include_intercept=include_intercept,
-                                      precompute_XX=precompute_XX, prior="isotropic")
+                                      precompute_XX=precompute_XX, XX_cache_size=XX_cache_size,
+                                      prior="isotropic")
 
     included_covariates = []
     if P_assumed > 0:
@@ -107,16 +108,17 @@ def test_isotropic_compute_add_log_prob(P, P_assumed, precompute_XX, include_int
 
 @pytest.mark.parametrize("P", [4, 7])
 @pytest.mark.parametrize("P_assumed", [0, 1, 2])
-@pytest.mark.parametrize("precompute_XX", [False, True])
+@pytest.mark.parametrize("precompute_XX,XX_cache_size", [(False, None), (True, None), (False, 3), (False, 20)])
 @pytest.mark.parametrize("include_intercept", [True, False])
-def test_gprior_compute_add_log_prob(P, P_assumed, precompute_XX, include_intercept, N=11):
+def test_gprior_compute_add_log_prob(P, P_assumed, precompute_XX, XX_cache_size, include_intercept, N=11):
     X = torch.randn(N, P).double()
     X_assumed = torch.randn(N, P_assumed).double() if P_assumed > 0 else None
     Y = X[:, 0] + 0.2 * torch.randn(N).double()
 
     sampler = NormalLikelihoodSampler(X, Y, X_assumed=X_assumed, S=1.0,
                                       tau=0.0, c=0.73, include_intercept=include_intercept,
-                                      precompute_XX=precompute_XX, prior="gprior")
+                                      precompute_XX=precompute_XX, XX_cache_size=XX_cache_size,
+                                      prior="gprior")
 
     included_covariates = []
     if P_assumed > 0:
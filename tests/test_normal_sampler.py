@@ -114,3 +114,125 @@ def test_linear_correlated(device, prior, precompute_XX, include_intercept, vari
     assert_close(selector.conditional_beta.values[2:P], np.zeros(P - 2), atol=0.30)
 
     print("[selector.stats]\n", selector.stats)
+
+
+@pytest.mark.parametrize("prior", ["gprior", "isotropic"])
+@pytest.mark.parametrize("include_intercept", [True, False])
+@pytest.mark.parametrize("assumed_columns", [[], ['x2']])
+def test_sufficient_statistics(prior, include_intercept, assumed_columns, N=50, P=6, T=300, T_burnin=100, seed=2):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    Y = X[:, 0] - 0.5 * X[:, 1] + 0.2 * torch.randn(N).double() + 1.3
+
+    columns = ['x{}'.format(p) for p in range(P)]
+    dataframe = pandas.DataFrame(X.numpy(), columns=columns)
+    dataframe['y'] = Y.numpy()
+
+    selector = NormalLikelihoodVariableSelector(dataframe, 'y', assumed_columns=assumed_columns, S=1.0,
+                                                prior=prior, include_intercept=include_intercept,
+                                                precompute_XX=True)
+    selector.run(T=T, T_burnin=T_burnin, verbosity=None, seed=seed)
+
+    # put the intercept first to check that the assumed covariates are matched by name
+    if include_intercept:
+        X = torch.cat([X.new_ones(N, 1), X], dim=-1)
+        columns = ['Intercept'] + columns
+    XX = pandas.DataFrame((X.t() @ X).numpy(), index=columns, columns=columns)
+    XY = pandas.Series((X.t() @ Y).numpy(), index=columns)
+
+    selector_ss = NormalLikelihoodVariableSelector.from_sufficient_statistics(
+        XX, XY, Y.pow(2.0).sum().item(), N, assumed_columns=assumed_columns, S=1.0,
+        prior=prior, include_intercept=include_intercept)
+    selector_ss.run(T=T, T_burnin=T_burnin, verbosity=None, seed=seed)
+
+    assert selector_ss.X_columns == selector.X_columns
+    assert_close(selector_ss.summary.values, selector.summary.values, atol=1.0e-6, equal_nan=True)
+
+
+def test_selector_mcse_stopping(N=50, P=5, T=5000, T_burnin=100, seed=0):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    Y = X[:, 0] + 0.2 * torch.randn(N).double()
+    dataframe = pandas.DataFrame(X.numpy(), columns=['x{}'.format(p) for p in range(P)])
+    dataframe['y'] = Y.numpy()
+
+    selector = NormalLikelihoodVariableSelector(dataframe, 'y', S=1.0)
+    selector.run(T=T, T_burnin=T_burnin, seed=seed, verbosity=None, mcse_tolerance=0.01)
+    T_stop = selector.stats['Number of retained samples']
+    assert T_stop < T and T_stop % selector.mcse_check_frequency == 0
+    assert float(selector.stats['Max PIP MCSE']) < 0.01
+    assert selector.pip['x0'] > 0.9
+
+    with pytest.raises(ValueError):
+        selector.run(T=T, T_burnin=T_burnin, streaming=False, mcse_tolerance=0.01)
+    with pytest.raises(ValueError):
+        selector.run(T=T, T_burnin=T_burnin, num_chains=2, mcse_tolerance=0.01)
+
+
+@pytest.mark.parametrize("num_chains", [1, 2])
+def test_selector_coinclusion(num_chains, N=50, P=8, T=300, T_burnin=100, seed=2):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    Y = X[:, 0] + X[:, 1] + 0.5 * torch.randn(N).double()
+    dataframe = pandas.DataFrame(X.numpy(), columns=['x{}'.format(p) for p in range(P)])
+    dataframe['y'] = Y.numpy()
+
+    def run(streaming):
+        selector = NormalLikelihoodVariableSelector(dataframe, 'y', S=1.0, precision='double')
+        selector.run(T=T, T_burnin=T_burnin, verbosity=None, streaming=streaming, seed=seed,
+                     num_chains=num_chains, coinclusion=streaming)
+        return selector
+
+    # the co-inclusion probabilities accumulated online agree with those computed from the stored samples
+    selector, expected = run(streaming=True), run(streaming=False)
+    gamma, weights = expected.samples.gamma.astype(np.float64), expected.weights / expected.weights.sum()
+    assert selector.coinclusion.shape == (P, P) and expected.coinclusion is None
+    assert_close(selector.coinclusion.toarray(), np.einsum("t,ti,tj->ij", weights, gamma, gamma), atol=1.0e-10)
+    assert_close(selector.coinclusion.diagonal(), weights @ gamma, atol=1.0e-10)
+
+    with pytest.raises(ValueError):
+        expected.run(T=T, T_burnin=T_burnin, streaming=False, coinclusion=True)
+
+
+@pytest.mark.parametrize("prior", ["gprior", "isotropic"])
+@pytest.mark.parametrize("P_assumed", [0, 2])
+@pytest.mark.parametrize("S", [2.0, (1.0, 5.0)])
+def test_compiled_probs(prior, P_assumed, S, N=60, P=12, T=200, seed=3):
+    torch.manual_seed(seed)
+    X = torch.randn(N, P).double()
+    X_assumed = torch.randn(N, P_assumed).double() if P_assumed > 0 else None
+    Y = X[:, 0] - X[:, 1] + 0.3 * torch.randn(N).double()
+
+    # the 'eager' backend traces the kernel with torch.compile without the cost of generating code
+    kwargs = dict(X_assumed=X_assumed, S=S, prior=prior, include_intercept=P_assumed > 0, verbose_constructor=False)
+    sampler = NormalLikelihoodSampler(X, Y, **kwargs)
+    compiled_sampler = NormalLikelihoodSampler(X, Y, compile_backend='eager', **kwargs)
+    recompile_limits = {name: getattr(torch._dynamo.config, name, None)
+                        for name in ['recompile_limit', 'cache_size_limit']}
+
+    for num_active in range(6):
+        gamma = torch.zeros(P).bool()
+        gamma[torch.randperm(P)[:num_active]] = True
+        i_probs = []
+        for s in [sampler, compiled_sampler]:
+            s.t, s.T_burnin = 0, 0
+            sample = s.initialize_sample(seed=seed)
+            sample.gamma = gamma.clone()
+            sample._active = torch.nonzero(gamma).squeeze(-1)
+            if s.Pa > 0:
+                sample._activeb = torch.cat([sample._active, s.assumed_covariates])
+            sample._L_active = None
+            i_probs.append(s._compute_probs(sample)._i_prob)
+        assert_close(i_probs[1], i_probs[0], atol=1.0e-10)
+
+    # with the same seed the compiled and eager samplers make the same moves
+    gammas = [sample.gamma.clone() for _, sample in sampler.mcmc_chain(T=T, T_burnin=T // 2, seed=seed)]
+    pip, weight = 0.0, 0.0
+    for gamma, (burned, sample) in zip(gammas, compiled_sampler.mcmc_chain(T=T, T_burnin=T // 2, seed=seed)):
+        assert (sample.gamma == gamma).all()
+        if burned:
+            pip, weight = pip + sample.weight * sample.add_prob, weight + sample.weight
+    pip = pip / weight
+    assert (pip[:2] > 0.9).all() and (pip[2:] < 0.5).all()
+    # the recompilation limit is only raised while kernels are compiled
+    assert recompile_limits == {name: getattr(torch._dynamo.config, name, None) for name in recompile_limits}
@@ -1,9 +1,30 @@
 import torch
 
-from millipede.util import safe_cholesky
+from millipede.util import SamplerProfile, safe_cholesky
 
 
 def test_safe_cholesky_smoke_test(D=10):
     X = torch.randn(D, 1)
     XX = X.t() @ X - 3.0e-5 * torch.eye(D)
     safe_cholesky(XX)
+
+
+def test_safe_cholesky_profile(D=10):
+    X = torch.randn(D, 1).double()
+    profile = SamplerProfile()
+    safe_cholesky(X @ X.t() + torch.eye(D).double(), profile=profile)
+    assert profile.events['Cholesky jitter retries'] == 0
+    safe_cholesky(X @ X.t() - 1.0e-7 * torch.eye(D).double(), profile=profile)
+    assert profile.events['Cholesky jitter retries'] > 0
+    assert profile.phase_calls['safe_cholesky'] == 2 and profile.phase_times['safe_cholesky'] > 0.0
+
+    other = SamplerProfile()
+    with other.phase('safe_cholesky'):
+        pass
+    for size in [3, 1, 2]:
+        other.active_set_size(size)
+    profile.active_set_size(4)
+    profile.merge(other)
+    assert profile.phase_calls['safe_cholesky'] == 3
+    assert profile.active_set_count == 4 and profile.mean_active_set_size == 2.5
+    assert profile.active_set_min == 1 and profile.active_set_max == 4